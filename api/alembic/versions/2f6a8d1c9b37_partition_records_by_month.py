@@ -0,0 +1,108 @@
+"""partition records by month
+
+Revision ID: 2f6a8d1c9b37
+Revises: 53e1dd4987c4
+Create Date: 2026-10-17 14:05:52.418266
+
+"""
+import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2f6a8d1c9b37'
+down_revision: Union[str, None] = '53e1dd4987c4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# 開始・終了の時/分の文字列から求める（53e1dd4987c4 と同じ式）
+START_MINUTE_OF_DAY_SQL = """("startTime"::integer * 60 + coalesce(nullif("startMinute", ''), '0')::integer)"""
+END_MINUTE_OF_DAY_SQL = """("endTime"::integer * 60 + coalesce(nullif("endMinute", ''), '0')::integer)"""
+TIME_IS_VALID_SQL = """("startTime" ~ '^[0-9]{1,2}$' AND coalesce("startMinute", '') ~ '^[0-9]{0,2}$' AND "endTime" ~ '^[0-9]{1,2}$' AND coalesce("endMinute", '') ~ '^[0-9]{0,2}$')"""
+DURATION_MINUTES_SQL = f"CASE WHEN {TIME_IS_VALID_SQL} THEN ({END_MINUTE_OF_DAY_SQL} - {START_MINUTE_OF_DAY_SQL} + 1440) % 1440 END"
+START_AT_SQL = f"CASE WHEN {TIME_IS_VALID_SQL} THEN date::date + make_interval(mins => {START_MINUTE_OF_DAY_SQL}) END"
+END_AT_SQL = f"CASE WHEN {TIME_IS_VALID_SQL} THEN date::date + make_interval(mins => {START_MINUTE_OF_DAY_SQL} + ({END_MINUTE_OF_DAY_SQL} - {START_MINUTE_OF_DAY_SQL} + 1440) % 1440) END"
+
+# 生成列を除いた、行をコピーするときの列
+STORED_COLUMNS = '''id, description, date, "startTime", "startMinute", "endTime", "endMinute", "userId"'''
+
+# 既存データのある月と、今月からこの月数先までのパーティションを作る（それ以降は manage.py create-partitions で作る）
+MONTHS_AHEAD = 12
+
+
+def _add_months(month: datetime.date, months: int) -> datetime.date:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def _create_indexes() -> None:
+    op.create_index('ix_records_userId_date', 'records', ['userId', 'date'], unique=False)
+    op.create_index('ix_records_date', 'records', ['date'], unique=False)
+    op.create_index('ix_records_description', 'records', ['description'], unique=False)
+    op.create_index('ix_records_description_trgm', 'records', ['description'], unique=False, postgresql_using='gin', postgresql_ops={'description': 'gin_trgm_ops'})
+    op.execute("CREATE INDEX ix_records_practice_period ON records USING gist (tsrange(start_at, end_at, '[]'))")
+
+
+def _create_records_table(partitioned: bool) -> None:
+    op.create_table('records',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('records_id_seq'::regclass)"), nullable=False),
+    sa.Column('description', sa.String(), nullable=True),
+    sa.Column('date', sa.DateTime(), nullable=not partitioned),
+    sa.Column('startTime', sa.String(), nullable=True),
+    sa.Column('startMinute', sa.String(), nullable=True),
+    sa.Column('endTime', sa.String(), nullable=True),
+    sa.Column('endMinute', sa.String(), nullable=True),
+    sa.Column('userId', sa.String(), nullable=True),
+    sa.Column('start_at', sa.DateTime(), sa.Computed(START_AT_SQL, persisted=True), nullable=True),
+    sa.Column('end_at', sa.DateTime(), sa.Computed(END_AT_SQL, persisted=True), nullable=True),
+    sa.Column('duration_minutes', sa.Integer(), sa.Computed(DURATION_MINUTES_SQL, persisted=True), nullable=True),
+    sa.PrimaryKeyConstraint(*(['id', 'date'] if partitioned else ['id']), name='records_pkey'),
+    **({'postgresql_partition_by': 'RANGE (date)'} if partitioned else {})
+    )
+
+
+def _replace_records_table(partitioned: bool) -> None:
+    # 旧テーブルを退避して新しいテーブルを作り、行をコピーしてから旧テーブルを削除する
+    # id のシーケンスは旧テーブルと一緒に削除されないように、一旦所有者を外して新しいテーブルに付け替える
+    op.execute("ALTER SEQUENCE records_id_seq OWNED BY NONE")
+    op.rename_table('records', 'records_old')
+    op.execute("ALTER INDEX records_pkey RENAME TO records_old_pkey")
+
+    _create_records_table(partitioned)
+    if partitioned:
+        current = datetime.date.today().replace(day=1)
+        months = {_add_months(current, offset) for offset in range(MONTHS_AHEAD + 1)}
+        months.update(month.date() for month in op.get_bind().execute(sa.text("SELECT DISTINCT date_trunc('month', date) FROM records_old")).scalars())
+        for month in sorted(months):
+            op.execute(
+                f"CREATE TABLE records_y{month.year:04d}m{month.month:02d} PARTITION OF records "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+            )
+        op.execute("CREATE TABLE records_default PARTITION OF records DEFAULT")
+
+    op.execute(f"INSERT INTO records ({STORED_COLUMNS}) SELECT {STORED_COLUMNS} FROM records_old")
+    op.drop_table('records_old')
+    op.execute("ALTER SEQUENCE records_id_seq OWNED BY records.id")
+
+    # パーティション化されたテーブルに作ったインデックスは、各パーティションにも作られる
+    _create_indexes()
+    op.execute("ANALYZE records")
+
+
+def upgrade() -> None:
+    # パーティションキー（date）は主キーに含まれるため NULL にできない
+    null_dates = op.get_bind().execute(sa.text("SELECT count(*) FROM records WHERE date IS NULL")).scalar_one()
+    if null_dates:
+        raise RuntimeError(f"records has {null_dates} row(s) without a date; set their date before partitioning")
+
+    # パーティション化されたテーブルは id だけの一意制約を持てないため、practice_details からの外部キーは外す
+    op.drop_constraint('practice_details_recordId_fkey', 'practice_details', type_='foreignkey')
+    _replace_records_table(partitioned=True)
+
+
+def downgrade() -> None:
+    _replace_records_table(partitioned=False)
+    op.create_foreign_key('practice_details_recordId_fkey', 'practice_details', 'records', ['recordId'], ['id'])
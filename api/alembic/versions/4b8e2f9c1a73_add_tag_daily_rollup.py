@@ -0,0 +1,46 @@
+"""add tag daily rollup
+
+Revision ID: 4b8e2f9c1a73
+Revises: d17e76aedd8b
+Create Date: 2026-10-16 21:48:37.120943
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4b8e2f9c1a73'
+down_revision: Union[str, None] = 'd17e76aedd8b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('tag_daily_rollup',
+    sa.Column('userId', sa.String(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('content', sa.String(), nullable=False),
+    sa.Column('tag_id', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['tag_id'], ['tags.id'], ),
+    sa.PrimaryKeyConstraint('userId', 'day', 'content', 'tag_id')
+    )
+    op.create_index('ix_tag_daily_rollup_day', 'tag_daily_rollup', ['day'], unique=False)
+
+    # 既存データから集計を作成
+    op.execute("""
+        INSERT INTO tag_daily_rollup ("userId", day, content, tag_id, count)
+        SELECT coalesce(r."userId", ''), r.date::date, pd.content, pta.tag_id, count(*)
+        FROM records r
+        JOIN practice_details pd ON pd."recordId" = r.id
+        JOIN practice_tag_association pta ON pta.practice_detail_id = pd.id
+        GROUP BY 1, 2, 3, 4
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tag_daily_rollup_day', table_name='tag_daily_rollup')
+    op.drop_table('tag_daily_rollup')
@@ -0,0 +1,45 @@
+"""add practice time columns
+
+Revision ID: 53e1dd4987c4
+Revises: 9a4f6c2e8d15
+Create Date: 2026-10-17 09:41:26.305118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '53e1dd4987c4'
+down_revision: Union[str, None] = '9a4f6c2e8d15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# 開始・終了の時/分の文字列から求める（数字でない値の場合はNULL、終了が開始より前なら日付をまたいだものとみなす）
+START_MINUTE_OF_DAY_SQL = """("startTime"::integer * 60 + coalesce(nullif("startMinute", ''), '0')::integer)"""
+END_MINUTE_OF_DAY_SQL = """("endTime"::integer * 60 + coalesce(nullif("endMinute", ''), '0')::integer)"""
+TIME_IS_VALID_SQL = """("startTime" ~ '^[0-9]{1,2}$' AND coalesce("startMinute", '') ~ '^[0-9]{0,2}$' AND "endTime" ~ '^[0-9]{1,2}$' AND coalesce("endMinute", '') ~ '^[0-9]{0,2}$')"""
+DURATION_MINUTES_SQL = f"CASE WHEN {TIME_IS_VALID_SQL} THEN ({END_MINUTE_OF_DAY_SQL} - {START_MINUTE_OF_DAY_SQL} + 1440) % 1440 END"
+START_AT_SQL = f"CASE WHEN {TIME_IS_VALID_SQL} THEN date::date + make_interval(mins => {START_MINUTE_OF_DAY_SQL}) END"
+END_AT_SQL = f"CASE WHEN {TIME_IS_VALID_SQL} THEN date::date + make_interval(mins => {START_MINUTE_OF_DAY_SQL} + ({END_MINUTE_OF_DAY_SQL} - {START_MINUTE_OF_DAY_SQL} + 1440) % 1440) END"
+
+
+def upgrade() -> None:
+    # 生成列の追加で既存の行も書き換えられる（追加時に既存の文字列から計算される）
+    op.add_column('records', sa.Column('start_at', sa.DateTime(), sa.Computed(START_AT_SQL, persisted=True), nullable=True))
+    op.add_column('records', sa.Column('end_at', sa.DateTime(), sa.Computed(END_AT_SQL, persisted=True), nullable=True))
+    op.add_column('records', sa.Column('duration_minutes', sa.Integer(), sa.Computed(DURATION_MINUTES_SQL, persisted=True), nullable=True))
+
+    # 練習時間帯の重なり（&&）による絞り込み用
+    with op.get_context().autocommit_block():
+        op.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_records_practice_period ON records USING gist (tsrange(start_at, end_at, '[]'))")
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_records_practice_period', table_name='records', postgresql_concurrently=True, if_exists=True)
+    op.drop_column('records', 'duration_minutes')
+    op.drop_column('records', 'end_at')
+    op.drop_column('records', 'start_at')
@@ -0,0 +1,71 @@
+"""add suggest usage tables
+
+Revision ID: 6e2a9d4c7b18
+Revises: f1b7c3e58a24
+Create Date: 2026-10-18 15:06:51.248037
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6e2a9d4c7b18'
+down_revision: Union[str, None] = 'f1b7c3e58a24'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('user_tag_usage',
+    sa.Column('userId', sa.String(), nullable=False),
+    sa.Column('tag_id', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['tag_id'], ['tags.id'], ),
+    sa.PrimaryKeyConstraint('userId', 'tag_id')
+    )
+    op.create_index('ix_user_tag_usage_tag_id', 'user_tag_usage', ['tag_id'], unique=False)
+
+    op.create_table('user_content_usage',
+    sa.Column('userId', sa.String(), nullable=False),
+    sa.Column('content', sa.String(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('userId', 'content')
+    )
+    op.create_index('ix_user_content_usage_userId_content_pattern', 'user_content_usage', ['userId', 'content'], unique=False,
+                    postgresql_ops={'content': 'text_pattern_ops'}, postgresql_include=['count'])
+
+    # 既存データから使用回数を作成
+    op.execute("""
+        INSERT INTO user_tag_usage ("userId", tag_id, count)
+        SELECT coalesce(r."userId", ''), pta.tag_id, count(*)
+        FROM records r
+        JOIN practice_details pd ON pd."recordId" = r.id
+        JOIN practice_tag_association pta ON pta.practice_detail_id = pd.id
+        GROUP BY 1, 2
+    """)
+    op.execute("""
+        INSERT INTO user_content_usage ("userId", content, count)
+        SELECT coalesce(r."userId", ''), pd.content, count(*)
+        FROM records r
+        JOIN practice_details pd ON pd."recordId" = r.id
+        WHERE pd.content IS NOT NULL
+        GROUP BY 1, 2
+    """)
+
+    # タグ名の前方一致用（書き込みを止めないように CONCURRENTLY で作成する）
+    with op.get_context().autocommit_block():
+        op.create_index('ix_tags_name_pattern', 'tags', ['name'], unique=False, postgresql_ops={'name': 'text_pattern_ops'},
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_tags_name_pattern', table_name='tags', postgresql_concurrently=True, if_exists=True)
+
+    op.drop_index('ix_user_content_usage_userId_content_pattern', table_name='user_content_usage')
+    op.drop_table('user_content_usage')
+    op.drop_index('ix_user_tag_usage_tag_id', table_name='user_tag_usage')
+    op.drop_table('user_tag_usage')
@@ -0,0 +1,45 @@
+"""add practice detail tag ids
+
+Revision ID: 8d3b5e7a1f42
+Revises: 2f6a8d1c9b37
+Create Date: 2026-10-17 18:32:07.915340
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d3b5e7a1f42'
+down_revision: Union[str, None] = '2f6a8d1c9b37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 定数の既定値なので、列の追加で既存の行は書き換えられない
+    op.add_column('practice_details', sa.Column('tag_ids', postgresql.ARRAY(sa.Integer()), server_default=sa.text("'{}'"), nullable=False))
+
+    # 既存の関連付けから埋める（タグのない詳細は既定値の空配列のまま）
+    op.execute("""
+        UPDATE practice_details pd SET tag_ids = a.tag_ids
+        FROM (
+            SELECT practice_detail_id, array_agg(tag_id ORDER BY tag_id) AS tag_ids
+            FROM practice_tag_association
+            GROUP BY practice_detail_id
+        ) a
+        WHERE a.practice_detail_id = pd.id
+    """)
+
+    # タグでの絞り込み（@> / &&）用
+    with op.get_context().autocommit_block():
+        op.create_index('ix_practice_details_tag_ids', 'practice_details', ['tag_ids'], unique=False, postgresql_using='gin', postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_practice_details_tag_ids', table_name='practice_details', postgresql_concurrently=True, if_exists=True)
+    op.drop_column('practice_details', 'tag_ids')
@@ -0,0 +1,34 @@
+"""add trigram search indexes
+
+Revision ID: 9a4f6c2e8d15
+Revises: 4b8e2f9c1a73
+Create Date: 2026-10-16 23:12:40.531877
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a4f6c2e8d15'
+down_revision: Union[str, None] = '4b8e2f9c1a73'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+    # 先頭ワイルドカードの LIKE は B-tree では使えないため、トライグラムの GIN インデックスを作る
+    with op.get_context().autocommit_block():
+        op.create_index('ix_records_description_trgm', 'records', ['description'], unique=False, postgresql_using='gin', postgresql_ops={'description': 'gin_trgm_ops'}, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_practice_details_content_trgm', 'practice_details', ['content'], unique=False, postgresql_using='gin', postgresql_ops={'content': 'gin_trgm_ops'}, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_practice_details_content_trgm', table_name='practice_details', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_records_description_trgm', table_name='records', postgresql_concurrently=True, if_exists=True)
+    # pg_trgm は他で使われている可能性があるため拡張は残す
@@ -0,0 +1,64 @@
+"""add user analysis covering indexes
+
+Revision ID: c4e9a7d2b610
+Revises: 8d3b5e7a1f42
+Create Date: 2026-10-17 21:14:36.502871
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e9a7d2b610'
+down_revision: Union[str, None] = '8d3b5e7a1f42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _partitions(table: str) -> list:
+    return list(op.get_bind().execute(sa.text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = CAST(:table AS regclass) ORDER BY 1"
+    ), {"table": table}).scalars())
+
+
+def _replace_records_index(columns: str, suffix: str) -> None:
+    # パーティション化されたテーブルには CREATE INDEX CONCURRENTLY を使えないため、
+    # 親には ON ONLY で（無効な状態の）インデックスを作り、各パーティションに CONCURRENTLY で作ったインデックスを付け加える
+    # 全てのパーティションのインデックスを付け加えると親のインデックスが有効になる
+    partitions = _partitions('records')
+    op.execute(f'CREATE INDEX "ix_records_userId_date_new" ON ONLY records {columns}')
+    with op.get_context().autocommit_block():
+        for partition in partitions:
+            op.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{partition}_{suffix}" ON {partition} {columns}')
+            op.execute(f'ALTER INDEX "ix_records_userId_date_new" ATTACH PARTITION "{partition}_{suffix}"')
+    op.execute('DROP INDEX "ix_records_userId_date"')
+    op.execute('ALTER INDEX "ix_records_userId_date_new" RENAME TO "ix_records_userId_date"')
+
+
+def upgrade() -> None:
+    # ユーザーごとの分析（/analysis_tag, /analysis_detail）で使う列をインデックスに含め、テーブルを読まずに済むようにする
+    _replace_records_index('("userId", date) INCLUDE (id, description)', 'userId_date_id_description_idx')
+
+    with op.get_context().autocommit_block():
+        op.create_index('ix_practice_details_recordId_new', 'practice_details', ['recordId'], unique=False, postgresql_include=['id', 'content', 'tag_ids'], postgresql_concurrently=True, if_not_exists=True)
+        op.drop_index('ix_practice_details_recordId', table_name='practice_details', postgresql_concurrently=True, if_exists=True)
+        op.execute('ALTER INDEX "ix_practice_details_recordId_new" RENAME TO "ix_practice_details_recordId"')
+
+        # 集計テーブルは常にユーザーを指定して読むため、日だけのインデックスは使われなくなる
+        op.create_index('ix_tag_daily_rollup_userId_day', 'tag_daily_rollup', ['userId', 'day'], unique=False, postgresql_include=['content', 'tag_id', 'count'], postgresql_concurrently=True, if_not_exists=True)
+        op.drop_index('ix_tag_daily_rollup_day', table_name='tag_daily_rollup', postgresql_concurrently=True, if_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index('ix_tag_daily_rollup_day', 'tag_daily_rollup', ['day'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.drop_index('ix_tag_daily_rollup_userId_day', table_name='tag_daily_rollup', postgresql_concurrently=True, if_exists=True)
+
+        op.create_index('ix_practice_details_recordId_new', 'practice_details', ['recordId'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.drop_index('ix_practice_details_recordId', table_name='practice_details', postgresql_concurrently=True, if_exists=True)
+        op.execute('ALTER INDEX "ix_practice_details_recordId_new" RENAME TO "ix_practice_details_recordId"')
+
+    _replace_records_index('("userId", date)', 'userId_date_idx')
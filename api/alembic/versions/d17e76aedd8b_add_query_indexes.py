@@ -0,0 +1,45 @@
+"""add query indexes
+
+Revision ID: d17e76aedd8b
+Revises: 7c517b24dd4f
+Create Date: 2026-10-16 21:05:12.418205
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd17e76aedd8b'
+down_revision: Union[str, None] = '7c517b24dd4f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CREATE/DROP INDEX CONCURRENTLY はトランザクション内で実行できないため autocommit で実行する
+    with op.get_context().autocommit_block():
+        # 月表示: WHERE "userId" = ? AND date BETWEEN ? AND ?
+        op.create_index('ix_records_userId_date', 'records', ['userId', 'date'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+        # records -> practice_details の結合キー
+        op.create_index(op.f('ix_practice_details_recordId'), 'practice_details', ['recordId'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+        # tags -> practice_tag_association の逆引き（主キーは practice_detail_id が先頭のため使えない）
+        op.create_index('ix_practice_tag_association_tag_id', 'practice_tag_association', ['tag_id', 'practice_detail_id'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+
+        # 主キーと重複しているインデックスを削除
+        op.drop_index(op.f('ix_records_id'), table_name='records', postgresql_concurrently=True, if_exists=True)
+        op.drop_index(op.f('ix_tags_id'), table_name='tags', postgresql_concurrently=True, if_exists=True)
+        op.drop_index(op.f('ix_practice_details_id'), table_name='practice_details', postgresql_concurrently=True, if_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(op.f('ix_practice_details_id'), 'practice_details', ['id'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index(op.f('ix_tags_id'), 'tags', ['id'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index(op.f('ix_records_id'), 'records', ['id'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+
+        op.drop_index('ix_practice_tag_association_tag_id', table_name='practice_tag_association', postgresql_concurrently=True, if_exists=True)
+        op.drop_index(op.f('ix_practice_details_recordId'), table_name='practice_details', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_records_userId_date', table_name='records', postgresql_concurrently=True, if_exists=True)
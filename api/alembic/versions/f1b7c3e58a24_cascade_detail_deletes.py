@@ -0,0 +1,48 @@
+"""cascade detail deletes
+
+Revision ID: f1b7c3e58a24
+Revises: c4e9a7d2b610
+Create Date: 2026-10-18 10:42:19.630514
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1b7c3e58a24'
+down_revision: Union[str, None] = 'c4e9a7d2b610'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _replace_detail_foreign_key(ondelete: Union[str, None]) -> None:
+    # 付け替え（ACCESS EXCLUSIVE ロック）は NOT VALID で既存の行を検証せずに済ませてコミットし、
+    # 検証は別のトランザクションで行う（VALIDATE CONSTRAINT は SHARE UPDATE EXCLUSIVE ロックなので、検証中も書き込みを止めない）
+    op.drop_constraint('practice_tag_association_practice_detail_id_fkey', 'practice_tag_association', type_='foreignkey')
+    op.create_foreign_key(
+        'practice_tag_association_practice_detail_id_fkey', 'practice_tag_association', 'practice_details',
+        ['practice_detail_id'], ['id'], ondelete=ondelete, postgresql_not_valid=True
+    )
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TABLE practice_tag_association VALIDATE CONSTRAINT practice_tag_association_practice_detail_id_fkey")
+
+
+def upgrade() -> None:
+    # 詳細を削除すると関連付けも削除されるようにする
+    # practice_details.recordId -> records は、records がパーティション化されていて外部キーを張れないため、
+    # レコードの削除は records と practice_details を1文（データ変更のCTE）で削除する（crud.delete_records）
+    _replace_detail_foreign_key('CASCADE')
+
+    # タグの削除（manage.py gc-tags）で、集計テーブルからの参照を確認するため
+    with op.get_context().autocommit_block():
+        op.create_index('ix_tag_daily_rollup_tag_id', 'tag_daily_rollup', ['tag_id'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_tag_daily_rollup_tag_id', table_name='tag_daily_rollup', postgresql_concurrently=True, if_exists=True)
+
+    _replace_detail_foreign_key(None)
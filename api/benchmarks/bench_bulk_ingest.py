@@ -0,0 +1,76 @@
+# 1件ずつの POST /records/ と POST /records/bulk の取り込み速度(行/秒)を比較する
+# 使い方: cd api && python -m benchmarks.bench_bulk_ingest --base-url http://localhost:8000 --rows 2000
+import argparse
+import datetime
+import json
+import random
+import time
+
+import requests
+
+def generate_rows(count: int, user_id: str, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    start = datetime.date(2015, 1, 1)
+    rows = []
+    for i in range(count):
+        day = start + datetime.timedelta(days=i % 3650)
+        rows.append({
+            "description": f"bulk benchmark {i}",
+            "date": day.isoformat(),
+            "startTime": str(rng.randint(6, 20)),
+            "startMinute": f"{rng.choice([0, 15, 30, 45]):02d}",
+            "endTime": str(rng.randint(21, 23)),
+            "endMinute": "00",
+            "userId": user_id,
+            "practiceDetails": [
+                {
+                    "content": f"content-{rng.randint(0, 20)}",
+                    "tags": [{"name": f"tag-{rng.randint(0, 200)}"} for _ in range(rng.randint(1, 4))],
+                }
+                for _ in range(rng.randint(1, 5))
+            ],
+        })
+    return rows
+
+def bench_single(base_url: str, rows: list) -> float:
+    session = requests.Session()
+    started = time.perf_counter()
+    for row in rows:
+        session.post(f"{base_url}/records/", json=row).raise_for_status()
+    return len(rows) / (time.perf_counter() - started)
+
+def bench_bulk(base_url: str, rows: list, batch_size: int) -> float:
+    session = requests.Session()
+    started = time.perf_counter()
+    for i in range(0, len(rows), batch_size):
+        body = "\n".join(json.dumps(row, ensure_ascii=False) for row in rows[i:i + batch_size])
+        response = session.post(
+            f"{base_url}/records/bulk",
+            data=body.encode("utf-8"),
+            headers={"content-type": "application/x-ndjson"},
+        )
+        response.raise_for_status()
+        if response.json()["errors"]:
+            raise RuntimeError(response.json()["errors"][:3])
+    return len(rows) / (time.perf_counter() - started)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--user-id", default="bench-bulk-ingest")
+    args = parser.parse_args()
+
+    rows = generate_rows(args.rows, args.user_id)
+    single = bench_single(args.base_url, rows)
+    bulk = bench_bulk(args.base_url, rows, args.batch_size)
+    print(json.dumps({
+        "rows": args.rows,
+        "single_rows_per_sec": round(single, 1),
+        "bulk_rows_per_sec": round(bulk, 1),
+        "speedup": round(bulk / single, 1),
+    }))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# 履歴（年数）を段階的に増やしながら、月表示（GET /records/{year}/{month} のクエリ）のレイテンシを計測する
+# records は月ごとのパーティションなので、履歴が増えても月表示が読むのはその月のパーティションだけで、レイテンシはほぼ一定になる
+# 比較として、パーティションの絞り込みを無効にした場合（全パーティションのインデックスを引く）も計測する
+# DB_* 環境変数の接続先にデータを投入するため、検証用のデータベースに対して実行すること
+# 使い方: cd api && python -m benchmarks.bench_partitions --years 1 2 4 8
+#         cd api && python -m benchmarks.bench_partitions --drop   # 投入したデータを削除する
+import argparse
+import datetime
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "practice_record_api"))
+os.environ.setdefault("DB_BACKEND", "sync")
+
+from sqlalchemy import select, text
+
+import crud
+import models
+import partitions
+from models import Record
+
+from benchmarks import report
+
+USER_PREFIX = "bench-partition-"
+
+# ユーザーごとに毎日1件、詳細2件
+SEED_RECORDS_SQL = """
+INSERT INTO records (description, date, "startTime", "startMinute", "endTime", "endMinute", "userId")
+SELECT 'bench partition ' || d::date, d, '10', '00', '11', '30', 'bench-partition-' || u
+FROM generate_series(1, :users) u, generate_series(CAST(:start AS timestamp), CAST(:stop AS timestamp) - interval '1 day', interval '1 day') d
+"""
+
+SEED_DETAILS_SQL = """
+INSERT INTO practice_details ("recordId", content)
+SELECT r.id, 'content-' || (r.id + k) % 20
+FROM records r, generate_series(1, 2) k
+WHERE r."userId" LIKE 'bench-partition-%' AND r.date >= :start AND r.date < :stop
+"""
+
+def grow(years: int, users: int, end_year: int) -> int:
+    # 履歴が end_year から years 年分になるまで、足りない年を古い方に追加する。records の件数を返す
+    start = datetime.date(end_year - years + 1, 1, 1)
+    with models.engine.connect() as conn:
+        oldest = conn.execute(text('SELECT min(date) FROM records WHERE "userId" LIKE \'bench-partition-%\'')).scalar()
+    stop = oldest.date() if oldest is not None else datetime.date(end_year + 1, 1, 1)
+
+    if start < stop:
+        with models.SessionLocal() as db:
+            month = start
+            months = []
+            while month < stop:
+                months.append(month)
+                month = partitions.add_months(month, 1)
+            partitions.create_partitions(db, months)
+        with models.engine.begin() as conn:
+            conn.execute(text(SEED_RECORDS_SQL), {"users": users, "start": start, "stop": stop})
+            conn.execute(text(SEED_DETAILS_SQL), {"start": start, "stop": stop})
+        with models.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("ANALYZE records"))
+            conn.execute(text("ANALYZE practice_details"))
+
+    with models.engine.connect() as conn:
+        return conn.execute(text('SELECT count(*) FROM records WHERE "userId" LIKE \'bench-partition-%\'')).scalar()
+
+def drop():
+    with models.engine.begin() as conn:
+        seeded = f"SELECT id FROM records WHERE \"userId\" LIKE '{USER_PREFIX}%'"
+        conn.execute(text(f"DELETE FROM practice_details WHERE \"recordId\" IN ({seeded})"))
+        conn.execute(text(f"DELETE FROM records WHERE \"userId\" LIKE '{USER_PREFIX}%'"))
+
+def scanned_partitions(db, statement) -> int:
+    # EXPLAIN の結果から、読まれる records のパーティションの数を数える
+    def relations(plan: dict):
+        if plan.get("Relation Name", "").startswith("records_"):
+            yield plan["Relation Name"]
+        for child in plan.get("Plans", []):
+            yield from relations(child)
+
+    compiled = statement.compile(models.engine, compile_kwargs={"literal_binds": True})
+    plan = db.execute(text(f"EXPLAIN (FORMAT JSON) {compiled}")).scalar()[0]["Plan"]
+    return len(set(relations(plan)))
+
+def measure(user_id: str, month: datetime.date, repeat: int, pruning: bool) -> dict:
+    end = partitions.add_months(month, 1) - datetime.timedelta(days=1)
+    with models.SessionLocal() as db:
+        if not pruning:
+            db.execute(text("SET LOCAL enable_partition_pruning = off"))
+        month_records = select(Record.id).where(Record.date >= month, Record.date <= end, Record.userId == user_id)
+        partitions_scanned = scanned_partitions(db, month_records)
+        return dict(report.timed(lambda: crud.get_records_between(db, user_id, month, end), repeat), partitions_scanned=partitions_scanned)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--years", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--end-year", type=int, default=2025)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--drop", action="store_true", help="投入済みのデータを削除して終了する")
+    parser.add_argument("--output", help="結果のJSONの保存先（省略時は benchmarks/results/ 以下）")
+    args = parser.parse_args()
+
+    if args.drop:
+        drop()
+        return
+
+    # 履歴の最新の月を表示する
+    month = datetime.date(args.end_year, 12, 1)
+    user_id = f"{USER_PREFIX}1"
+    # "<年数>y/<pruned|no_pruning>/month_view" -> 集計（records: records の件数, partitions_scanned: 読むパーティションの数）
+    results = {}
+    for years in sorted(args.years):
+        records = grow(years, args.users, args.end_year)
+        for name, pruning in [("pruned", True), ("no_pruning", False)]:
+            results[f"{years}y/{name}/month_view"] = dict(measure(user_id, month, args.repeat, pruning), records=records)
+
+    report.print_table(results)
+    print(report.save_results("bench_partitions", vars(args), results, args.output))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# records の件数を段階的に増やしながら、部分一致検索のレイテンシを計測する
+# 各段階でトライグラムインデックスを使った場合と、インデックスを使わない場合（シーケンシャルスキャン）を比較する
+# DB_* 環境変数の接続先にデータを投入するため、検証用のデータベースに対して実行すること
+# 使い方: cd api && python -m benchmarks.bench_search --steps 20000 100000 500000
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "practice_record_api"))
+os.environ.setdefault("DB_BACKEND", "sync")
+
+from sqlalchemy import func, select, text
+
+import models
+import search
+from models import Record
+
+from benchmarks import report
+
+USER_PREFIX = "bench-search-"
+
+WORDS = ["scale", "arpeggio", "etude", "sonata", "chord", "rhythm", "sight", "reading", "tempo", "legato",
+         "staccato", "pedal", "octave", "trill", "dynamics", "phrase", "memorize", "metronome", "bach", "chopin"]
+
+SEED_RECORDS_SQL = """
+INSERT INTO records (description, date, "startTime", "startMinute", "endTime", "endMinute", "userId")
+SELECT
+    (:words)[1 + (g * 7) % 20] || ' ' || (:words)[1 + (g * 13) % 20] || ' ' || (:words)[1 + (g * 17) % 20] || ' #' || g,
+    date '2015-01-01' + g % 3650, '10', '00', '11', '30', 'bench-search-' || g % 100
+FROM generate_series(:start + 1, :stop) g
+"""
+
+SEED_DETAILS_SQL = """
+INSERT INTO practice_details ("recordId", content)
+SELECT r.id, (:words)[1 + (r.id * 11) % 20] || ' drill ' || r.id % 500
+FROM records r
+WHERE r."userId" LIKE 'bench-search-%' AND r.id > :last_id
+"""
+
+def grow(target: int):
+    with models.engine.begin() as conn:
+        current, last_id = conn.execute(
+            text('SELECT count(*), coalesce(max(id), 0) FROM records WHERE "userId" LIKE \'bench-search-%\'')
+        ).one()
+        if current < target:
+            conn.execute(text(SEED_RECORDS_SQL), {"words": WORDS, "start": current, "stop": target})
+            conn.execute(text(SEED_DETAILS_SQL), {"words": WORDS, "last_id": last_id})
+    with models.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("ANALYZE records"))
+        conn.execute(text("ANALYZE practice_details"))
+
+def measure(q: str, repeat: int, use_index: bool) -> dict:
+    with models.SessionLocal() as db:
+        if not use_index:
+            db.execute(text("SET LOCAL enable_bitmapscan = off"))
+            db.execute(text("SET LOCAL enable_indexscan = off"))
+        substring = select(func.count()).select_from(Record).where(search.description_filter(q))
+        return {
+            "description_filter": report.timed(lambda: db.execute(substring).scalar(), repeat),
+            "search": report.timed(lambda: search.search_records(db, q, f"{USER_PREFIX}1", 20), repeat),
+        }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--steps", type=int, nargs="+", default=[20000, 100000, 500000])
+    parser.add_argument("--query", default="arpeggio sonata")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", help="結果のJSONの保存先（省略時は benchmarks/results/ 以下）")
+    args = parser.parse_args()
+
+    # "<件数>/<indexed|seq_scan>/<クエリ>" -> 集計
+    results = {}
+    for size in sorted(args.steps):
+        grow(size)
+        for plan, use_index in [("indexed", True), ("seq_scan", False)]:
+            for name, summary in measure(args.query, args.repeat, use_index).items():
+                results[f"{size}/{plan}/{name}"] = summary
+
+    report.print_table(results)
+    print(report.save_results("bench_search", vars(args), results, args.output))
+
+if __name__ == "__main__":
+    main()
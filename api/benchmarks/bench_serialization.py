@@ -0,0 +1,102 @@
+# レコードのレスポンスを組み立ててJSONにするコストを、1,000件あたりで比較する
+#   before: ORMで読み込み -> RecordModel を組み立て -> jsonable_encoder -> json.dumps
+#   after:  行から直接dictを組み立て（record_loader.load_record_dicts） -> orjson（cache._serialize）
+# 両者のJSONが一致することも確認する
+# 事前に benchmarks.seed でデータを投入しておくこと
+# 使い方: cd api && python -m benchmarks.bench_serialization --records 1000 --repeat 20
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "practice_record_api"))
+os.environ.setdefault("DB_BACKEND", "sync")
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import select
+
+import models
+import cache
+from models import Record
+from record_loader import load_records, load_record_dicts
+from schemas import PracticeTag, PracticeDetailModel, RecordModel
+
+from benchmarks import report
+from benchmarks.seed import USER_PREFIX
+
+def to_record_model(record: Record) -> RecordModel:
+    # 以前の crud.get_records_between と同じ組み立て方
+    return RecordModel(
+        id=record.id,
+        description=record.description,
+        date=record.date,
+        startTime=record.startTime,
+        startMinute=record.startMinute,
+        endTime=record.endTime,
+        endMinute=record.endMinute,
+        userId=record.userId,
+        durationMinutes=record.duration_minutes,
+        practiceDetails=[
+            PracticeDetailModel(content=detail.content, tags=[PracticeTag(name=tag.name) for tag in detail.practiceTags])
+            for detail in record.practiceDetails
+        ]
+    )
+
+def encode_models(models_: list) -> bytes:
+    return json.dumps(jsonable_encoder(models_), ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", help="結果のJSONの保存先（省略時は benchmarks/results/ 以下）")
+    args = parser.parse_args()
+
+    with models.SessionLocal() as db:
+        ids = db.execute(
+            select(Record.id).where(Record.userId.like(USER_PREFIX + "%")).order_by(Record.id).limit(args.records)
+        ).scalars().all()
+        if not ids:
+            sys.exit("no seed data; run python -m benchmarks.seed first")
+        criteria = Record.id.in_(ids)
+        per = 1000 / len(ids)
+
+        def before():
+            records = load_records(db, criteria)
+            body = encode_models([to_record_model(record) for record in records])
+            db.expunge_all()
+            return body
+
+        def after():
+            return cache._serialize(load_record_dicts(db, criteria))
+
+        # タグの並び順は以前は不定だったので、タグを並べ替えて比較する
+        def normalized(body: bytes) -> list:
+            records = json.loads(body)
+            for record in records:
+                for detail in record["practiceDetails"]:
+                    detail["tags"].sort(key=lambda tag: tag["name"])
+            return records
+
+        loaded = load_records(db, criteria)
+        built_models = [to_record_model(record) for record in loaded]
+        built_dicts = load_record_dicts(db, criteria)
+
+        extra = {"records": len(ids), "same_json": normalized(before()) == normalized(after())}
+        # 時間はすべて1,000件あたりに換算する
+        cases = {
+            # 読み込みから送信するバイト列までの合計
+            "end_to_end/before": before,
+            "end_to_end/after": after,
+            # 読み込み済みのデータからバイト列にするまで
+            "serialize_only/before": lambda: encode_models([to_record_model(record) for record in loaded]),
+            "serialize_only/before_encode_only": lambda: encode_models(built_models),
+            "serialize_only/after": lambda: cache._serialize(built_dicts),
+        }
+        results = {name: dict(report.timed(fn, args.repeat, per), **extra) for name, fn in cases.items()}
+
+    report.print_table(results)
+    print(report.save_results("bench_serialization", vars(args), results, args.output))
+
+if __name__ == "__main__":
+    main()
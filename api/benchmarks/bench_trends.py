@@ -0,0 +1,164 @@
+# trends（1回のクエリ + pandas / numpy の集計）と、ORMでレコードを読み込んで Python のループで集計する方法を比較する
+# 両者の結果が一致することも確認する
+# 事前に benchmarks.seed で数年分のデータを投入しておくこと
+# 使い方: cd api && python -m benchmarks.bench_trends --users 5 --repeat 10
+#         (データ: python -m benchmarks.seed --users 20 --years 10)
+import argparse
+import datetime
+import os
+import sys
+from collections import Counter, defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "practice_record_api"))
+os.environ.setdefault("DB_BACKEND", "sync")
+
+import models
+import trends
+from models import Record
+from record_loader import load_records
+
+from benchmarks import report
+from benchmarks.seed import user_id
+
+TODAY = datetime.date(2026, 1, 1)
+
+def _week_start(day: datetime.date) -> datetime.date:
+    return day - datetime.timedelta(days=day.weekday())
+
+def _percentile(values: list, q: float) -> float:
+    # pandas の quantile と同じ線形補間
+    position = (len(values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+def loop_volume(records: list, window: int) -> list:
+    totals = defaultdict(lambda: [0, set(), 0])
+    for record in records:
+        week = _week_start(record.date.date())
+        totals[week][0] += 1
+        totals[week][1].add(record.date.date())
+        totals[week][2] += record.duration_minutes or 0
+    if not totals:
+        return []
+    result = []
+    week, last = min(totals), max(totals)
+    history = []
+    while week <= last:
+        count, days, minutes = totals.get(week, [0, set(), 0])
+        history.append((count, minutes))
+        recent = history[-window:]
+        result.append({
+            "week": week.isoformat(), "records": count, "practice_days": len(days), "total_minutes": minutes,
+            "rolling_records": round(sum(c for c, _ in recent) / len(recent), 2),
+            "rolling_minutes": round(sum(m for _, m in recent) / len(recent), 1),
+        })
+        week += datetime.timedelta(days=7)
+    return result
+
+def loop_streaks(records: list, today: datetime.date) -> dict:
+    days = sorted({record.date.date() for record in records})
+    if not days:
+        return {"practice_days": 0, "current": None, "longest": None}
+    runs = []
+    start = previous = days[0]
+    for day in days[1:]:
+        if day - previous != datetime.timedelta(days=1):
+            runs.append((start, previous))
+            start = day
+        previous = day
+    runs.append((start, previous))
+
+    def streak(run):
+        return {"days": (run[1] - run[0]).days + 1, "start": run[0].isoformat(), "end": run[1].isoformat()}
+
+    longest = max(runs, key=lambda run: ((run[1] - run[0]).days, -runs.index(run)))
+    return {
+        "practice_days": len(days),
+        "current": streak(runs[-1]) if runs[-1][1] >= today - datetime.timedelta(days=1) else None,
+        "longest": streak(longest),
+    }
+
+def loop_content_time(records: list) -> list:
+    minutes = defaultdict(list)
+    for record in records:
+        if record.duration_minutes is None:
+            continue
+        for content in {detail.content for detail in record.practiceDetails}:
+            minutes[content].append(record.duration_minutes)
+    result = []
+    for content, values in minutes.items():
+        values.sort()
+        result.append({
+            "content": content, "records": len(values), "total_minutes": sum(values),
+            "mean_minutes": round(sum(values) / len(values), 1),
+            "p25_minutes": round(_percentile(values, 0.25), 1), "median_minutes": round(_percentile(values, 0.5), 1),
+            "p75_minutes": round(_percentile(values, 0.75), 1), "p90_minutes": round(_percentile(values, 0.9), 1),
+            "max_minutes": round(float(values[-1]), 1),
+        })
+    return sorted(result, key=lambda row: (-row["total_minutes"], -row["records"], row["content"]))
+
+def loop_tag_totals(records: list, top: int) -> dict:
+    totals = Counter()
+    for record in records:
+        totals.update({tag.name for detail in record.practiceDetails for tag in detail.practiceTags})
+    return dict(totals.most_common(top))
+
+def run_loop(db, uid: str, window: int, top: int) -> dict:
+    records = load_records(db, Record.userId == uid)
+    return {
+        "volume": loop_volume(records, window),
+        "streaks": loop_streaks(records, TODAY),
+        "content_time": loop_content_time(records),
+        "tag_totals": loop_tag_totals(records, top),
+    }
+
+def run_vectorized(db, uid: str, window: int, top: int) -> dict:
+    frame = trends.load_frame(db, uid)
+    trend = trends.tag_trend_from_frame(frame, top)
+    return {
+        "volume": trends.volume_from_frame(frame, "week", window),
+        "streaks": trends.streaks_from_frame(frame, TODAY),
+        "content_time": sorted(trends.content_time_from_frame(frame), key=lambda row: (-row["total_minutes"], -row["records"], row["content"])),
+        "tag_totals": {tag["tag"]: tag["total"] for tag in trend["tags"]},
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=5, help="計測するユーザー数（seed のユーザーの先頭から）")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--window", type=int, default=4)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--output", help="結果のJSONの保存先（省略時は benchmarks/results/ 以下）")
+    args = parser.parse_args()
+
+    # "<userId>/<orm_loop|vectorized>" -> 集計（records: ユーザーのレコード数, mismatched: 結果が一致しなかった集計）
+    results = {}
+    for index in range(args.users):
+        uid = user_id(index)
+        with models.SessionLocal() as db:
+            loop_result = run_loop(db, uid, args.window, args.top)
+            db.expunge_all()
+            vectorized_result = run_vectorized(db, uid, args.window, args.top)
+            # タグの上位は同数の順序が異なりうるので件数の集合で比較する
+            mismatched = [
+                name for name in loop_result
+                if (sorted(loop_result[name].values()) if name == "tag_totals" else loop_result[name])
+                != (sorted(vectorized_result[name].values()) if name == "tag_totals" else vectorized_result[name])
+            ]
+
+            def orm_loop():
+                run_loop(db, uid, args.window, args.top)
+                db.expunge_all()
+
+            extra = {"records": sum(week["records"] for week in loop_result["volume"]), "mismatched": mismatched}
+            results[f"{uid}/orm_loop"] = dict(report.timed(orm_loop, args.repeat), **extra)
+            results[f"{uid}/vectorized"] = dict(report.timed(lambda: run_vectorized(db, uid, args.window, args.top), args.repeat), **extra)
+            if mismatched:
+                print(f"{uid}: results differ: {', '.join(mismatched)}")
+
+    report.print_table(results)
+    print(report.save_results("bench_trends", vars(args), results, args.output))
+
+if __name__ == "__main__":
+    main()
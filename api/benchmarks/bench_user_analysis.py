@@ -0,0 +1,170 @@
+# ユーザー数を段階的に増やしながら、1ユーザーの分析（/analysis_tag, /analysis_detail のクエリ）のレイテンシを計測する
+# 分析はユーザーで絞り込んでから結合し、カバリングインデックスだけで読む（Index Only Scan）ので、ユーザー数が増えてもレイテンシはほぼ一定になる
+# 各クエリを EXPLAIN ANALYZE し、読んだテーブルのスキャン方法とヒープを読んだ行数（Heap Fetches）も出力する
+# DB_* 環境変数の接続先にデータを投入するため、検証用のデータベースに対して実行すること
+# 使い方: cd api && python -m benchmarks.bench_user_analysis --users 10 100 1000
+#         cd api && python -m benchmarks.bench_user_analysis --drop   # 投入したデータを削除する
+import argparse
+import datetime
+import os
+import sys
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "practice_record_api"))
+os.environ.setdefault("DB_BACKEND", "sync")
+
+from sqlalchemy import event, text
+
+import analysis
+import models
+import partitions
+import rollup
+import tag_arrays
+import usage
+
+from benchmarks import report
+
+USER_PREFIX = "bench-analysis-"
+TAG_PREFIX = "bench-analysis-tag-"
+TAGS = 50
+YEAR = 2025
+
+# スキャン方法を出力するテーブル（records のパーティションは records として数える）
+SCANNED_TABLES = {"records", "practice_details", "practice_tag_association", "tag_daily_rollup"}
+
+SEED_SQL = [
+    f"""
+    INSERT INTO tags (name)
+    SELECT '{TAG_PREFIX}' || g FROM generate_series(1, {TAGS}) g
+    ON CONFLICT (name) DO NOTHING
+    """,
+    # ユーザーごとに1日おきに1件、詳細3件・タグ2件ずつ
+    f"""
+    INSERT INTO records (description, date, "startTime", "startMinute", "endTime", "endMinute", "userId")
+    SELECT 'bench analysis ' || (u + d) % 7, date '{YEAR}-01-01' + d * 2, '10', '00', '11', '30', '{USER_PREFIX}' || u
+    FROM generate_series(:first, :last) u, generate_series(0, 181) d
+    """,
+    f"""
+    INSERT INTO practice_details ("recordId", content)
+    SELECT r.id, 'content-' || ((r.id + k) % 20)
+    FROM records r, generate_series(1, 3) k
+    WHERE r."userId" IN (SELECT '{USER_PREFIX}' || u FROM generate_series(:first, :last) u)
+    """,
+    f"""
+    INSERT INTO practice_tag_association (practice_detail_id, tag_id)
+    SELECT DISTINCT pd.id, t.id
+    FROM practice_details pd
+    JOIN records r ON r.id = pd."recordId" AND r."userId" IN (SELECT '{USER_PREFIX}' || u FROM generate_series(:first, :last) u)
+    CROSS JOIN generate_series(1, 2) k
+    JOIN tags t ON t.name = '{TAG_PREFIX}' || (1 + (pd.id * 7 + k * 13) % {TAGS})
+    """,
+]
+
+def seeded_users() -> int:
+    with models.engine.connect() as conn:
+        return conn.execute(text(f"SELECT count(DISTINCT \"userId\") FROM records WHERE \"userId\" LIKE '{USER_PREFIX}%'")).scalar()
+
+def grow(users: int) -> int:
+    # ユーザー数が users になるまで追加する。records の件数を返す
+    first = seeded_users() + 1
+    if first <= users:
+        with models.SessionLocal() as db:
+            partitions.create_partitions(db, (datetime.date(YEAR, month, 1) for month in range(1, 13)))
+        user_ids = f"SELECT '{USER_PREFIX}' || u FROM generate_series({first}, {users}) u"
+        with models.SessionLocal() as db:
+            for statement in SEED_SQL:
+                db.execute(text(statement), {"first": first, "last": users})
+            added = f"SELECT id FROM records WHERE \"userId\" IN ({user_ids})"
+            rollup.add_records_sql(db, added)
+            usage.add_records_sql(db, added)
+            tag_arrays.refresh_details_sql(db, f"SELECT id FROM practice_details WHERE \"recordId\" IN ({added})")
+            db.commit()
+        # Index Only Scan がヒープを読まずに済むように、VACUUM で visibility map を更新しておく
+        with models.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            for table in SCANNED_TABLES:
+                conn.execute(text(f"VACUUM ANALYZE {table}"))
+
+    with models.engine.connect() as conn:
+        return conn.execute(text(f"SELECT count(*) FROM records WHERE \"userId\" LIKE '{USER_PREFIX}%'")).scalar()
+
+def drop():
+    with models.engine.begin() as conn:
+        seeded = f"SELECT id FROM records WHERE \"userId\" LIKE '{USER_PREFIX}%'"
+        conn.execute(text(f"DELETE FROM tag_daily_rollup WHERE \"userId\" LIKE '{USER_PREFIX}%'"))
+        conn.execute(text(f"DELETE FROM user_tag_usage WHERE \"userId\" LIKE '{USER_PREFIX}%'"))
+        conn.execute(text(f"DELETE FROM user_content_usage WHERE \"userId\" LIKE '{USER_PREFIX}%'"))
+        conn.execute(text(f"DELETE FROM practice_tag_association WHERE practice_detail_id IN (SELECT id FROM practice_details WHERE \"recordId\" IN ({seeded}))"))
+        conn.execute(text(f"DELETE FROM practice_details WHERE \"recordId\" IN ({seeded})"))
+        conn.execute(text(f"DELETE FROM records WHERE \"userId\" LIKE '{USER_PREFIX}%'"))
+
+def scans(plan: dict, found: Counter, heap_fetches: Counter):
+    relation = plan.get("Relation Name", "")
+    table = "records" if relation.startswith("records_") else relation
+    if table in SCANNED_TABLES:
+        found[f"{table}: {plan['Node Type']}"] += 1
+        heap_fetches[table] += plan.get("Heap Fetches", 0)
+    for child in plan.get("Plans", []):
+        scans(child, found, heap_fetches)
+
+def explain(fn) -> dict:
+    # fn が発行したSELECTを EXPLAIN ANALYZE し、テーブルごとのスキャン方法とヒープを読んだ行数を集計する
+    statements = []
+
+    def collect(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    event.listen(models.engine, "before_cursor_execute", collect)
+    try:
+        fn()
+    finally:
+        event.remove(models.engine, "before_cursor_execute", collect)
+
+    found, heap_fetches = Counter(), Counter()
+    raw = models.engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        for statement, parameters in statements:
+            cursor.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + statement, parameters)
+            scans(cursor.fetchone()[0][0]["Plan"], found, heap_fetches)
+        raw.rollback()
+    finally:
+        raw.close()
+    return {"scans": dict(sorted(found.items())), "heap_fetches": dict(sorted(heap_fetches.items()))}
+
+def measure(user_id: str, repeat: int) -> dict:
+    month_start, month_end = datetime.date(YEAR, 6, 1), datetime.date(YEAR, 6, 30)
+    tags = [f"{TAG_PREFIX}1", f"{TAG_PREFIX}2"]
+    with models.SessionLocal() as db:
+        cases = {
+            "analysis_tag": lambda: analysis.tag_counts(db, user_id, datetime.date(YEAR, 1, 1), datetime.date(YEAR, 12, 31), None, None, None),
+            "analysis_tag_description": lambda: analysis.tag_counts(db, user_id, None, None, None, None, "analysis 3"),
+            "analysis_detail": lambda: analysis.detail_rows(db, user_id, month_start, month_end, None, tags, None, "or"),
+            "analysis_detail_page": lambda: analysis.detail_page(db, user_id, None, None, None, None, None, "and", None, 100),
+        }
+        return {name: dict(report.timed(fn, repeat), **explain(fn)) for name, fn in cases.items()}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--drop", action="store_true", help="投入済みのデータを削除して終了する")
+    parser.add_argument("--output", help="結果のJSONの保存先（省略時は benchmarks/results/ 以下）")
+    args = parser.parse_args()
+
+    if args.drop:
+        drop()
+        return
+
+    # "<ユーザー数>users/<ケース>" -> 集計（records: records の件数, scans / heap_fetches: EXPLAIN ANALYZE の集計）
+    results = {}
+    for users in sorted(args.users):
+        records = grow(users)
+        for name, summary in measure(f"{USER_PREFIX}1", args.repeat).items():
+            results[f"{users}users/{name}"] = dict(summary, records=records)
+
+    report.print_table(results)
+    print(report.save_results("bench_user_analysis", vars(args), results, args.output))
+
+if __name__ == "__main__":
+    main()
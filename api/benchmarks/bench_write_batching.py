@@ -0,0 +1,106 @@
+# 同時に大量の POST /records/ が届いた場合の書き込み（crud.create_record）を、
+# リクエストごとにコミットする場合と write_batcher でまとめてコミットする場合とで比較する
+# HTTP は通さず、エンドポイントと同じ呼び出し（リクエストごとのセッション + run_db / WriteBatcher.submit）を並行に実行する
+# bench-write-batching のレコードを 2030年2月に作り、終了時に削除する。検証用のデータベースに対して実行すること
+# 使い方: cd api && DB_BACKEND=async python -m benchmarks.bench_write_batching --concurrency 1 8 32 64 --duration 10
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "practice_record_api"))
+os.environ.setdefault("DB_BACKEND", "async")
+
+from sqlalchemy import text
+
+import crud
+import models
+import write_batcher
+from database import dispose_engines, run_db, write_session
+from schemas import CreateRecordModel
+
+from benchmarks import report
+
+WRITE_USER = "bench-write-batching"
+
+def _payload(rng: random.Random) -> CreateRecordModel:
+    return CreateRecordModel(
+        description=f"write batching benchmark {rng.randint(0, 999)}",
+        date=f"2030-02-{rng.randint(1, 28):02d}", startTime="10", startMinute="00", endTime="11", endMinute="30", userId=WRITE_USER,
+        practiceDetails=[
+            {"content": f"content-{rng.randint(0, 20):03d}", "tags": [{"name": f"bench-write-tag-{rng.randint(0, 50):02d}"} for _ in range(rng.randint(1, 3))]}
+            for _ in range(rng.randint(1, 4))
+        ],
+    )
+
+async def create_per_request(record_data: CreateRecordModel) -> int:
+    # WRITE_BATCHING が無効な場合の POST /records/ と同じ（リクエストごとのセッションで書き込んでコミットする）
+    async with write_session() as db:
+        return await run_db(db, crud.create_record, record_data)
+
+async def run(create, concurrency: int, duration: float) -> dict:
+    samples = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def client(index: int):
+        nonlocal errors
+        rng = random.Random(index)
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                await create(_payload(rng))
+            except Exception:
+                errors += 1
+                continue
+            samples.append((time.perf_counter() - started) * 1000)
+
+    await asyncio.gather(*(client(index) for index in range(concurrency)))
+    return report.summarize(samples, duration, errors)
+
+def cleanup():
+    with models.engine.begin() as conn:
+        written = f"SELECT id FROM records WHERE \"userId\" = '{WRITE_USER}'"
+        conn.execute(text(f"DELETE FROM tag_daily_rollup WHERE \"userId\" = '{WRITE_USER}'"))
+        conn.execute(text(f"DELETE FROM user_tag_usage WHERE \"userId\" = '{WRITE_USER}'"))
+        conn.execute(text(f"DELETE FROM user_content_usage WHERE \"userId\" = '{WRITE_USER}'"))
+        conn.execute(text(f"DELETE FROM practice_tag_association WHERE practice_detail_id IN (SELECT id FROM practice_details WHERE \"recordId\" IN ({written}))"))
+        conn.execute(text(f"DELETE FROM practice_details WHERE \"recordId\" IN ({written})"))
+        conn.execute(text(f"DELETE FROM records WHERE \"userId\" = '{WRITE_USER}'"))
+
+async def main_async(args) -> dict:
+    results = {}
+    try:
+        for concurrency in args.concurrency:
+            results[f"per_request c={concurrency}"] = await run(create_per_request, concurrency, args.duration)
+
+            batcher = write_batcher.WriteBatcher(args.max_size, args.max_delay_ms)
+            batches_before = write_batcher.events["batches"]
+            results[f"batched c={concurrency}"] = await run(batcher.submit, concurrency, args.duration)
+            await batcher.close()
+            batches = write_batcher.events["batches"] - batches_before
+            print(f"c={concurrency}: {batches} group commit(s), {results[f'batched c={concurrency}']['count'] / max(batches, 1):.1f} record(s) per commit")
+    finally:
+        await dispose_engines()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--duration", type=float, default=10, help="各条件で計測する秒数")
+    parser.add_argument("--max-size", type=int, default=write_batcher.WRITE_BATCH_MAX_SIZE)
+    parser.add_argument("--max-delay-ms", type=float, default=write_batcher.WRITE_BATCH_MAX_DELAY_MS)
+    parser.add_argument("--output", help="結果のJSONの保存先（省略時は benchmarks/results/ 以下）")
+    args = parser.parse_args()
+
+    try:
+        results = asyncio.run(main_async(args))
+    finally:
+        cleanup()
+    report.print_table(results)
+    print(report.save_results("write_batching", vars(args), results, args.output))
+
+if __name__ == "__main__":
+    main()
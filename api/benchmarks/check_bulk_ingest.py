@@ -0,0 +1,91 @@
+# POST /records/bulk で取り込んだレコードが、1件ずつの POST /records/ と同じ値で保存されることを確認する
+# 空の description・content、\N や引用符・改行を含む文字列を JSON / NDJSON / CSV のそれぞれで取り込み、
+# DB に NULL ではなく元の文字列が保存されていなければ失敗(終了コード1)する
+# bulk-check のレコードを 2031年5月に作り、終了時に削除する。検証用のデータベースに対して実行すること
+# 使い方: cd api && python -m benchmarks.check_bulk_ingest
+#         cd api && DB_BACKEND=async python -m benchmarks.check_bulk_ingest
+import csv
+import io
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "practice_record_api"))
+os.environ["CACHE_BACKEND"] = "none"
+
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+import main
+import models
+
+USER_ID = "bulk-check"
+
+DESCRIPTIONS = ["", "\\N", 'say "hi"', "line 1\nline 2", "plain"]
+
+def _record(day: int, description: str) -> dict:
+    return {
+        "description": description, "date": f"2031-05-{day:02d}", "startTime": "10", "startMinute": "00", "endTime": "11", "endMinute": "30",
+        "userId": USER_ID, "practiceDetails": [{"content": "", "tags": [{"name": "bulk-check-tag"}]}, {"content": description, "tags": []}],
+    }
+
+def _csv_body(rows: list) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(list(rows[0]))
+    for row in rows:
+        writer.writerow([json.dumps(value, ensure_ascii=False) if key == "practiceDetails" else value for key, value in row.items()])
+    return buffer.getvalue()
+
+def _stored(day: int) -> tuple:
+    # (description, [content, ...]) を NULL は None のまま読む
+    with models.engine.connect() as conn:
+        description = conn.execute(
+            text("SELECT description FROM records WHERE \"userId\" = :user_id AND date = :date"), {"user_id": USER_ID, "date": f"2031-05-{day:02d}"}
+        ).scalar_one()
+        contents = conn.execute(text(
+            "SELECT pd.content FROM practice_details pd JOIN records r ON r.id = pd.\"recordId\" "
+            "WHERE r.\"userId\" = :user_id AND r.date = :date ORDER BY pd.id"
+        ), {"user_id": USER_ID, "date": f"2031-05-{day:02d}"}).scalars().all()
+    return description, contents
+
+def check(client: TestClient) -> list:
+    failures = []
+    formats = {
+        "application/json": lambda rows: json.dumps(rows, ensure_ascii=False),
+        "application/x-ndjson": lambda rows: "\n".join(json.dumps(row, ensure_ascii=False) for row in rows),
+        "text/csv": _csv_body,
+    }
+    day = 1
+    for content_type, encode in formats.items():
+        rows = []
+        for description in DESCRIPTIONS:
+            rows.append(_record(day, description))
+            day += 1
+        response = client.post("/records/bulk", content=encode(rows).encode("utf-8"), headers={"content-type": content_type})
+        if response.status_code != 200 or response.json()["errors"]:
+            failures.append(f"{content_type}: {response.status_code} {response.text}")
+            continue
+        for row in rows:
+            expected = (row["description"], [detail["content"] for detail in row["practiceDetails"]])
+            stored = _stored(int(row["date"][-2:]))
+            if stored != expected:
+                failures.append(f"{content_type}: stored {stored!r}, expected {expected!r}")
+    return failures
+
+def main_():
+    with TestClient(main.app) as client:
+        try:
+            failures = check(client)
+        finally:
+            client.delete("/records/", params={"userId": USER_ID, "start_date": "2031-05-01", "end_date": "2031-05-31"})
+
+    for failure in failures:
+        print(failure)
+    if failures:
+        print(f"\n{len(failures)} bulk ingest mismatch(es)")
+        sys.exit(1)
+    print("ok")
+
+if __name__ == "__main__":
+    main_()
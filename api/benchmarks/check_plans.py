@@ -0,0 +1,162 @@
+# 各エンドポイントが発行するSQLを EXPLAIN し、主要テーブルでシーケンシャルスキャンに
+# なっているプランがあれば失敗(終了コード1)する
+# DB_* 環境変数の接続先にデータを投入するため、検証用のデータベースに対して実行すること
+# 使い方: cd api && python -m benchmarks.check_plans --users 200 --records-per-user 300
+import argparse
+import datetime
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "practice_record_api"))
+os.environ["DB_BACKEND"] = "sync"  # 発行されたSQLを psycopg2 の形式で取得するため同期バックエンドを使う
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event, text
+
+import main
+import models
+import partitions
+import tag_arrays
+
+# シーケンシャルスキャンを許容しないテーブル（tags は小さいので対象外）
+CHECKED_TABLES = {"records", "practice_details", "practice_tag_association"}
+
+USER_PREFIX = "plan-check-"
+
+SEED_SQL = [
+    """
+    INSERT INTO tags (name)
+    SELECT 'plan-check-tag-' || g FROM generate_series(1, 300) g
+    ON CONFLICT (name) DO NOTHING
+    """,
+    """
+    INSERT INTO records (description, date, "startTime", "startMinute", "endTime", "endMinute", "userId")
+    SELECT 'plan check ' || r, date '2015-01-01' + (r * 7 + u) % 3650, '10', '00', '11', '30', 'plan-check-' || u
+    FROM generate_series(1, :users) u, generate_series(1, :records) r
+    """,
+    """
+    INSERT INTO practice_details ("recordId", content)
+    SELECT r.id, 'content-' || ((r.id + d) % 20)
+    FROM records r, generate_series(1, 3) d
+    WHERE r."userId" LIKE 'plan-check-%'
+    """,
+    """
+    INSERT INTO practice_tag_association (practice_detail_id, tag_id)
+    SELECT DISTINCT pd.id, t.id
+    FROM practice_details pd
+    JOIN records r ON r.id = pd."recordId" AND r."userId" LIKE 'plan-check-%'
+    CROSS JOIN generate_series(1, 3) k
+    JOIN tags t ON t.name = 'plan-check-tag-' || (1 + (pd.id * 7 + k * 13) % 300)
+    ON CONFLICT DO NOTHING
+    """,
+]
+
+def seed(users: int, records: int):
+    # 投入する期間（2015年から10年分）の月のパーティションを先に作っておく
+    with models.SessionLocal() as db:
+        partitions.create_partitions(db, (partitions.add_months(datetime.date(2015, 1, 1), offset) for offset in range(120)))
+    with models.engine.begin() as conn:
+        exists = conn.execute(text('SELECT 1 FROM records WHERE "userId" LIKE \'plan-check-%\' LIMIT 1')).first()
+        if exists is None:
+            for statement in SEED_SQL:
+                conn.execute(text(statement), {"users": users, "records": records})
+            tag_arrays.refresh_details_sql(conn, 'SELECT pd.id FROM practice_details pd JOIN records r ON r.id = pd."recordId" AND r."userId" LIKE \'plan-check-%\'')
+    with models.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("ANALYZE"))
+
+def capture_statements(client: TestClient) -> dict:
+    # 各エンドポイントを呼び出し、発行された (SQL, パラメータ) をエンドポイントごとに集める
+    user_id = f"{USER_PREFIX}1"
+    with models.engine.connect() as conn:
+        record_id, record_date = conn.execute(
+            text('SELECT id, date FROM records WHERE "userId" = :u ORDER BY date DESC LIMIT 1'), {"u": user_id}
+        ).one()
+    week_start = record_date.date() - datetime.timedelta(days=7)
+    record = client.get(f"/records/{record_id}", params={"userId": user_id}).json()
+
+    requests_by_endpoint = {
+        "GET /records/{year}/{month}": lambda: client.get(f"/records/{record_date.year}/{record_date.month}", params={"userId": user_id}),
+        "GET /records/{record_id}": lambda: client.get(f"/records/{record_id}", params={"userId": user_id}),
+        "PUT /records/{record_id}": lambda: client.put(f"/records/{record_id}", json=dict(record, description="plan check updated")),
+        "GET /analysis_tag": lambda: client.get("/analysis_tag", params={"userId": user_id, "start_date": week_start, "end_date": record_date.date()}),
+        "GET /analysis_detail": lambda: client.get("/analysis_detail", params={"userId": user_id, "start_date": week_start, "end_date": record_date.date(), "tag_names": ["plan-check-tag-1"]}),
+        "GET /analysis_detail?description": lambda: client.get("/analysis_detail", params={"userId": user_id, "description": "check 12", "limit": 100}),
+        "GET /analysis_duration": lambda: client.get("/analysis_duration", params={"userId": user_id, "group_by": "week", "start_date": week_start, "end_date": record_date.date()}),
+        "GET /search": lambda: client.get("/search", params={"q": "check 12", "userId": user_id}),
+        "DELETE /records/{record_id}": lambda: client.delete(f"/records/{record_id}", params={"userId": user_id}),
+    }
+
+    captured = {}
+    current = []
+
+    @event.listens_for(models.engine, "before_cursor_execute")
+    def collect(conn, cursor, statement, parameters, context, executemany):
+        if not executemany:
+            current.append((statement, parameters))
+
+    for endpoint, send in requests_by_endpoint.items():
+        current.clear()
+        response = send()
+        if response.status_code >= 400:
+            raise RuntimeError(f"{endpoint}: {response.status_code} {response.text}")
+        captured[endpoint] = list(current)
+
+    event.remove(models.engine, "before_cursor_execute", collect)
+    return captured
+
+# records のパーティションのうち、このページ数以下のもの（データの少ない月）はシーケンシャルスキャンの方が安いので対象外
+SMALL_PARTITION_PAGES = 8
+
+def table_name(relation: str) -> str:
+    # records のパーティション（records_y2024m01, records_default）は records として扱う
+    return "records" if relation.startswith("records_") else relation
+
+def find_seq_scans(plan: dict, small_partitions: set) -> list:
+    found = []
+    relation = plan.get("Relation Name", "")
+    if plan.get("Node Type") == "Seq Scan" and table_name(relation) in CHECKED_TABLES and relation not in small_partitions:
+        found.append(relation)
+    for child in plan.get("Plans", []):
+        found.extend(find_seq_scans(child, small_partitions))
+    return found
+
+def main_():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--records-per-user", type=int, default=300)
+    args = parser.parse_args()
+
+    seed(args.users, args.records_per_user)
+    with TestClient(main.app) as client:
+        captured = capture_statements(client)
+
+    failures = []
+    raw = models.engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = 'records'::regclass AND c.relpages <= %s",
+            (SMALL_PARTITION_PAGES,)
+        )
+        small_partitions = {name for name, in cursor.fetchall()}
+        for endpoint, statements in captured.items():
+            for statement, parameters in statements:
+                if not statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE", "INSERT", "WITH")):
+                    continue
+                cursor.execute("EXPLAIN (FORMAT JSON) " + statement, parameters)
+                plan = cursor.fetchone()[0][0]["Plan"]
+                scans = find_seq_scans(plan, small_partitions)
+                status = "SEQ SCAN on " + ", ".join(scans) if scans else "ok"
+                print(f"{endpoint:32} {status:40} {' '.join(statement.split())[:80]}")
+                if scans:
+                    failures.append((endpoint, statement))
+        raw.rollback()
+    finally:
+        raw.close()
+
+    if failures:
+        print(f"\n{len(failures)} statement(s) fell back to a sequential scan")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main_()
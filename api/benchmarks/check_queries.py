@@ -0,0 +1,101 @@
+# 主要なエンドポイントが1リクエストで発行するSQLの件数を数え、上限を超えたら失敗(終了コード1)する
+# 詳細・タグの少ないレコードと多いレコード、レコードの少ない月と多い月のどちらも上限に収まることを確かめ、
+# 件数に比例してクエリが増える（N+1）退行を検出する（多い方は詳細8件・タグ32個なので、行ごとに1回でも問い合わせれば上限を超える）
+# レスポンスキャッシュとタグのキャッシュは使わず、毎回DBに問い合わせる場合の件数を数える
+# query-check のレコードを 2031年3月・4月に作り、終了時に削除する。検証用のデータベースに対して実行すること
+# 使い方: cd api && python -m benchmarks.check_queries
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "practice_record_api"))
+os.environ["DB_BACKEND"] = "sync"  # 発行されたSQLを同期エンジンのイベントで数えるため
+os.environ["CACHE_BACKEND"] = "none"
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+import main
+import models
+from tag_cache import tag_cache
+
+USER_ID = "query-check"
+
+# エンドポイントごとの1リクエストあたりのSQLの上限（データによって省かれる文があるので、実際の件数はこれ以下になる）
+MAX_STATEMENTS = {
+    # records + practice_details + tags
+    "GET /records/{year}/{month}": 3,
+    "GET /records/{record_id}": 3,
+    # records + tags(作成 + 既存の参照) + practice_details + 関連付け + タグ集計 + 使用回数(タグ・内容)
+    "POST /records/": 8,
+    # ロード3 + tags2 + 詳細の更新 + 関連付けの削除・追加 + 詳細の削除 + 詳細・関連付けの追加
+    # + タグ集計・使用回数(タグ・内容)のそれぞれ差分の反映と0件の行の削除
+    "PUT /records/{record_id}": 17,
+}
+
+def _record(date: str, details: int, tags: int) -> dict:
+    return {
+        "description": "query check", "date": date, "startTime": "10", "startMinute": "00", "endTime": "11", "endMinute": "30", "userId": USER_ID,
+        "practiceDetails": [
+            {"content": f"content-{d}", "tags": [{"name": f"query-check-tag-{d}-{t}"} for t in range(tags)]}
+            for d in range(details)
+        ],
+    }
+
+def count_statements(client: TestClient) -> dict:
+    # (エンドポイント, データの大きさ) -> 発行されたSQLの件数
+    counts = {}
+    current = []
+
+    def collect(conn, cursor, statement, parameters, context, executemany):
+        current.append(statement)
+
+    def measure(endpoint: str, size: str, send):
+        # タグをDBから解決する場合（キャッシュのミス）の件数を数える
+        tag_cache.clear()
+        current.clear()
+        response = send()
+        if response.status_code >= 400:
+            raise RuntimeError(f"{endpoint}: {response.status_code} {response.text}")
+        counts[(endpoint, size)] = len(current)
+        return response
+
+    event.listen(models.engine, "before_cursor_execute", collect)
+    try:
+        ids = {}
+        for size, date, details, tags in [("small", "2031-03-01", 1, 1), ("large", "2031-04-01", 8, 4)]:
+            response = measure("POST /records/", size, lambda: client.post("/records/", json=_record(date, details, tags)))
+            ids[size] = response.json()["id"]
+        # 4月はレコードを増やしておく
+        for day in range(2, 12):
+            client.post("/records/", json=_record(f"2031-04-{day:02d}", 4, 2))
+
+        for size, month in [("small", 3), ("large", 4)]:
+            measure("GET /records/{year}/{month}", size, lambda: client.get(f"/records/2031/{month}", params={"userId": USER_ID}))
+        for size, record_id in ids.items():
+            measure("GET /records/{record_id}", size, lambda: client.get(f"/records/{record_id}", params={"userId": USER_ID}))
+        # 内容とタグを入れ替え、詳細の追加・削除も含む更新
+        for size, record_id, date, details, tags in [("small", ids["small"], "2031-03-01", 2, 2), ("large", ids["large"], "2031-04-01", 5, 6)]:
+            measure("PUT /records/{record_id}", size, lambda: client.put(f"/records/{record_id}", json=_record(date, details, tags)))
+    finally:
+        event.remove(models.engine, "before_cursor_execute", collect)
+        client.delete("/records/", params={"userId": USER_ID, "start_date": "2031-03-01", "end_date": "2031-04-30"})
+    return counts
+
+def main_():
+    with TestClient(main.app) as client:
+        counts = count_statements(client)
+
+    failures = []
+    for endpoint, limit in MAX_STATEMENTS.items():
+        small, large = counts[(endpoint, "small")], counts[(endpoint, "large")]
+        status = f"over the limit of {limit}" if max(small, large) > limit else "ok"
+        print(f"{endpoint:32} small={small:<3} large={large:<3} {status}")
+        if status != "ok":
+            failures.append(endpoint)
+
+    if failures:
+        print(f"\n{len(failures)} endpoint(s) issued more statements than allowed")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main_()
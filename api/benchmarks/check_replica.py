@@ -0,0 +1,139 @@
+# 読み取りのレプリカへの振り分けを確認する（プライマリとレプリカの2つのPostgresに対して実行する）
+#   1. 書き込みはプライマリで行われ、レプリカにはSQLが発行されない
+#   2. 書き込み直後（DB_READ_YOUR_WRITES_SECONDS の間）はそのユーザーの読み取りがプライマリで行われ、書き込みが見える
+#   3. それ以外の読み取りはレプリカで行われる
+#   4. レプリカに接続できない場合は、読み取りがプライマリで行われる
+#   5. クエリを発行しない読み取りのセッション（レスポンスキャッシュのヒットなど）はレプリカに接続しない
+# 問題があれば失敗(終了コード1)する。どちらのデータベースにもスキーマが作成済みであること
+# 検証用のレコードはプライマリに作られ、最後に削除される
+# 使い方: cd api && DB_REPLICA_HOST=localhost DB_REPLICA_PORT=5433 python -m benchmarks.check_replica
+import argparse
+import asyncio
+import datetime
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "practice_record_api"))
+os.environ.setdefault("DB_READ_YOUR_WRITES_SECONDS", "1")
+os.environ.setdefault("DB_REPLICA_RETRY_SECONDS", "1")
+os.environ["CACHE_BACKEND"] = "none"  # キャッシュを通さず、毎回データベースから読む
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import database
+import main
+import models
+
+def count_statements(engine) -> list:
+    # engine で発行されたSQLの件数を数える（リストの要素数）
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    return statements
+
+def routed(fn) -> dict:
+    # fn の実行中に増えた振り分け先ごとの件数
+    before = dict(database.read_routes)
+    fn()
+    return {route: count - before[route] for route, count in database.read_routes.items() if count != before[route]}
+
+def main_():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--user-id", default=f"replica-check-{uuid.uuid4().hex[:8]}")
+    args = parser.parse_args()
+
+    if models.replica_engine is None:
+        sys.exit("DB_REPLICA_HOST is not set")
+    window = database.READ_YOUR_WRITES_SECONDS
+    retry = database.REPLICA_RETRY_SECONDS
+
+    failures = []
+
+    def check(name: str, ok: bool, detail=""):
+        print(f"{name:60} {'ok' if ok else 'FAILED'} {detail}")
+        if not ok:
+            failures.append(name)
+
+    today = datetime.date.today()
+    month_path = f"/records/{today.year}/{today.month}"
+    params = {"userId": args.user_id}
+    body = {
+        "description": "replica check", "date": today.isoformat(),
+        "startTime": "10", "startMinute": "00", "endTime": "11", "endMinute": "00",
+        "userId": args.user_id, "practiceDetails": [{"content": "replica check", "tags": [{"name": "replica-check"}]}],
+    }
+    replica_statements = count_statements(models.async_replica_engine.sync_engine if models.async_replica_engine else models.replica_engine)
+
+    with TestClient(main.app) as client:
+        try:
+            # 1. 書き込みはプライマリ
+            replica_statements.clear()
+            client.post("/records/", json=body).raise_for_status()
+            check("write does not touch the replica", not replica_statements, f"{len(replica_statements)} statement(s)")
+
+            # 2. 書き込み直後の本人の読み取りはプライマリ
+            response = {}
+            routes = routed(lambda: response.update(records=client.get(month_path, params=params).json()))
+            check("read right after a write goes to the primary", routes == {"read_your_writes": 1}, routes)
+            check("the write is visible to its author", any(r["description"] == "replica check" for r in response["records"]))
+
+            # 他のユーザーの読み取りはレプリカ
+            routes = routed(lambda: client.get(month_path, params={"userId": args.user_id + "-other"}).raise_for_status())
+            check("other users read from the replica", routes == {"replica": 1}, routes)
+
+            # 3. 期間が過ぎれば本人の読み取りもレプリカ
+            time.sleep(window + 0.1)
+            routes = routed(lambda: client.get(month_path, params=params).raise_for_status())
+            check("read after the window goes to the replica", routes == {"replica": 1}, routes)
+
+            # 4. レプリカに接続できない場合（接続先を使われていないポートに差し替える）
+            if models.AsyncReplicaSessionLocal is not None:
+                factory, dead_engine = models.AsyncReplicaSessionLocal, create_async_engine("postgresql+asyncpg://nobody@127.0.0.1:1/none")
+            else:
+                factory, dead_engine = models.ReplicaSessionLocal, create_engine("postgresql://nobody@127.0.0.1:1/none")
+            replica_bind = factory.kw["bind"]
+            factory.configure(bind=dead_engine)
+            try:
+                routes = routed(lambda: client.get(month_path, params=params).raise_for_status())
+                check("read falls back to the primary when the replica is down", routes == {"fallback": 1}, routes)
+                routes = routed(lambda: client.get(month_path, params=params).raise_for_status())
+                check("replica is not retried within the retry interval", routes == {"fallback": 1}, routes)
+            finally:
+                factory.configure(bind=replica_bind)
+
+            time.sleep(retry + 0.1)
+            routes = routed(lambda: client.get(month_path, params=params).raise_for_status())
+            check("replica is used again after the retry interval", routes == {"replica": 1}, routes)
+
+            # 5. 開いて閉じるだけのセッションは接続しない
+            checkouts = []
+            replica_pool = (models.async_replica_engine.sync_engine if models.async_replica_engine else models.replica_engine).pool
+
+            def count_checkout(*args):
+                checkouts.append(1)
+
+            async def open_and_close():
+                db = await database.open_read_session(args.user_id + "-other")
+                await database._close(db)
+
+            event.listen(replica_pool, "checkout", count_checkout)
+            try:
+                routes = routed(lambda: asyncio.run(open_and_close()))
+            finally:
+                event.remove(replica_pool, "checkout", count_checkout)
+            check("an unused read session does not connect to the replica", not checkouts and not routes, f"{len(checkouts)} checkout(s) {routes}")
+        finally:
+            # 検証用のレコードを削除する（プライマリで本人として読む）
+            asyncio.run(database.note_writes([args.user_id]))
+            for record in client.get(month_path, params=params).json():
+                client.delete(f"/records/{record['id']}", params=params)
+
+    if failures:
+        print(f"\n{len(failures)} check(s) failed")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,49 @@
+# 2つのベンチマーク結果（report.save_results のJSON）を比較し、悪化したケースがあれば失敗(終了コード1)する
+# 使い方: cd api && python -m benchmarks.compare benchmarks/results/micro-abc1234-....json benchmarks/results/micro-def5678-....json
+#         cd api && python -m benchmarks.compare base.json head.json --metric p95_ms --threshold 0.15
+import argparse
+import json
+import sys
+
+def compare(base: dict, head: dict, metric: str, threshold: float, min_delta_ms: float) -> list:
+    # (名前, 基準値, 比較値, 変化率, 悪化したか) のリスト
+    rows = []
+    for name, head_summary in head["results"].items():
+        base_summary = base["results"].get(name)
+        if base_summary is None or not base_summary.get(metric):
+            continue
+        before, after = base_summary[metric], head_summary[metric]
+        change = (after - before) / before
+        # 実行ごとの揺らぎで誤検知しないよう、割合と絶対値の両方が閾値を超えた場合だけ悪化とみなす
+        regressed = change > threshold and after - before > min_delta_ms
+        if head_summary.get("errors", 0) > base_summary.get("errors", 0):
+            regressed = True
+        rows.append((name, before, after, change, regressed))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--metric", default="p95_ms", choices=["mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms"])
+    parser.add_argument("--threshold", type=float, default=0.10, help="悪化とみなす増加率（0.10 = 10%%）")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="悪化とみなす増加量の下限(ミリ秒)")
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+
+    print(f"{base['benchmark']}: {base['revision']} -> {head['revision']} ({args.metric})")
+    rows = compare(base, head, args.metric, args.threshold, args.min_delta_ms)
+    for name, before, after, change, regressed in rows:
+        print(f"{name:40} {before:>10.2f} {after:>10.2f} {change * 100:>+8.1f}%{'  REGRESSION' if regressed else ''}")
+
+    regressions = [row for row in rows if row[4]]
+    if regressions:
+        print(f"\n{len(regressions)} regression(s)")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
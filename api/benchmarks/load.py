@@ -0,0 +1,163 @@
+# 起動中のAPIサーバーに並行してリクエストを送り、ルートごとのスループットと p50/p95/p99 を計測する
+# 事前に benchmarks.seed でデータを投入しておくこと（ユーザーIDと期間は seed の既定値に合わせている）
+# --write-ratio を指定すると bench-load-writer のレコードが 2030年1月に作られて残るので、検証用のデータベースで実行すること
+# 使い方: cd api && python -m benchmarks.load --base-url http://localhost:8000 --concurrency 16 --duration 30
+#         cd api && python -m benchmarks.load --mix month=5,record=3,analysis_tag=1 --write-ratio 0.1
+import argparse
+import datetime
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks import report
+from benchmarks.seed import TAG_PREFIX, user_id
+
+WRITE_USER = "bench-load-writer"
+
+DEFAULT_MIX = "month=6,record=2,analysis_tag=1,analysis_detail=1,search=1"
+
+def _random_day(rng: random.Random, args) -> datetime.date:
+    start = datetime.date(args.end_year - args.years + 1, 1, 1)
+    return start + datetime.timedelta(days=rng.randrange(365 * args.years))
+
+def _payload(rng: random.Random) -> dict:
+    return {
+        "description": f"load benchmark {rng.randint(0, 999)}",
+        "date": f"2030-01-{rng.randint(1, 28):02d}",
+        "startTime": "10", "startMinute": "00", "endTime": "11", "endMinute": "30",
+        "userId": WRITE_USER,
+        "practiceDetails": [
+            {"content": f"content-{rng.randint(0, 20):03d}", "tags": [{"name": f"{TAG_PREFIX}{rng.randint(0, 50):04d}"} for _ in range(rng.randint(1, 3))]}
+            for _ in range(rng.randint(1, 4))
+        ],
+    }
+
+def collect_records(args, count: int = 500) -> list:
+    # GET /records/{record_id} 用に、月表示から実在する (id, userId) を集める
+    rng = random.Random(args.seed)
+    session = requests.Session()
+    found = []
+    for _ in range(count):
+        day = _random_day(rng, args)
+        uid = user_id(rng.randrange(args.users))
+        response = session.get(f"{args.base_url}/records/{day.year}/{day.month}", params={"userId": uid}, timeout=args.timeout)
+        response.raise_for_status()
+        found.extend((record["id"], uid) for record in response.json())
+        if len(found) >= count:
+            break
+    if not found:
+        raise SystemExit("no records found; run python -m benchmarks.seed first")
+    return found
+
+def make_requests(args, known_records: list):
+    # ルート名 -> (rng -> (メソッド, パス, パラメータ, JSON)) を返す
+    def month(rng):
+        day = _random_day(rng, args)
+        return "GET", f"/records/{day.year}/{day.month}", {"userId": user_id(rng.randrange(args.users))}, None
+
+    def record(rng):
+        record_id, uid = rng.choice(known_records)
+        return "GET", f"/records/{record_id}", {"userId": uid}, None
+
+    def analysis_tag(rng):
+        day = _random_day(rng, args)
+        return "GET", "/analysis_tag", {"userId": user_id(rng.randrange(args.users)), "start_date": (day - datetime.timedelta(days=30)).isoformat(), "end_date": day.isoformat()}, None
+
+    def analysis_detail(rng):
+        day = _random_day(rng, args)
+        return "GET", "/analysis_detail", {
+            "userId": user_id(rng.randrange(args.users)),
+            "start_date": (day - datetime.timedelta(days=30)).isoformat(), "end_date": day.isoformat(),
+            "tag_names": [f"{TAG_PREFIX}{rng.randrange(20):04d}"], "limit": 100,
+        }, None
+
+    def search(rng):
+        return "GET", "/search", {"q": rng.choice(["sonata", "arpeggio tempo", "アルペジオ", "暗譜"]), "userId": user_id(rng.randrange(args.users))}, None
+
+    def create(rng):
+        return "POST", "/records/", None, _payload(rng)
+
+    return {"month": month, "record": record, "analysis_tag": analysis_tag, "analysis_detail": analysis_detail, "search": search, "create": create}
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+def run(args) -> dict:
+    builders = make_requests(args, collect_records(args))
+    weights = parse_mix(args.mix)
+    if args.write_ratio:
+        # 書き込みの割合を読み取りの合計に対する比率で指定する
+        weights["create"] = sum(weights.values()) * args.write_ratio / (1 - args.write_ratio)
+    unknown = set(weights) - set(builders)
+    if unknown:
+        raise SystemExit(f"unknown routes in --mix: {', '.join(sorted(unknown))}")
+    names = list(weights)
+    cumulative_weights = [sum(weights[name] for name in names[:i + 1]) for i in range(len(names))]
+
+    samples = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.warmup + args.duration
+    measure_from = time.perf_counter() + args.warmup
+
+    def worker(index: int):
+        rng = random.Random(args.seed * 1000 + index)
+        session = requests.Session()
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                return
+            name = rng.choices(names, cum_weights=cumulative_weights)[0]
+            method, path, params, body = builders[name](rng)
+            started = time.perf_counter()
+            try:
+                response = session.request(method, args.base_url + path, params=params, json=body, timeout=args.timeout)
+                failed = response.status_code >= 400
+            except requests.RequestException:
+                failed = True
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if started < measure_from:
+                continue
+            with lock:
+                if failed:
+                    errors[name] += 1
+                else:
+                    samples[name].append(elapsed_ms)
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(worker, range(args.concurrency)))
+
+    results = {name: report.summarize(samples[name], args.duration, errors[name]) for name in names}
+    results["all"] = report.summarize([s for name in names for s in samples[name]], args.duration, sum(errors.values()))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30, help="計測する秒数")
+    parser.add_argument("--warmup", type=float, default=5, help="計測前に捨てる秒数")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="ルート名=重み のカンマ区切り")
+    parser.add_argument("--write-ratio", type=float, default=0.0, help="POST /records/ の割合（0..1）")
+    parser.add_argument("--users", type=int, default=50, help="seed --users と同じ値")
+    parser.add_argument("--years", type=int, default=3, help="seed --years と同じ値")
+    parser.add_argument("--end-year", type=int, default=2025, help="seed --end-year と同じ値")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="結果のJSONの保存先（省略時は benchmarks/results/ 以下）")
+    args = parser.parse_args()
+
+    results = run(args)
+    report.print_table(results)
+    print(report.save_results("load", vars(args), results, args.output))
+
+if __name__ == "__main__":
+    main()
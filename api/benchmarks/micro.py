@@ -0,0 +1,183 @@
+# 各エンドポイントの処理（crud / analysis / search の関数）を直接呼び出して計測する
+# HTTP・レスポンスキャッシュを通さないので、DBアクセスとモデル変換のコストだけを比較できる
+# 事前に benchmarks.seed でデータを投入しておくこと
+# 使い方: cd api && python -m benchmarks.micro --iterations 200
+#         cd api && python -m benchmarks.micro --only month analysis_tag
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "practice_record_api"))
+os.environ.setdefault("DB_BACKEND", "sync")
+
+from sqlalchemy import text
+
+import models
+import crud
+import analysis
+import calendar_summary
+import search
+import suggest
+from schemas import CreateRecordModel
+
+from benchmarks import report
+from benchmarks.seed import USER_PREFIX, TAG_PREFIX
+
+WRITE_USER = "bench-micro-writer"
+
+def _month_range(day: datetime.date):
+    start = day.replace(day=1)
+    end = (start + datetime.timedelta(days=32)).replace(day=1) - datetime.timedelta(days=1)
+    return start, end
+
+def _payload(rng: random.Random, day: datetime.date) -> CreateRecordModel:
+    return CreateRecordModel(
+        description=f"micro benchmark {rng.randint(0, 999)}",
+        date=day, startTime="10", startMinute="00", endTime="11", endMinute="30", userId=WRITE_USER,
+        practiceDetails=[
+            {"content": f"content-{rng.randint(0, 20):03d}", "tags": [{"name": f"{TAG_PREFIX}{rng.randint(0, 50):04d}"} for _ in range(rng.randint(1, 3))]}
+            for _ in range(rng.randint(1, 4))
+        ],
+    )
+
+def build_cases(db, rng: random.Random):
+    # (名前 -> 呼び出しごとに引数を変える関数) と、書き込んだレコードを片付ける関数を返す
+    samples = db.execute(text(
+        'SELECT id, "userId", date FROM records WHERE "userId" LIKE :prefix ORDER BY id'
+    ), {"prefix": USER_PREFIX + "%"}).all()
+    if not samples:
+        sys.exit("no seed data; run python -m benchmarks.seed first")
+    tags = [f"{TAG_PREFIX}{i:04d}" for i in range(20)]
+    created = []
+
+    def month():
+        _, user_id, day = rng.choice(samples)
+        start, end = _month_range(day.date())
+        crud.get_records_between(db, user_id, start, end)
+
+    def record():
+        record_id, user_id, _ = rng.choice(samples)
+        crud.get_record(db, record_id, user_id)
+
+    def year_months():
+        # 年間カレンダーを月表示12回で描く場合
+        _, user_id, day = rng.choice(samples)
+        for month in range(1, 13):
+            start, end = _month_range(datetime.date(day.year, month, 1))
+            crud.get_records_between(db, user_id, start, end)
+
+    def year_summary():
+        _, user_id, day = rng.choice(samples)
+        calendar_summary.day_summary(db, user_id, datetime.date(day.year, 1, 1), datetime.date(day.year, 12, 31))
+
+    def analysis_tag():
+        _, user_id, day = rng.choice(samples)
+        analysis.tag_counts(db, user_id, day.date() - datetime.timedelta(days=30), day.date(), None, None, None)
+
+    def analysis_tag_description():
+        _, user_id, _ = rng.choice(samples)
+        analysis.tag_counts(db, user_id, None, None, None, None, rng.choice(["sonata", "音階", "chord", "暗譜"]))
+
+    def analysis_detail_page():
+        _, user_id, day = rng.choice(samples)
+        analysis.detail_page(db, user_id, day.date() - datetime.timedelta(days=30), day.date(), None, rng.sample(tags, 2), None, "or", None, 100)
+
+    def analysis_duration():
+        _, user_id, day = rng.choice(samples)
+        analysis.duration_summary(db, user_id, rng.choice(["tag", "content", "week"]), day.date() - datetime.timedelta(days=90), day.date(), None, None, None)
+
+    def search_records():
+        _, user_id, _ = rng.choice(samples)
+        search.search_records(db, rng.choice(["sonata", "arpeggio tempo", "アルペジオ", "暗譜"]), user_id, 20)
+
+    def suggest_tags():
+        # キャッシュを通さない候補の読み込み（入力の1文字目・キャッシュのミス時）
+        _, user_id, _ = rng.choice(samples)
+        suggest.tag_candidates(db, user_id, TAG_PREFIX[:rng.randint(1, len(TAG_PREFIX))], suggest.SUGGEST_CANDIDATES + 1)
+
+    def suggest_contents():
+        _, user_id, _ = rng.choice(samples)
+        suggest.content_candidates(db, user_id, "content-"[:rng.randint(1, 8)], suggest.SUGGEST_CANDIDATES + 1)
+
+    def create():
+        created.append(crud.create_record(db, _payload(rng, datetime.date(2030, 1, rng.randint(1, 28)))))
+
+    def update():
+        record_id = rng.choice(created)
+        crud.update_record(db, record_id, _payload(rng, datetime.date(2030, 1, rng.randint(1, 28))))
+
+    def delete():
+        crud.delete_record(db, created.pop(), WRITE_USER)
+
+    def cleanup():
+        while created:
+            delete()
+
+    cases = {
+        "month": month,
+        "record": record,
+        "year_months": year_months,
+        "year_summary": year_summary,
+        "analysis_tag": analysis_tag,
+        "analysis_tag_description": analysis_tag_description,
+        "analysis_detail_page": analysis_detail_page,
+        "analysis_duration": analysis_duration,
+        "search": search_records,
+        "suggest_tags": suggest_tags,
+        "suggest_contents": suggest_contents,
+        # 書き込みは create で作ったレコードを update / delete するので、この順序で実行する
+        "create": create,
+        "update": update,
+        "delete": delete,
+    }
+    return cases, cleanup
+
+def run_case(db, fn, iterations: int, warmup: int) -> dict:
+    for _ in range(warmup):
+        fn()
+        db.rollback()
+    samples = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        call_started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - call_started) * 1000)
+        # 読み取りでもトランザクションを閉じ、セッションに読み込んだオブジェクトを捨てる
+        db.rollback()
+        db.expunge_all()
+    return report.summarize(samples, time.perf_counter() - started)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", nargs="*", help="実行するケース名（省略時はすべて）")
+    parser.add_argument("--output", help="結果のJSONの保存先（省略時は benchmarks/results/ 以下）")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    results = {}
+    with models.SessionLocal() as db:
+        cases, cleanup = build_cases(db, rng)
+        selected = set(args.only or cases)
+        if selected & {"update", "delete"}:
+            selected.add("create")
+        try:
+            for name, fn in cases.items():
+                if name in selected:
+                    # 書き込み系は warmup なし（create と delete の件数を揃えて、作ったレコードを残さない）
+                    warmup = 0 if name in ("create", "update", "delete") else args.warmup
+                    results[name] = run_case(db, fn, args.iterations, warmup)
+        finally:
+            db.rollback()
+            cleanup()
+
+    report.print_table(results)
+    print(report.save_results("micro", vars(args), results, args.output))
+
+if __name__ == "__main__":
+    main()
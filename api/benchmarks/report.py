@@ -0,0 +1,76 @@
+# ベンチマーク結果の集計と保存
+# 結果は benchmarks/results/<名前>-<コミット>-<日時>.json に保存し、compare で別のコミットの結果と比較する
+import datetime
+import json
+import os
+import subprocess
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+def percentile(sorted_samples: Sequence[float], q: float) -> float:
+    # 線形補間による分位点（sorted_samples は昇順）
+    if not sorted_samples:
+        return 0.0
+    position = (len(sorted_samples) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_samples) - 1)
+    return sorted_samples[lower] + (sorted_samples[upper] - sorted_samples[lower]) * (position - lower)
+
+def summarize(samples_ms: List[float], elapsed_seconds: Optional[float] = None, errors: int = 0) -> Dict[str, float]:
+    ordered = sorted(samples_ms)
+    summary = {
+        "count": len(ordered),
+        "errors": errors,
+        "mean_ms": round(sum(ordered) / len(ordered), 3) if ordered else 0.0,
+        "p50_ms": round(percentile(ordered, 0.50), 3),
+        "p95_ms": round(percentile(ordered, 0.95), 3),
+        "p99_ms": round(percentile(ordered, 0.99), 3),
+        "max_ms": round(ordered[-1], 3) if ordered else 0.0,
+    }
+    if elapsed_seconds:
+        summary["throughput_rps"] = round(len(ordered) / elapsed_seconds, 2)
+    return summary
+
+def timed(fn: Callable[[], object], repeat: int, per: float = 1.0) -> Dict[str, float]:
+    # fn を repeat 回呼び出して1回ごとの時間を集計する（per: 1回の時間に掛ける係数。1,000件あたりへの換算など）
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000 * per)
+    return summarize(samples)
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def save_results(name: str, parameters: dict, results: Dict[str, dict], output: Optional[str] = None) -> str:
+    revision = git_revision()
+    created_at = datetime.datetime.now(datetime.timezone.utc)
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{name}-{revision}-{created_at:%Y%m%dT%H%M%S}.json")
+    with open(output, "w") as f:
+        json.dump({
+            "benchmark": name,
+            "revision": revision,
+            "created_at": created_at.isoformat(),
+            "parameters": parameters,
+            "results": results,
+        }, f, ensure_ascii=False, indent=2)
+    return output
+
+def print_table(results: Dict[str, dict]):
+    print(f"{'name':40} {'count':>7} {'err':>5} {'p50':>9} {'p95':>9} {'p99':>9} {'rps':>9}")
+    for name, summary in results.items():
+        print(
+            f"{name:40} {summary['count']:>7} {summary['errors']:>5} {summary['p50_ms']:>9.2f} "
+            f"{summary['p95_ms']:>9.2f} {summary['p99_ms']:>9.2f} {summary.get('throughput_rps', 0):>9.1f}"
+        )
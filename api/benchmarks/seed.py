@@ -0,0 +1,164 @@
+# ベンチマーク用の合成データを投入する（同じ引数なら同じデータになる）
+# ユーザーごとに数年分の練習記録を作り、タグはZipf分布（少数のタグが大半を占める）で割り当てる
+# DB_* 環境変数の接続先にデータを投入するため、検証用のデータベースに対して実行すること
+# 使い方: cd api && python -m benchmarks.seed --users 50 --years 3
+#         cd api && python -m benchmarks.seed --drop   # 投入したデータを削除する
+import argparse
+import csv
+import datetime
+import io
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "practice_record_api"))
+os.environ.setdefault("DB_BACKEND", "sync")
+
+import numpy as np
+from sqlalchemy import text
+
+import models
+import partitions
+import rollup
+import tag_arrays
+import usage
+
+USER_PREFIX = "seed-user-"
+TAG_PREFIX = "seed-tag-"
+
+WORDS = ["scale", "arpeggio", "etude", "sonata", "chord", "rhythm", "sight", "reading", "tempo", "legato",
+         "staccato", "pedal", "octave", "trill", "dynamics", "phrase", "memorize", "metronome", "bach", "chopin",
+         "基礎練習", "音階", "アルペジオ", "ソナタ", "ロングトーン", "リズム", "初見", "暗譜", "合わせ", "本番前"]
+
+def user_id(index: int) -> str:
+    return f"{USER_PREFIX}{index:05d}"
+
+def zipf_indices(rng: np.random.Generator, size: int, vocabulary: int, exponent: float) -> np.ndarray:
+    # 1..vocabulary のZipf分布（numpy の zipf は上限がないので、上限を超えた値は引き直す）
+    values = rng.zipf(exponent, size)
+    overflow = values > vocabulary
+    while overflow.any():
+        values[overflow] = rng.zipf(exponent, overflow.sum())
+        overflow = values > vocabulary
+    return values - 1
+
+def generate(args) -> dict:
+    # records / practice_details / practice_tag_association の行を生成する（IDは0始まりの連番、投入時にずらす）
+    rng = np.random.default_rng(args.seed)
+    # 実行日によってデータが変わらないよう、期間は --end-year で固定する
+    start = datetime.date(args.end_year - args.years + 1, 1, 1)
+    days = (datetime.date(args.end_year + 1, 1, 1) - start).days
+
+    records, details, associations = [], [], []
+    for user in range(args.users):
+        # ユーザーごとに練習頻度を変える
+        practice_days = np.flatnonzero(rng.random(days) < rng.uniform(0.2, args.practice_probability))
+        for offset in practice_days:
+            start_hour = int(rng.integers(6, 21))
+            words = rng.choice(len(WORDS), size=int(rng.integers(1, 4)), replace=False)
+            record_index = len(records)
+            records.append((
+                " ".join(WORDS[w] for w in words),
+                (start + datetime.timedelta(days=int(offset))).isoformat(),
+                str(start_hour), f"{int(rng.choice([0, 15, 30, 45])):02d}",
+                str(min(start_hour + int(rng.integers(1, 3)), 23)), f"{int(rng.choice([0, 15, 30, 45])):02d}",
+                user_id(user),
+            ))
+            detail_count = int(rng.integers(1, args.max_details + 1))
+            contents = zipf_indices(rng, detail_count, args.contents, args.zipf)
+            for content in contents:
+                detail_index = len(details)
+                details.append((record_index, f"content-{content:03d}"))
+                tag_count = int(rng.integers(1, args.max_tags + 1))
+                for tag in sorted(set(zipf_indices(rng, tag_count, args.tags, args.zipf).tolist())):
+                    associations.append((detail_index, tag))
+
+    return {"records": records, "details": details, "associations": associations}
+
+def _copy(cursor, table_and_columns: str, rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table_and_columns} FROM STDIN WITH (FORMAT csv)", buffer)
+
+def _reserve_ids(cursor, table: str, count: int) -> int:
+    # シーケンスから count 個のIDをまとめて確保し、先頭のIDを返す
+    cursor.execute(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), nextval(pg_get_serial_sequence('{table}', 'id')) + %s - 1)", (count,))
+    return cursor.fetchone()[0] - count + 1
+
+def load(data: dict, tags: int):
+    # 投入する期間の月のパーティションを先に作っておく（既定のパーティションに入らないように）
+    with models.SessionLocal() as db:
+        partitions.create_partitions(db, (datetime.date.fromisoformat(row[1]) for row in data["records"]))
+
+    raw = models.engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        cursor.execute(
+            "INSERT INTO tags (name) SELECT %s || lpad(g::text, 4, '0') FROM generate_series(0, %s - 1) g ON CONFLICT (name) DO NOTHING",
+            (TAG_PREFIX, tags)
+        )
+        cursor.execute("SELECT name, id FROM tags WHERE name LIKE %s", (TAG_PREFIX + "%",))
+        tag_ids = {name: tag_id for name, tag_id in cursor.fetchall()}
+
+        record_base = _reserve_ids(cursor, "records", len(data["records"]))
+        detail_base = _reserve_ids(cursor, "practice_details", len(data["details"]))
+        _copy(cursor, 'records (id, description, date, "startTime", "startMinute", "endTime", "endMinute", "userId")',
+              ((record_base + i,) + row for i, row in enumerate(data["records"])))
+        _copy(cursor, 'practice_details (id, "recordId", content)',
+              ((detail_base + i, record_base + record_index, content) for i, (record_index, content) in enumerate(data["details"])))
+        _copy(cursor, "practice_tag_association (practice_detail_id, tag_id)",
+              ((detail_base + detail_index, tag_ids[f"{TAG_PREFIX}{tag:04d}"]) for detail_index, tag in data["associations"]))
+        raw.commit()
+    finally:
+        raw.close()
+
+    with models.SessionLocal() as db:
+        seeded = f"SELECT id FROM records WHERE \"userId\" LIKE '{USER_PREFIX}%'"
+        rollup.add_records_sql(db, seeded)
+        usage.add_records_sql(db, seeded)
+        tag_arrays.refresh_details_sql(db, f"SELECT id FROM practice_details WHERE \"recordId\" IN ({seeded})")
+        db.commit()
+    with models.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("ANALYZE"))
+
+def drop():
+    # 投入したデータを子テーブルから順に削除する（タグは他のデータから参照されている可能性があるので残す）
+    with models.engine.begin() as conn:
+        seeded = f"SELECT id FROM records WHERE \"userId\" LIKE '{USER_PREFIX}%'"
+        conn.execute(text(f"DELETE FROM tag_daily_rollup WHERE \"userId\" LIKE '{USER_PREFIX}%'"))
+        conn.execute(text(f"DELETE FROM user_tag_usage WHERE \"userId\" LIKE '{USER_PREFIX}%'"))
+        conn.execute(text(f"DELETE FROM user_content_usage WHERE \"userId\" LIKE '{USER_PREFIX}%'"))
+        conn.execute(text(f"DELETE FROM practice_tag_association WHERE practice_detail_id IN (SELECT id FROM practice_details WHERE \"recordId\" IN ({seeded}))"))
+        conn.execute(text(f"DELETE FROM practice_details WHERE \"recordId\" IN ({seeded})"))
+        conn.execute(text(f"DELETE FROM records WHERE \"userId\" LIKE '{USER_PREFIX}%'"))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--end-year", type=int, default=2025)
+    parser.add_argument("--practice-probability", type=float, default=0.8, help="練習する日の割合の上限（ユーザーごとに 0.2 からこの値の間で決まる）")
+    parser.add_argument("--max-details", type=int, default=5)
+    parser.add_argument("--max-tags", type=int, default=4)
+    parser.add_argument("--tags", type=int, default=500, help="タグの語彙数")
+    parser.add_argument("--contents", type=int, default=60, help="練習内容の語彙数")
+    parser.add_argument("--zipf", type=float, default=1.3, help="Zipf分布の指数（大きいほど上位のタグに偏る）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--drop", action="store_true", help="投入済みのデータを削除して終了する")
+    args = parser.parse_args()
+
+    if args.drop:
+        drop()
+        return
+
+    with models.engine.connect() as conn:
+        if conn.execute(text(f"SELECT 1 FROM records WHERE \"userId\" LIKE '{USER_PREFIX}%' LIMIT 1")).first() is not None:
+            sys.exit("seed data already exists; run with --drop first")
+
+    data = generate(args)
+    load(data, args.tags)
+    print(json.dumps({name: len(rows) for name, rows in data.items()}))
+
+if __name__ == "__main__":
+    main()
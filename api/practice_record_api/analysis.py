@@ -0,0 +1,265 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import any_, false, func, or_, and_, select, Select
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from models import Record, PracticeDetail, Tag, TagDailyRollup, practice_tag_association_table, practice_period
+from search import description_filter, content_filter
+from tag_cache import lookup_tag_ids
+from typing import List, Optional
+import datetime
+
+def tag_filter_ids(db: Session, tag_names: Optional[List[str]], condition: Optional[str] = "or") -> Optional[List[int]]:
+    # タグ名の絞り込み条件をタグIDに変換する（名前の比較や tags との結合をしなくて済む）
+    # None: 絞り込みなし / []: 該当なし（存在しないタグを and 条件で指定した場合など）
+    if not tag_names:
+        return None
+    tag_ids = lookup_tag_ids(db, tag_names)
+    if condition != "or" and len(tag_ids) < len(set(tag_names)):
+        return []
+    return sorted(set(tag_ids.values()))
+
+def _rollup_tag_counts(db: Session, user_id: str, start_date: Optional[datetime.date], end_date: Optional[datetime.date], contents: Optional[List[str]], tag_ids: Optional[List[int]], content_query: Optional[str]):
+    # 集計テーブルの件数を合計する（生データの詳細行は走査しない）
+    # ix_tag_daily_rollup_userId_day だけで読める（Index Only Scan）
+    query = db.query(TagDailyRollup.content, Tag.name, func.sum(TagDailyRollup.count).label('count'))\
+              .join(Tag, Tag.id == TagDailyRollup.tag_id)\
+              .filter(TagDailyRollup.userId == user_id)\
+              .group_by(TagDailyRollup.content, Tag.name)
+
+    if start_date:
+        query = query.filter(TagDailyRollup.day >= start_date)
+    if end_date:
+        query = query.filter(TagDailyRollup.day <= end_date)
+    if contents:
+        query = query.filter(TagDailyRollup.content.in_(contents))
+    if content_query:
+        query = query.filter(TagDailyRollup.content.contains(content_query, autoescape=True))
+    if tag_ids is not None:
+        query = query.filter(TagDailyRollup.tag_id.in_(tag_ids))
+
+    return query.all()
+
+def _raw_tag_counts(db: Session, user_id: str, start_date: Optional[datetime.date], end_date: Optional[datetime.date], contents: Optional[List[str]], tag_ids: Optional[List[int]], description: Optional[str], content_query: Optional[str]):
+    # 基本となるクエリを構築（ユーザーのレコードから結合する）
+    query = db.query(PracticeDetail.content, Tag.name, func.count(Tag.name).label('count'))\
+              .join(PracticeDetail.practiceTags)\
+              .join(Record, Record.id == PracticeDetail.recordId)\
+              .filter(Record.userId == user_id)\
+              .group_by(PracticeDetail.content, Tag.name)
+
+    # 期間フィルタリング
+    date_filters = []
+    if start_date:
+        date_filters.append(Record.date >= start_date)
+    if end_date:
+        date_filters.append(Record.date <= end_date)
+    if date_filters:
+        query = query.filter(and_(*date_filters))
+
+    # contentフィルタリング
+    if contents:
+        query = query.filter(or_(*[PracticeDetail.content == content for content in contents]))
+
+    # タグフィルタリング
+    if tag_ids is not None:
+        query = query.filter(Tag.id.in_(tag_ids))
+
+    # descriptionフィルタリング（部分一致）
+    if description:
+        query = query.filter(description_filter(description))
+
+    # contentの部分一致フィルタリング
+    if content_query:
+        query = query.filter(content_filter(content_query))
+
+    # 結果を取得
+    return query.all()
+
+def tag_counts(db: Session, user_id: str, start_date: Optional[datetime.date], end_date: Optional[datetime.date], contents: Optional[List[str]], tag_names: Optional[List[str]], description: Optional[str], content_query: Optional[str] = None) -> list:
+    # descriptionはレコード単位の条件なので集計テーブルでは絞り込めない。その場合だけ生データを集計する
+    tag_ids = tag_filter_ids(db, tag_names)
+    if description:
+        raw_result = _raw_tag_counts(db, user_id, start_date, end_date, contents, tag_ids, description, content_query)
+    else:
+        raw_result = _rollup_tag_counts(db, user_id, start_date, end_date, contents, tag_ids, content_query)
+
+    # 結果を整理
+    organized_result = {}
+    for content, tag, count in raw_result:
+        if content not in organized_result:
+            organized_result[content] = []
+        organized_result[content].append({tag: count})
+
+    # 最終的な形式に変換
+    final_result = [{content: tags} for content, tags in organized_result.items()]
+
+    return final_result
+
+def detail_query(user_id: str, start_date: Optional[datetime.date], end_date: Optional[datetime.date], contents: Optional[List[str]], tag_ids: Optional[List[int]], description: Optional[str], condition: Optional[str], after: Optional[int] = None, limit: Optional[int] = None, content_query: Optional[str] = None) -> Select:
+    # /analysis_detail のクエリ（PracticeDetail.id 順）
+    # after / limit を指定すると PracticeDetail.id によるキーセットページングになる
+    # タグの絞り込みとタグ名は詳細の行の tag_ids から求める（関連テーブルを詳細ごとに集約しない）
+    # ユーザーのレコード（ix_records_userId_date）から詳細（ix_practice_details_recordId）をたどり、どちらもインデックスだけで読む
+
+    # タグ名の配列（タグID順。タグのない詳細はNULL）
+    tag_names = select(func.array_agg(aggregate_order_by(Tag.name, Tag.id)))\
+        .where(Tag.id == any_(PracticeDetail.tag_ids))\
+        .scalar_subquery()
+
+    # 基本となるクエリを構築
+    query = select(
+        PracticeDetail.id, 
+        PracticeDetail.content, 
+        Record.description, 
+        Record.date,
+        tag_names
+    ).join(
+        Record, Record.id == PracticeDetail.recordId
+    ).where(
+        Record.userId == user_id
+    ).order_by(PracticeDetail.id)
+
+    # タグフィルタリング（tag_ids は tag_filter_ids で変換したもの。GINインデックスを使う）
+    if tag_ids is not None:
+        if not tag_ids:  # 該当するタグがない
+            query = query.where(false())
+        elif condition != "or":  # デフォルトは "and" 条件（指定した全てのタグを持つ）
+            query = query.where(PracticeDetail.tag_ids.contains(tag_ids))
+        else:
+            query = query.where(PracticeDetail.tag_ids.overlap(tag_ids))
+
+    # 期間フィルタリング
+    if start_date:
+        query = query.where(Record.date >= start_date)
+    if end_date:
+        query = query.where(Record.date <= end_date)
+
+    # contentフィルタリング
+    if contents:
+        query = query.where(or_(*[PracticeDetail.content == content for content in contents]))
+
+    # descriptionフィルタリング（部分一致）
+    if description:
+        query = query.where(description_filter(description))
+
+    # contentの部分一致フィルタリング
+    if content_query:
+        query = query.where(content_filter(content_query))
+
+    # キーセットページング
+    if after is not None:
+        query = query.where(PracticeDetail.id > after)
+    if limit is not None:
+        query = query.limit(limit)
+
+    return query
+
+def detail_row_to_dict(row) -> dict:
+    id_, content, record_description, record_date, tags = row
+    return {
+        "id": id_,
+        "content": content, 
+        "description": record_description, 
+        "date": record_date.strftime("%Y-%m-%d"), 
+        "tags": tags
+    }
+
+def detail_rows(db: Session, user_id: str, start_date: Optional[datetime.date], end_date: Optional[datetime.date], contents: Optional[List[str]], tag_names: Optional[List[str]], description: Optional[str], condition: Optional[str], content_query: Optional[str] = None, after: Optional[int] = None) -> list:
+    # 結果を取得（after を指定した場合は、その詳細IDより後の行をすべて返す）
+    result = db.execute(detail_query(user_id, start_date, end_date, contents, tag_filter_ids(db, tag_names, condition), description, condition, after, content_query=content_query))
+
+    # 結果を整理
+    return [detail_row_to_dict(row) for row in result]
+
+def detail_page(db: Session, user_id: str, start_date: Optional[datetime.date], end_date: Optional[datetime.date], contents: Optional[List[str]], tag_names: Optional[List[str]], description: Optional[str], condition: Optional[str], after: Optional[int], limit: int, content_query: Optional[str] = None) -> dict:
+    # 1件多く取得して次のページがあるかを判定する
+    rows = db.execute(detail_query(user_id, start_date, end_date, contents, tag_filter_ids(db, tag_names, condition), description, condition, after, limit + 1, content_query)).all()
+    items = [detail_row_to_dict(row) for row in rows[:limit]]
+
+    return {
+        "items": items,
+        "next_after": items[-1]["id"] if len(rows) > limit else None,
+    }
+
+def duration_query(user_id: str, group_by: str, start_date: Optional[datetime.date], end_date: Optional[datetime.date], contents: Optional[List[str]], tag_ids: Optional[List[int]], description: Optional[str], content_query: Optional[str] = None) -> Select:
+    # ユーザーの集計単位ごとの練習時間（合計・平均）をSQLで集計する（練習時間を解釈できないレコードは対象外）
+    # 1件のレコードは同じ集計単位に何度現れても1回だけ数える
+    keys = {
+        "tag": practice_tag_association_table.c.tag_id,
+        "content": PracticeDetail.content,
+        "week": func.date_trunc("week", Record.date),
+    }
+    pairs = select(Record.id, Record.duration_minutes, keys[group_by].label("key"))\
+        .where(Record.userId == user_id, Record.duration_minutes.is_not(None))\
+        .distinct()
+
+    if group_by != "week" or contents or content_query or tag_ids is not None:
+        pairs = pairs.join(PracticeDetail, PracticeDetail.recordId == Record.id)
+    if group_by == "tag":
+        pairs = pairs.join(practice_tag_association_table, practice_tag_association_table.c.practice_detail_id == PracticeDetail.id)
+
+    # 期間フィルタリング（練習時間帯が期間と重なるもの。GiSTインデックスを使う）
+    if start_date or end_date:
+        period_start = datetime.datetime.combine(start_date, datetime.time()) if start_date else None
+        period_end = datetime.datetime.combine(end_date + datetime.timedelta(days=1), datetime.time()) if end_date else None
+        pairs = pairs.where(practice_period().op("&&", is_comparison=True)(func.tsrange(period_start, period_end)))
+        # 同じ条件を date でも指定して、読むパーティションを期間の月に絞る
+        # 練習時間帯は記録した日の翌日までなので、期間の前日のレコードから対象になりうる
+        if start_date:
+            pairs = pairs.where(Record.date >= period_start - datetime.timedelta(days=1))
+        if end_date:
+            pairs = pairs.where(Record.date < period_end)
+
+    # contentフィルタリング
+    if contents:
+        pairs = pairs.where(PracticeDetail.content.in_(contents))
+
+    # タグフィルタリング（タグごとの集計以外は、詳細の tag_ids で絞り込む）
+    if tag_ids is not None:
+        if group_by == "tag":
+            pairs = pairs.where(practice_tag_association_table.c.tag_id.in_(tag_ids))
+        else:
+            pairs = pairs.where(PracticeDetail.tag_ids.overlap(tag_ids))
+
+    # descriptionフィルタリング（部分一致）
+    if description:
+        pairs = pairs.where(description_filter(description))
+
+    # contentの部分一致フィルタリング
+    if content_query:
+        pairs = pairs.where(content_filter(content_query))
+
+    pairs = pairs.subquery()
+    query = select(
+        pairs.c.key,
+        func.count().label("records"),
+        func.sum(pairs.c.duration_minutes).label("total_minutes"),
+        func.avg(pairs.c.duration_minutes).label("average_minutes"),
+    ).group_by(pairs.c.key)
+
+    if group_by == "tag":
+        query = query.add_columns(Tag.name).join(Tag, Tag.id == pairs.c.key).group_by(Tag.name)
+    if group_by == "week":
+        return query.order_by(pairs.c.key)
+    return query.order_by(func.sum(pairs.c.duration_minutes).desc(), pairs.c.key)
+
+def duration_summary(db: Session, user_id: str, group_by: str, start_date: Optional[datetime.date], end_date: Optional[datetime.date], contents: Optional[List[str]], tag_names: Optional[List[str]], description: Optional[str], content_query: Optional[str] = None) -> list:
+    # 結果を取得
+    result = db.execute(duration_query(user_id, group_by, start_date, end_date, contents, tag_filter_ids(db, tag_names), description, content_query)).all()
+
+    # 結果を整理（week は週の初め（月曜日）の日付）
+    summary = []
+    for row in result:
+        if group_by == "tag":
+            key = row.name
+        elif group_by == "week":
+            key = row.key.strftime("%Y-%m-%d")
+        else:
+            key = row.key
+        summary.append({
+            group_by: key,
+            "records": row.records,
+            "total_minutes": row.total_minutes,
+            "average_minutes": round(float(row.average_minutes), 1),
+        })
+
+    return summary
@@ -0,0 +1,227 @@
+from fastapi import HTTPException, Request
+from pydantic import ValidationError
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from sqlalchemy.util import await_only
+from schemas import CreateRecordModel
+import rollup
+import usage
+from typing import AsyncIterator, Deque, List, Set, Tuple
+from collections import deque
+import csv
+import datetime
+import io
+import json
+
+# POST /records/bulk の取り込み処理
+# 1. 受け取った行を CreateRecordModel で検証し、不正な行は行番号付きのエラーとして返す
+# 2. 正しい行を CSV にして COPY でステージングテーブルに流し込む
+# 3. タグ解決と records / practice_details / practice_tag_association への展開を集合演算のSQLで行う
+
+# CSV入力の列。practiceDetails 列には詳細の配列をJSON文字列で入れる
+CSV_COLUMNS = ["description", "date", "startTime", "startMinute", "endTime", "endMinute", "userId", "practiceDetails"]
+
+STAGING_COLUMNS = ["row_no", "description", "date", "startTime", "startMinute", "endTime", "endMinute", "userId", "details"]
+
+# COPY の CSV 形式では引用符のない空のフィールドが NULL になり、csv.writer は空文字列を引用符なしで書くので、
+# 文字列の列は FORCE_NOT_NULL で空文字列として読み込む（1件ずつの登録と同じく '' を保存する。検証済みの行に None はない）
+STAGING_TEXT_COLUMNS = ["description", "startTime", "startMinute", "endTime", "endMinute", "userId"]
+
+CREATE_STAGING_SQL = """
+CREATE TEMP TABLE bulk_records_staging (
+    row_no integer NOT NULL,
+    record_id integer,
+    description text,
+    date date,
+    "startTime" text,
+    "startMinute" text,
+    "endTime" text,
+    "endMinute" text,
+    "userId" text,
+    details jsonb
+) ON COMMIT DROP
+"""
+
+# records / practice_details のIDを先に採番しておくことで、RETURNING と突き合わせずに子テーブルへ展開できる
+FAN_OUT_SQL = [
+    """
+    UPDATE bulk_records_staging SET record_id = nextval(pg_get_serial_sequence('records', 'id'))
+    """,
+    """
+    INSERT INTO tags (name)
+    SELECT DISTINCT tag->>'name'
+    FROM bulk_records_staging s
+    CROSS JOIN LATERAL jsonb_array_elements(s.details) AS d(detail)
+    CROSS JOIN LATERAL jsonb_array_elements(d.detail->'tags') AS t(tag)
+    ORDER BY 1
+    ON CONFLICT (name) DO NOTHING
+    """,
+    """
+    INSERT INTO records (id, description, date, "startTime", "startMinute", "endTime", "endMinute", "userId")
+    SELECT record_id, description, date, "startTime", "startMinute", "endTime", "endMinute", "userId"
+    FROM bulk_records_staging
+    ORDER BY row_no
+    """,
+    """
+    CREATE TEMP TABLE bulk_details_staging ON COMMIT DROP AS
+    SELECT nextval(pg_get_serial_sequence('practice_details', 'id'))::integer AS detail_id, ordered.*
+    FROM (
+        SELECT s.record_id, d.detail->>'content' AS content, d.detail->'tags' AS tags
+        FROM bulk_records_staging s
+        CROSS JOIN LATERAL jsonb_array_elements(s.details) WITH ORDINALITY AS d(detail, ord)
+        ORDER BY s.row_no, d.ord
+    ) ordered
+    """,
+    """
+    INSERT INTO practice_details (id, "recordId", content, tag_ids)
+    SELECT ds.detail_id, ds.record_id, ds.content, ARRAY(
+        SELECT DISTINCT tags.id
+        FROM jsonb_array_elements(ds.tags) AS t(tag)
+        JOIN tags ON tags.name = t.tag->>'name'
+        ORDER BY tags.id
+    )
+    FROM bulk_details_staging ds
+    ORDER BY ds.detail_id
+    """,
+    """
+    INSERT INTO practice_tag_association (practice_detail_id, tag_id)
+    SELECT DISTINCT ds.detail_id, tags.id
+    FROM bulk_details_staging ds
+    CROSS JOIN LATERAL jsonb_array_elements(ds.tags) AS t(tag)
+    JOIN tags ON tags.name = t.tag->>'name'
+    """,
+]
+
+async def _iter_lines(request: Request, keepends: bool = False) -> AsyncIterator[str]:
+    # リクエストボディ全体を保持せずに1行ずつ取り出す（keepends: 行末の改行を残す）
+    pending = b""
+    end = "\n" if keepends else ""
+    async for chunk in request.stream():
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8") + end
+    if pending:
+        yield pending.decode("utf-8")
+
+async def _iter_csv_records(request: Request) -> AsyncIterator[List[str]]:
+    # 引用符で囲まれたフィールドは改行を含むことがあり、1つのレコードが複数の行にまたがる
+    # 引用符が閉じるまで行を溜め、レコードが揃うたびに1つの csv.reader から1レコードを読む
+    # （引用符の数が奇数の行で、引用符の中かどうかが切り替わる。"" のエスケープは偶数なので影響しない）
+    lines: Deque[str] = deque()
+    # 揃ったレコードの分しか読ませないので、読み切って IndexError になることはない
+    reader = csv.reader(iter(lines.popleft, None))
+    in_quotes = False
+    async for line in _iter_lines(request, keepends=True):
+        if not in_quotes and not line.strip():
+            continue
+        lines.append(line)
+        if line.count('"') % 2 == 1:
+            in_quotes = not in_quotes
+        if not in_quotes:
+            yield next(reader)
+    if in_quotes:
+        raise HTTPException(status_code=400, detail="Unterminated quoted field in CSV body")
+
+async def _iter_objects(request: Request) -> AsyncIterator[object]:
+    content_type = request.headers.get("content-type", "application/json").split(";")[0].strip()
+
+    if content_type in ("application/x-ndjson", "application/jsonl"):
+        async for line in _iter_lines(request):
+            if line.strip():
+                yield line
+    elif content_type == "text/csv":
+        header = None
+        async for values in _iter_csv_records(request):
+            if header is None:
+                header = values
+                continue
+            row = dict(zip(header, values))
+            if "practiceDetails" in row:
+                row["practiceDetails"] = row["practiceDetails"] or "[]"
+            yield row
+    elif content_type == "application/json":
+        try:
+            rows = json.loads(await request.body())
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid JSON body")
+        if not isinstance(rows, list):
+            raise HTTPException(status_code=400, detail="JSON body must be an array of records")
+        for row in rows:
+            yield row
+    else:
+        raise HTTPException(status_code=415, detail=f"Unsupported content type: {content_type}")
+
+def _validate(obj: object) -> CreateRecordModel:
+    if isinstance(obj, str):
+        return CreateRecordModel.model_validate_json(obj)
+    if isinstance(obj, dict) and isinstance(obj.get("practiceDetails"), str):
+        # CSVの practiceDetails 列はJSON文字列
+        obj = dict(obj, practiceDetails=json.loads(obj["practiceDetails"]))
+    return CreateRecordModel.model_validate(obj)
+
+async def parse_rows(request: Request) -> Tuple[io.StringIO, int, List[dict], Set[Tuple[str, datetime.date]]]:
+    # 検証済みの行を COPY 用のCSVバッファに書き出し、(バッファ, 行数, エラー一覧, 対象の(userId, 月初日)) を返す
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    count = 0
+    errors = []
+    touched = set()
+    row_no = 0
+    async for obj in _iter_objects(request):
+        try:
+            record = _validate(obj)
+        except (ValidationError, ValueError) as e:
+            errors.append({"row": row_no, "error": str(e)})
+        else:
+            writer.writerow([
+                row_no,
+                record.description,
+                record.date.isoformat(),
+                record.startTime,
+                record.startMinute,
+                record.endTime,
+                record.endMinute,
+                record.userId,
+                json.dumps([detail.model_dump() for detail in record.practiceDetails], ensure_ascii=False),
+            ])
+            count += 1
+            touched.add((record.userId, record.date.replace(day=1)))
+        row_no += 1
+
+    buffer.seek(0)
+    return buffer, count, errors, touched
+
+def _copy_into_staging(db: Session, buffer: io.StringIO):
+    # セッションと同じ接続・トランザクションで COPY を実行する
+    driver_connection = db.connection().connection.driver_connection
+    if db.get_bind().dialect.driver == "asyncpg":
+        # run_sync の中なので、asyncpg のコルーチンは await_only で待つ
+        await_only(driver_connection.copy_to_table(
+            "bulk_records_staging",
+            source=io.BytesIO(buffer.getvalue().encode("utf-8")),
+            columns=STAGING_COLUMNS,
+            format="csv",
+            force_not_null=STAGING_TEXT_COLUMNS,
+        ))
+    else:
+        columns = ", ".join(f'"{column}"' for column in STAGING_COLUMNS)
+        text_columns = ", ".join(f'"{column}"' for column in STAGING_TEXT_COLUMNS)
+        with driver_connection.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY bulk_records_staging ({columns}) FROM STDIN WITH (FORMAT csv, FORCE_NOT_NULL ({text_columns}))", buffer
+            )
+
+def ingest_records(db: Session, buffer: io.StringIO, count: int) -> int:
+    if count == 0:
+        return 0
+
+    db.execute(text(CREATE_STAGING_SQL))
+    _copy_into_staging(db, buffer)
+    for statement in FAN_OUT_SQL:
+        db.execute(text(statement))
+    rollup.add_records_sql(db, "SELECT record_id FROM bulk_records_staging")
+    usage.add_records_sql(db, "SELECT record_id FROM bulk_records_staging")
+    db.commit()
+
+    return count
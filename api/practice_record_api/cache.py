@@ -0,0 +1,209 @@
+from collections import OrderedDict
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+import datetime
+import hashlib
+import orjson
+import os
+import time
+import urllib.parse
+import uuid
+import metrics
+
+# 読み取り系エンドポイントのレスポンスキャッシュ
+# スコープ（ユーザー・ユーザー×月）ごとにバージョン番号を持ち、書き込み時にバージョンを上げて無効化する
+# キャッシュキーにバージョンを含めるので、無効化後の古いエントリは参照されずTTLで消える
+# ETagはレスポンスの本文のハッシュで、304はキャッシュにある（TTL内の）本文か、組み立て直した本文と一致する場合だけ返す
+#
+# CACHE_BACKEND:
+#   memory: プロセス内のLRU（既定）。ワーカーが複数ある場合、他のワーカーの書き込みはTTL経過まで反映されない（304も同様）
+#   redis:  CACHE_REDIS_URL のRedis（redis パッケージが必要）。複数ワーカーでバージョンを共有できる
+#   none:   キャッシュしない
+#
+# 読み取りのレプリカへの振り分けで使う、ユーザーが書き込んだ直後かどうか（mark_written / written_recently）も
+# バージョンと同じバックエンドに保存する（redis なら、書き込んだワーカー以外でもプライマリから読める。database.py を参照）
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", "60"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+
+def user_scope(user_id: str) -> str:
+    return f"user:{user_id}"
+
+def month_scope(user_id: str, year: int, month: int) -> str:
+    return f"month:{user_id}:{year:04d}-{month:02d}"
+
+class MemoryCache:
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl_seconds: int = CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        # スコープ -> バージョン（エントリと同じく max_entries 件までのLRU）
+        # 番号はスコープをまたいで1つのカウンタから振り、上限を超えて捨てたスコープは捨てた番号の最大値を返す
+        # （捨てた後も以前より小さい番号に戻らないので、古いバージョンのエントリが再び参照されることはない）
+        self._versions: "OrderedDict[str, int]" = OrderedDict()
+        self._counter = 0
+        self._evicted_version = 0
+        # userId -> 書き込み直後とみなす期限（time.monotonic()）
+        self._written: Dict[str, float] = {}
+        # バージョンはプロセスごとの番号なので、キャッシュキーにプロセスの識別子を含める
+        self._epoch = uuid.uuid4().hex[:8]
+
+    async def get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: bytes):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def version(self, scope: str) -> str:
+        version = self._versions.get(scope)
+        if version is None:
+            version = self._evicted_version
+        else:
+            self._versions.move_to_end(scope)
+        return f"{self._epoch}.{version}"
+
+    async def bump(self, scopes: Iterable[str]):
+        for scope in scopes:
+            self._counter += 1
+            self._versions[scope] = self._counter
+            self._versions.move_to_end(scope)
+        while len(self._versions) > self.max_entries:
+            _, version = self._versions.popitem(last=False)
+            self._evicted_version = max(self._evicted_version, version)
+
+    async def mark_written(self, user_ids: Iterable[str], seconds: float):
+        now = time.monotonic()
+        if len(self._written) > self.max_entries:
+            for user_id in [user_id for user_id, until in self._written.items() if until <= now]:
+                del self._written[user_id]
+        for user_id in user_ids:
+            self._written[user_id] = now + seconds
+
+    async def written_recently(self, user_id: str) -> bool:
+        return self._written.get(user_id, 0) > time.monotonic()
+
+class RedisCache:
+    # client は redis.asyncio.Redis 互換のクライアント（テストではローカルの代替実装に差し替えられる）
+    def __init__(self, client, ttl_seconds: int = CACHE_TTL_SECONDS, prefix: str = "practice-record:"):
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+        self._epoch: Optional[str] = None
+
+    async def _get_epoch(self) -> str:
+        if self._epoch is None:
+            # Redisのデータが消えてバージョンが0に戻っても、以前のエントリを参照しないようにする
+            await self.client.set(f"{self.prefix}epoch", uuid.uuid4().hex[:8], nx=True)
+            epoch = await self.client.get(f"{self.prefix}epoch")
+            self._epoch = epoch.decode() if isinstance(epoch, bytes) else epoch
+        return self._epoch
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.client.get(f"{self.prefix}entry:{key}")
+
+    async def set(self, key: str, value: bytes):
+        await self.client.set(f"{self.prefix}entry:{key}", value, ex=self.ttl_seconds)
+
+    async def version(self, scope: str) -> str:
+        epoch = await self._get_epoch()
+        value = await self.client.get(f"{self.prefix}version:{scope}")
+        return f"{epoch}.{int(value or 0)}"
+
+    async def bump(self, scopes: Iterable[str]):
+        for scope in scopes:
+            await self.client.incr(f"{self.prefix}version:{scope}")
+        # epoch キーが消えていたら作り直させる
+        self._epoch = None
+
+    async def mark_written(self, user_ids: Iterable[str], seconds: float):
+        for user_id in user_ids:
+            await self.client.set(f"{self.prefix}written:{user_id}", 1, px=max(1, int(seconds * 1000)))
+
+    async def written_recently(self, user_id: str) -> bool:
+        return bool(await self.client.exists(f"{self.prefix}written:{user_id}"))
+
+def create_cache():
+    if CACHE_BACKEND == "none":
+        return None
+    if CACHE_BACKEND == "redis":
+        import redis.asyncio
+        return RedisCache(redis.asyncio.Redis.from_url(CACHE_REDIS_URL))
+    return MemoryCache()
+
+cache = create_cache()
+
+# cached_json の結果ごとの件数（hit: キャッシュから返した / miss: 組み立てた / not_modified: 304を返した）
+lookups = {"hit": 0, "miss": 0, "not_modified": 0}
+
+metrics.register(metrics.Gauge(
+    "response_cache_lookups_total", "Responses served by cached_json, by outcome.", ("result",),
+    lambda: {(result,): count for result, count in lookups.items()}, "counter"
+))
+
+def _make_etag(body: bytes) -> str:
+    return '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+
+async def cached_json(request: Request, scope: str, build: Callable[[], Awaitable[Any]]) -> Response:
+    # scope のバージョンが変わっておらずエントリがTTL内なら、DBへの問い合わせとシリアライズを行わずに
+    # If-None-Match と一致すれば304を、それ以外はキャッシュ済みのJSONを返す
+    if cache is None:
+        return _json_response(await build())
+
+    # 値に & や = を含むパラメータが別のパラメータの組み合わせと衝突しないよう、エンコードしてキーにする
+    key = request.url.path + "?" + urllib.parse.urlencode(sorted(request.query_params.multi_items()))
+    version = await cache.version(scope)
+    body = await cache.get(f"{key}@{version}")
+    cached = body is not None
+    if not cached:
+        body = _serialize(await build())
+        await cache.set(f"{key}@{version}", body)
+
+    etag = _make_etag(body)
+    if _etag_matches(request, etag):
+        lookups["not_modified"] += 1
+        return Response(status_code=304, headers={"ETag": etag})
+    lookups["hit" if cached else "miss"] += 1
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+def _encode_other(value: Any) -> Any:
+    # orjson が直接扱えない値（Pydanticモデル・Decimal など）だけを jsonable_encoder で変換する
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    return jsonable_encoder(value)
+
+def _serialize(data: Any) -> bytes:
+    # dict / list / str / 数値 / 日付は orjson がそのままエンコードする（jsonable_encoder でデータ全体を走査しない）
+    return orjson.dumps(data, default=_encode_other)
+
+def _json_response(data: Any) -> Response:
+    return Response(content=_serialize(data), media_type="application/json")
+
+async def invalidate(user_ids_and_dates: Iterable[Tuple[str, datetime.date]]):
+    # 書き込みの影響を受けるユーザー・月のバージョンを上げる
+    if cache is None:
+        return
+    scopes = set()
+    for user_id, date in user_ids_and_dates:
+        scopes.add(user_scope(user_id))
+        scopes.add(month_scope(user_id, date.year, date.month))
+    await cache.bump(sorted(scopes))
@@ -0,0 +1,54 @@
+from sqlalchemy import Date, cast, func, select, Select
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.orm import Session
+from models import Record, Tag, TagDailyRollup
+import datetime
+
+# 年間カレンダー（ヒートマップ）用の日ごとの集計（GET /records/{year}/summary, GET /records/summary）
+# 月表示のようにレコード・詳細・タグを読み込まず、日ごとの件数・練習時間・上位タグを1回のクエリで集計する
+# 上位タグは tag_daily_rollup（詳細の件数）から求める
+
+# レスポンスの days の各要素の並び
+COLUMNS = ["date", "records", "minutes", "top_tags"]
+
+def summary_query(user_id: str, start_date: datetime.date, end_date: datetime.date, top: int) -> Select:
+    # 練習した日だけを日付順に返す。練習時間を解釈できないレコードは件数にだけ数える
+    day = cast(Record.date, Date)
+    days = select(
+        day.label("day"),
+        func.count().label("records"),
+        func.coalesce(func.sum(Record.duration_minutes), 0).label("minutes"),
+    ).where(
+        Record.userId == user_id, Record.date >= start_date, Record.date <= end_date
+    ).group_by(day).subquery()
+
+    # 日ごとのタグの件数の順位（件数が同じならタグID順）
+    ranked = select(
+        TagDailyRollup.day,
+        TagDailyRollup.tag_id,
+        func.row_number().over(
+            partition_by=TagDailyRollup.day,
+            order_by=(func.sum(TagDailyRollup.count).desc(), TagDailyRollup.tag_id)
+        ).label("rank"),
+    ).where(
+        TagDailyRollup.userId == user_id, TagDailyRollup.day >= start_date, TagDailyRollup.day <= end_date
+    ).group_by(TagDailyRollup.day, TagDailyRollup.tag_id).subquery()
+
+    top_tags = select(
+        ranked.c.day,
+        func.array_agg(aggregate_order_by(Tag.name, ranked.c.rank)).label("tags"),
+    ).join(Tag, Tag.id == ranked.c.tag_id).where(ranked.c.rank <= top).group_by(ranked.c.day).subquery()
+
+    return select(days.c.day, days.c.records, days.c.minutes, top_tags.c.tags)\
+        .outerjoin(top_tags, top_tags.c.day == days.c.day)\
+        .order_by(days.c.day)
+
+def day_summary(db: Session, user_id: str, start_date: datetime.date, end_date: datetime.date, top: int = 3) -> dict:
+    # days は COLUMNS の順の配列のリスト（キー名を日ごとに繰り返さない）
+    rows = db.execute(summary_query(user_id, start_date, end_date, top))
+    return {
+        "start_date": start_date.isoformat(),
+        "end_date": end_date.isoformat(),
+        "columns": COLUMNS,
+        "days": [[day.isoformat(), records, minutes, tags or []] for day, records, minutes, tags in rows],
+    }
@@ -0,0 +1,194 @@
+from sqlalchemy import delete, insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models import Record, PracticeDetail
+from schemas import CreateRecordModel
+from record_loader import load_record_for_update, load_record_dicts
+from record_writer import insert_practice_details, update_practice_details
+from rollup import rollup_keys, apply_rollup_delta
+from usage import usage_keys, apply_usage_delta
+from tag_cache import tag_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+from collections import Counter
+import datetime
+
+# 各関数は同期Sessionを受け取る。非同期バックエンドでは database.run_db から
+# AsyncSession.run_sync 経由で呼び出されるため、同じ実装を両バックエンドで共有できる
+
+# 外部キー違反のSQLSTATE
+FOREIGN_KEY_VIOLATION = "23503"
+
+def _retry_on_stale_tags(db: Session, write, *args):
+    # キャッシュしていたタグが manage.py gc-tags で削除されていると、関連付けの挿入が外部キー違反になる
+    # その場合はタグのキャッシュを捨てて1度だけ書き込み直す（タグは resolve_tag_ids が作り直す）
+    try:
+        return write(db, *args)
+    except IntegrityError as e:
+        if getattr(e.orig, "pgcode", None) != FOREIGN_KEY_VIOLATION:
+            raise
+        db.rollback()
+        tag_cache.clear()
+        return write(db, *args)
+
+# (タグ集計への寄与, 使用回数への寄与) を返す
+def _stored_keys(record: Record) -> Tuple[Counter, Counter]:
+    details = [(detail.content, [tag.id for tag in detail.practiceTags]) for detail in record.practiceDetails]
+    return rollup_keys(record.userId, record.date, details), usage_keys(record.userId, details)
+
+def _payload_keys(record_data: CreateRecordModel, tag_ids: Dict[str, int]) -> Tuple[Counter, Counter]:
+    details = [(detail.content, [tag_ids[tag.name] for tag in detail.tags]) for detail in record_data.practiceDetails]
+    return rollup_keys(record_data.userId, record_data.date, details), usage_keys(record_data.userId, details)
+
+def create_record(db: Session, record_data: CreateRecordModel) -> int:
+    return create_records(db, [record_data])[0]
+
+def create_records(db: Session, records: Sequence[CreateRecordModel]) -> List[int]:
+    return _retry_on_stale_tags(db, _create_records, records)
+
+def _create_records(db: Session, records: Sequence[CreateRecordModel]) -> List[int]:
+    # 複数のレコードを1トランザクションで作成し、入力の順にレコードIDを返す（write_batcher からまとめて呼ばれる）
+    # レコード・詳細・関連付け・タグ集計をそれぞれ1文で書き込むので、件数に比例して文が増えない
+    # sort_by_parameter_order で、返されるIDの順序を入力の順序と一致させる
+    record_ids = db.execute(
+        insert(Record).returning(Record.id, sort_by_parameter_order=True),
+        [
+            {
+                "description": record_data.description,
+                "date": record_data.date,
+                "startTime": record_data.startTime,
+                "startMinute": record_data.startMinute,
+                "endTime": record_data.endTime,
+                "endMinute": record_data.endMinute,
+                "userId": record_data.userId,
+            }
+            for record_data in records
+        ]
+    ).scalars().all()
+
+    tag_ids = insert_practice_details(db, [
+        (record_id, detail)
+        for record_id, record_data in zip(record_ids, records)
+        for detail in record_data.practiceDetails
+    ])
+
+    # タグ集計と使用回数に今回のレコード分を加える
+    rollup_after, usage_after = Counter(), Counter()
+    for record_data in records:
+        record_rollup, record_usage = _payload_keys(record_data, tag_ids)
+        rollup_after.update(record_rollup)
+        usage_after.update(record_usage)
+    apply_rollup_delta(db, Counter(), rollup_after)
+    apply_usage_delta(db, Counter(), usage_after)
+
+    db.commit()  # すべてのデータが追加された後に一度だけcommit
+
+    return record_ids
+
+def get_records_between(db: Session, user_id: str, start_date: datetime.date, end_date: datetime.date) -> List[dict]:
+    # RecordModel と同じ形のdictのリスト（レスポンスとしてそのままJSONにする）
+    return load_record_dicts(db, Record.date >= start_date, Record.date <= end_date, Record.userId == user_id)
+
+def _record_criteria(record_id: int, user_id: str, record_date: Optional[datetime.date]) -> list:
+    # records は日付でパーティション化されているため、IDだけではすべての月のパーティションのインデックスを引く
+    # レコードの日付が分かっている場合はその日で絞り込み、1つのパーティションだけを読む
+    criteria = [Record.id == record_id, Record.userId == user_id]
+    if record_date is not None:
+        criteria += [Record.date >= record_date, Record.date < record_date + datetime.timedelta(days=1)]
+    return criteria
+
+def get_record(db: Session, record_id: int, user_id: str, record_date: Optional[datetime.date] = None) -> Optional[dict]:
+    records = load_record_dicts(db, *_record_criteria(record_id, user_id, record_date))
+    if not records:
+        return None
+
+    return records[0]
+
+def _delete_records(db: Session, *criteria) -> List[datetime.date]:
+    # criteria に一致するレコードを詳細ごと削除し、削除したレコードの日付を返す（1件につき1つ）
+    # records はパーティション化されていて practice_details から外部キーを張れないため、
+    # レコードと詳細をデータ変更のCTEで1文で削除する（関連付けは外部キーの ON DELETE CASCADE で削除される）
+    # 削除した詳細の内容と tag_ids を返させ、タグ集計から差し引く分を計算する（ORMオブジェクトはロードしない）
+    #
+    # 外部キーがないため、更新（_update_record）が詳細を追加している間に削除すると、追加された詳細が残ってしまう
+    # 先に別の文で対象の行をロックし（更新のロックと競合するので、更新のコミットを待つ）、
+    # その後の文で削除する。READ COMMITTED なので、削除の文は更新で追加された詳細も見える
+    # 複数の削除が同じレコードを逆順にロックしてデッドロックしないように、ID順にロックする
+    locked = db.execute(select(Record.id).where(*criteria).order_by(Record.id).with_for_update()).all()
+    if not locked:
+        return []
+
+    deleted = delete(Record).where(*criteria)\
+        .returning(Record.id, Record.date, Record.userId).cte("deleted_records")
+    deleted_details = delete(PracticeDetail).where(PracticeDetail.recordId.in_(select(deleted.c.id)))\
+        .returning(PracticeDetail.recordId, PracticeDetail.content, PracticeDetail.tag_ids).cte("deleted_details")
+    rows = db.execute(
+        select(deleted.c.id, deleted.c.date, deleted.c.userId, deleted_details.c.content, deleted_details.c.tag_ids)
+        .select_from(deleted.outerjoin(deleted_details, deleted_details.c.recordId == deleted.c.id))
+    ).all()
+
+    # タグ集計と使用回数から削除したレコード分を差し引く
+    records = {}
+    rollup_before, usage_before = Counter(), Counter()
+    for record_id, date, user_id, content, tag_ids in rows:
+        records[record_id] = date.date()
+        if content is not None:
+            rollup_before.update(rollup_keys(user_id, date, [(content, tag_ids)]))
+            usage_before.update(usage_keys(user_id, [(content, tag_ids)]))
+    apply_rollup_delta(db, rollup_before, Counter())
+    apply_usage_delta(db, usage_before, Counter())
+
+    db.commit()
+
+    return list(records.values())
+
+def delete_record(db: Session, record_id: int, user_id: str, record_date: Optional[datetime.date] = None) -> Optional[datetime.date]:
+    # 削除したレコードの日付を返す（見つからなければNone）
+    deleted_dates = _delete_records(db, *_record_criteria(record_id, user_id, record_date))
+    return deleted_dates[0] if deleted_dates else None
+
+def delete_records_between(db: Session, user_id: str, start_date: datetime.date, end_date: datetime.date) -> List[datetime.date]:
+    # 期間内のユーザーのレコードをまとめて削除し、削除したレコードの日付を返す
+    # 日付で絞り込むので、期間外の月のパーティションは読まない
+    return _delete_records(db, Record.userId == user_id, Record.date >= start_date, Record.date <= end_date)
+
+def update_record(db: Session, record_id: int, record_data: CreateRecordModel, record_date: Optional[datetime.date] = None) -> Optional[datetime.date]:
+    # record_date: 更新前のレコードの日付（分かっている場合。読むパーティションを絞る）
+    return _retry_on_stale_tags(db, _update_record, record_id, record_data, record_date)
+
+def _update_record(db: Session, record_id: int, record_data: CreateRecordModel, record_date: Optional[datetime.date]) -> Optional[datetime.date]:
+    # 更新前のレコードの日付を返す（見つからなければNone）
+    # 指定されたIDのRecordを検索し、かつuserIdが一致するものを確認（詳細・タグも一括ロード）
+    # 行をロックするので、同時に実行された削除はこの更新のコミットを待つ（_delete_records）
+    record = load_record_for_update(db, *_record_criteria(record_id, record_data.userId, record_date))
+    if record is None:
+        return None
+    previous_date = record.date.date()
+
+    # 変更前のタグ集計・使用回数への寄与（ロード済みの詳細・タグから計算するので追加のクエリはない）
+    rollup_before, usage_before = _stored_keys(record)
+
+    # Recordの情報を更新（値が変わった列だけを更新対象にする）
+    # userIdの更新は不要なので、ここでは触らない
+    new_values = {
+        "description": record_data.description,
+        "date": datetime.datetime.combine(record_data.date, datetime.time()),
+        "startTime": record_data.startTime,
+        "startMinute": record_data.startMinute,
+        "endTime": record_data.endTime,
+        "endMinute": record_data.endMinute,
+    }
+    for key, value in new_values.items():
+        if getattr(record, key) != value:
+            setattr(record, key, value)
+
+    # PracticeDetailとTagの関連付けは差分だけを反映する
+    tag_ids = update_practice_details(db, record, record_data.practiceDetails)
+
+    # 日付・内容・タグが変わった分だけタグ集計と使用回数を更新する（変更がなければ何も書き込まない）
+    rollup_after, usage_after = _payload_keys(record_data, tag_ids)
+    apply_rollup_delta(db, rollup_before, rollup_after)
+    apply_usage_delta(db, usage_before, usage_after)
+
+    db.commit()  # 途中でcommitせず、すべての変更を1トランザクションで反映
+
+    return previous_date
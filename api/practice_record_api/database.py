@@ -0,0 +1,180 @@
+from contextlib import asynccontextmanager
+from fastapi import Request
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import Row, Select, event, exc
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from models import DB_BACKEND, engine, async_engine, SessionLocal, AsyncSessionLocal
+from models import replica_engine, async_replica_engine, ReplicaSessionLocal, AsyncReplicaSessionLocal
+from typing import AsyncIterator, Callable, Iterable, Optional, Sequence, TypeVar, Union
+import logging
+import os
+import time
+import cache
+import metrics
+
+T = TypeVar("T")
+
+# エンドポイントが受け取るセッション（バックエンドによってどちらかになる）
+DbSession = Union[Session, AsyncSession]
+
+# 読み取りのレプリカへの振り分け（models.DB_REPLICA_HOST を指定した場合）
+# DB_READ_YOUR_WRITES_SECONDS: ユーザーが書き込んでからこの秒数の間は、そのユーザーの読み取りをプライマリで行う（0で無効）
+#   レプリカの遅延で、直前の自分の書き込みが見えなくなるのを防ぐ
+#   書き込んだことはレスポンスキャッシュのバックエンドに記録する（cache.mark_written）。CACHE_BACKEND=redis なら全ワーカーで共有され、
+#   別のワーカーがレプリカから古いデータを読み、書き込み後の新しいバージョンでキャッシュしてしまうことがない
+#   memory / none の場合はプロセスごとなので、複数ワーカーでは別のワーカーでの読み取りには効かない
+#   userId のない読み取り（全体の集計など）は常にレプリカで行うため、書き込み直後にはレプリカの遅延分だけ古い結果が
+#   キャッシュされることがある（CACHE_TTL_SECONDS で期限切れになる）
+# DB_REPLICA_RETRY_SECONDS: レプリカに接続できなかった場合、この秒数の間は読み取りをプライマリで行う
+# 読み取りのセッションは最初のクエリで接続する（レスポンスキャッシュのヒットや304では接続しない）
+#   レプリカへの最初の接続に失敗した場合は、そのセッションをプライマリに付け替えてやり直す（run_db）
+READ_YOUR_WRITES_SECONDS = float(os.getenv("DB_READ_YOUR_WRITES_SECONDS", "5"))
+REPLICA_RETRY_SECONDS = float(os.getenv("DB_REPLICA_RETRY_SECONDS", "30"))
+
+logger = logging.getLogger("practice_record_api.database")
+
+# 書き込んだユーザーの記録先（キャッシュを使わない場合はプロセス内に記録する）
+_write_marks = cache.cache if cache.cache is not None else cache.MemoryCache()
+_replica_down_until = 0.0
+
+# DBに接続した読み取りセッションの振り分け先ごとの件数
+# replica: レプリカ / primary: レプリカ未設定 / read_your_writes: 書き込み直後のユーザー / fallback: レプリカに接続できない
+read_routes = {"replica": 0, "primary": 0, "read_your_writes": 0, "fallback": 0}
+
+metrics.register(metrics.Gauge(
+    "db_read_sessions_total", "Read sessions of get_read_db and stream_partitions that queried the database, by route.", ("route",),
+    lambda: {(route,): count for route, count in read_routes.items()}, "counter"
+))
+
+@event.listens_for(Session, "after_begin")
+def _count_read_route(db: Session, transaction, connection):
+    # 読み取りセッションが最初に接続したときに振り分け先を数える（AsyncSession の場合も同期Sessionのイベントが呼ばれる）
+    route = db.info.pop("read_route", None)
+    if route is not None:
+        read_routes[route] += 1
+
+def _primary_session() -> DbSession:
+    return AsyncSessionLocal() if DB_BACKEND == "async" else SessionLocal()
+
+async def _close(db: DbSession):
+    if isinstance(db, AsyncSession):
+        await db.close()
+    else:
+        await run_in_threadpool(db.close)
+
+def _replica_session() -> DbSession:
+    # レプリカのセッションを作る（接続は最初のクエリで行う）
+    return AsyncReplicaSessionLocal() if DB_BACKEND == "async" else ReplicaSessionLocal()
+
+async def _fall_back_to_primary(db: DbSession, error: Exception) -> bool:
+    # まだ接続していないレプリカのセッションで接続に失敗した場合、プライマリに付け替えて True を返す
+    global _replica_down_until
+    if db.info.get("read_route") != "replica":
+        return False
+    logger.warning("replica unavailable, reading from the primary for %.0f s: %s", REPLICA_RETRY_SECONDS, error)
+    _replica_down_until = time.monotonic() + REPLICA_RETRY_SECONDS
+    if isinstance(db, AsyncSession):
+        await db.rollback()
+        db.bind = async_engine
+        db.sync_session.bind = async_engine.sync_engine
+    else:
+        await run_in_threadpool(db.rollback)
+        db.bind = engine
+    db.info["read_route"] = "fallback"
+    return True
+
+async def note_writes(user_ids: Iterable[str]):
+    # 書き込んだユーザーを記録し、DB_READ_YOUR_WRITES_SECONDS の間はそのユーザーの読み取りをプライマリで行う
+    # レスポンスキャッシュの無効化（cache.invalidate）より先に呼ぶ。無効化の後に記録すると、その間に
+    # 他のワーカーがレプリカから書き込み前のデータを読み、新しいバージョンでキャッシュすることがある
+    if replica_engine is None or READ_YOUR_WRITES_SECONDS <= 0:
+        return
+    await _write_marks.mark_written(user_ids, READ_YOUR_WRITES_SECONDS)
+
+async def open_read_session(user_id: Optional[str] = None) -> DbSession:
+    # 読み取り用のセッションを開く（閉じるのは呼び出し側）
+    now = time.monotonic()
+    if replica_engine is None:
+        route = "primary"
+    elif now < _replica_down_until:
+        route = "fallback"
+    elif user_id is not None and await _write_marks.written_recently(user_id):
+        route = "read_your_writes"
+    else:
+        route = "replica"
+
+    db = _replica_session() if route == "replica" else _primary_session()
+    db.info["read_route"] = route
+    return db
+
+@asynccontextmanager
+async def write_session() -> AsyncIterator[DbSession]:
+    # リクエストの依存関係の外で書き込む場合（write_batcher）のプライマリのセッション
+    db = _primary_session()
+    try:
+        yield db
+    finally:
+        await _close(db)
+
+# データベース接続の依存関係（書き込みを含むエンドポイント用。常にプライマリ）
+async def get_db():
+    db = _primary_session()
+    try:
+        yield db
+    finally:
+        await _close(db)
+
+# GET エンドポイント用の依存関係（クエリパラメータの userId を read-your-writes の判定に使う）
+async def get_read_db(request: Request):
+    db = await open_read_session(request.query_params.get("userId"))
+    try:
+        yield db
+    finally:
+        await _close(db)
+
+async def run_db(db: DbSession, fn: Callable[..., T], *args, **kwargs) -> T:
+    # 同期Sessionを受け取る関数 fn を実行する
+    # async: AsyncSession.run_sync により asyncpg 上でイベントループをブロックせずに実行
+    # sync: 従来通りスレッドプールで実行
+    try:
+        return await _run_db(db, fn, *args, **kwargs)
+    except (exc.DBAPIError, OSError) as e:
+        if not await _fall_back_to_primary(db, e):
+            raise
+        return await _run_db(db, fn, *args, **kwargs)
+
+async def _run_db(db: DbSession, fn: Callable[..., T], *args, **kwargs) -> T:
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
+
+async def stream_partitions(statement: Select, size: int = 1000, user_id: Optional[str] = None) -> AsyncIterator[Sequence[Row]]:
+    # サーバーサイドカーソルで結果を size 行ずつ取り出す
+    # レスポンスの送信中も使うため、リクエストの依存関係とは別に専用の読み取りセッションを開く
+    db = await open_read_session(user_id)
+    try:
+        # 必ずクエリを発行するので先に接続する（レプリカに接続できなければ run_db がプライマリに付け替える）
+        await run_db(db, Session.connection)
+        if isinstance(db, AsyncSession):
+            result = await db.stream(statement.execution_options(yield_per=size))
+            async for partition in result.partitions():
+                yield partition
+        else:
+            def partitions():
+                result = db.execute(statement.execution_options(yield_per=size))
+                yield from result.partitions()
+
+            async for partition in iterate_in_threadpool(partitions()):
+                yield partition
+    finally:
+        await _close(db)
+
+async def dispose_engines():
+    # 終了時にコネクションプールを閉じる
+    for async_engine_ in (async_engine, async_replica_engine):
+        if async_engine_ is not None:
+            await async_engine_.dispose()
+    await run_in_threadpool(engine.dispose)
+    if replica_engine is not None:
+        await run_in_threadpool(replica_engine.dispose)
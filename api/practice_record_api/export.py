@@ -0,0 +1,149 @@
+from sqlalchemy import Select, func, literal_column, select, type_coerce
+from sqlalchemy.dialects.postgresql import JSON, aggregate_order_by
+from models import Record, PracticeDetail, Tag, practice_tag_association_table
+from database import stream_partitions
+from typing import AsyncIterator
+import csv
+import io
+import orjson
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# GET /export: ユーザーの全レコードをストリーミングで書き出す
+# サーバーサイドカーソルから一定件数ずつ取り出して変換・送信するので、件数によらずメモリ使用量は一定
+#
+# layout:
+#   nested: 1行 = 1レコード。practiceDetails は GET /records と同じ入れ子の形（CSVではJSON文字列の列で、POST /records/bulk にそのまま渡せる）
+#   flat:   1行 = (レコード, 詳細, タグ) の組。詳細やタグのないレコードは content / tag が空になる
+
+RECORD_COLUMNS = ["id", "description", "date", "startTime", "startMinute", "endTime", "endMinute", "userId", "durationMinutes"]
+
+COLUMNS = {
+    "nested": RECORD_COLUMNS + ["practiceDetails"],
+    "flat": RECORD_COLUMNS + ["content", "tag"],
+}
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+_RECORD_FIELDS = [
+    pa.field("id", pa.int32()),
+    pa.field("description", pa.string()),
+    pa.field("date", pa.string()),
+    pa.field("startTime", pa.string()),
+    pa.field("startMinute", pa.string()),
+    pa.field("endTime", pa.string()),
+    pa.field("endMinute", pa.string()),
+    pa.field("userId", pa.string()),
+    pa.field("durationMinutes", pa.int32()),
+]
+
+PARQUET_SCHEMAS = {
+    "nested": pa.schema(_RECORD_FIELDS + [
+        pa.field("practiceDetails", pa.list_(pa.struct([
+            pa.field("content", pa.string()),
+            pa.field("tags", pa.list_(pa.struct([pa.field("name", pa.string())]))),
+        ]))),
+    ]),
+    "flat": pa.schema(_RECORD_FIELDS + [pa.field("content", pa.string()), pa.field("tag", pa.string())]),
+}
+
+def _record_columns():
+    return [
+        Record.id, Record.description, func.to_char(Record.date, "YYYY-MM-DD"),
+        Record.startTime, Record.startMinute, Record.endTime, Record.endMinute, Record.userId, Record.duration_minutes,
+    ]
+
+def export_query(user_id: str, layout: str) -> Select:
+    # 月表示と同じ (userId, date) のインデックス順に読み出す
+    if layout == "flat":
+        return select(*_record_columns(), PracticeDetail.content, Tag.name)\
+            .outerjoin(PracticeDetail, PracticeDetail.recordId == Record.id)\
+            .outerjoin(practice_tag_association_table, practice_tag_association_table.c.practice_detail_id == PracticeDetail.id)\
+            .outerjoin(Tag, Tag.id == practice_tag_association_table.c.tag_id)\
+            .where(Record.userId == user_id)\
+            .order_by(Record.date, Record.id, PracticeDetail.id, Tag.id)
+
+    # 詳細とタグはレコードごとの相関サブクエリでJSONに組み立てる（結合で行が増えず、レコード順のまま流せる）
+    tags = select(func.coalesce(
+        func.json_agg(aggregate_order_by(func.json_build_object(literal_column("'name'"), Tag.name), Tag.id)),
+        literal_column("'[]'::json")
+    )).select_from(practice_tag_association_table)\
+        .join(Tag, Tag.id == practice_tag_association_table.c.tag_id)\
+        .where(practice_tag_association_table.c.practice_detail_id == PracticeDetail.id)\
+        .scalar_subquery()
+    details = select(func.coalesce(
+        func.json_agg(aggregate_order_by(func.json_build_object(literal_column("'content'"), PracticeDetail.content, literal_column("'tags'"), tags), PracticeDetail.id)),
+        literal_column("'[]'::json")
+    )).where(PracticeDetail.recordId == Record.id)\
+        .scalar_subquery()
+
+    return select(*_record_columns(), type_coerce(details, JSON))\
+        .where(Record.userId == user_id)\
+        .order_by(Record.date, Record.id)
+
+class _ChunkSink(io.RawIOBase):
+    # ParquetWriter の出力を溜めておき、行グループを書くたびに取り出す
+    # 取り出した後も書き込み位置（フッターに記録されるオフセット）は累計で返す
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+async def _csv_chunks(partitions: AsyncIterator, layout: str) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS[layout])
+    async for partition in partitions:
+        for row in partition:
+            if layout == "nested":
+                row = tuple(row[:-1]) + (orjson.dumps(row[-1]).decode("utf-8"),)
+            writer.writerow(row)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+async def _ndjson_chunks(partitions: AsyncIterator, layout: str) -> AsyncIterator[bytes]:
+    columns = COLUMNS[layout]
+    async for partition in partitions:
+        yield b"".join(orjson.dumps(dict(zip(columns, row))) + b"\n" for row in partition)
+
+async def _parquet_chunks(partitions: AsyncIterator, layout: str) -> AsyncIterator[bytes]:
+    # 取り出した件数ごとに1つの行グループとして書き出す
+    columns = COLUMNS[layout]
+    schema = PARQUET_SCHEMAS[layout]
+    sink = _ChunkSink()
+    with pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema) as writer:
+        async for partition in partitions:
+            writer.write_table(pa.Table.from_pylist([dict(zip(columns, row)) for row in partition], schema=schema))
+            yield sink.take()
+    yield sink.take()
+
+FORMATS = {
+    "csv": _csv_chunks,
+    "ndjson": _ndjson_chunks,
+    "parquet": _parquet_chunks,
+}
+
+def export_chunks(user_id: str, format: str, layout: str) -> AsyncIterator[bytes]:
+    return FORMATS[format](stream_partitions(export_query(user_id, layout), user_id=user_id), layout)
@@ -1,14 +1,28 @@
-from fastapi import FastAPI, Depends, HTTPException, Query
+from fastapi import FastAPI, Depends, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session, aliased  # AsyncSessionの代わりにSessionをインポート
-from sqlalchemy import func, or_, and_, Integer
-from sqlalchemy.sql import exists
-from models import Base, SessionLocal, engine, Record, PracticeDetail, Tag
-from pydantic import BaseModel, Field
+from fastapi.responses import ORJSONResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from database import DbSession, get_db, get_read_db, note_writes, run_db, stream_partitions, dispose_engines
+from models import engine, async_engine, replica_engine, async_replica_engine
+from schemas import CreateRecordModel, RecordModel
+import crud
+import analysis
+import bulk_ingest
+import calendar_summary
+import export
+import cache
+import search
+import suggest
+import tag_cache
+import trends
+import metrics
+import write_batcher
 from typing import List, Optional
 import datetime
+import orjson
 
-app = FastAPI()
+# レスポンスは orjson でエンコードする（読み取り系は cache.cached_json が同じく orjson でエンコードしたJSONを返す）
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # CORSを許可するオリジンのリスト
 origins = [
@@ -24,82 +38,75 @@ app.add_middleware(
     allow_headers=["*"],  # すべてのHTTPヘッダーを許可
 )
 
-# データベース接続の依存関係
-def get_db():  # 非同期関数から同期関数に変更
-    try:
-        db = SessionLocal()
-        yield db
-    finally:
-        db.close()
-
-class PracticeTag(BaseModel):
-    name: str
-
-class PracticeDetailModel(BaseModel):
-    content: str
-    tags: List[PracticeTag]
-
-class CreateRecordModel(BaseModel):
-    description: str
-    date: datetime.date
-    startTime: str
-    startMinute: str
-    endTime: str
-    endMinute: str
-    userId: str
-    practiceDetails: List[PracticeDetailModel]
-
-class RecordModel(BaseModel):
-    id: int
-    description: str
-    date: datetime.date
-    startTime: str
-    startMinute: str
-    endTime: str
-    endMinute: str
-    userId: str
-    practiceDetails: List[PracticeDetailModel]
+# ルート・ステータスごとのレイテンシと、リクエストごとのSQL件数・時間を計測する
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.instrument_engine(engine, "sync")
+if async_engine is not None:
+    metrics.instrument_engine(async_engine.sync_engine, "async")
+if replica_engine is not None:
+    metrics.instrument_engine(replica_engine, "replica")
+if async_replica_engine is not None:
+    metrics.instrument_engine(async_replica_engine.sync_engine, "async_replica")
+
+@app.on_event("startup")
+async def startup():
+    # タグ名 -> ID のキャッシュを温めておく
+    await run_in_threadpool(tag_cache.warm)
+
+@app.on_event("shutdown")
+async def shutdown():
+    # 溜まっている書き込みを済ませてから接続を閉じる
+    if write_batcher.batcher is not None:
+        await write_batcher.batcher.close()
+    await dispose_engines()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    # Prometheus のテキスト形式
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 @app.post("/records/")
-def create_record(record_data: CreateRecordModel, db: Session = Depends(get_db)):
-    new_record = Record(
-        description=record_data.description,
-        date=record_data.date,
-        startTime=record_data.startTime,
-        startMinute=record_data.startMinute,
-        endTime=record_data.endTime,
-        endMinute=record_data.endMinute,
-        userId=record_data.userId,
+async def create_record(record_data: CreateRecordModel, db: DbSession = Depends(get_db)):
+    # WRITE_BATCHING=1 の場合は、同時に届いた他のリクエストとまとめて1トランザクションで書き込む
+    if write_batcher.batcher is not None:
+        record_id = await write_batcher.batcher.submit(record_data)
+    else:
+        record_id = await run_db(db, crud.create_record, record_data)
+    await note_writes([record_data.userId])
+    await cache.invalidate([(record_data.userId, record_data.date)])
+
+    return {"message": "Record created successfully", "id": record_id}
+
+@app.post("/records/bulk")
+async def bulk_create_records(request: Request, db: DbSession = Depends(get_db)):
+    # JSON配列 / NDJSON (application/x-ndjson) / CSV (text/csv) を受け付ける
+    buffer, count, errors, touched = await bulk_ingest.parse_rows(request)
+    inserted = await run_db(db, bulk_ingest.ingest_records, buffer, count)
+    await note_writes({user_id for user_id, _ in touched})
+    await cache.invalidate(touched)
+
+    return {"inserted": inserted, "errors": errors}
+
+# 年間カレンダー用の日ごとの集計（/records/{year}/{month}, /records/{record_id} より先に登録する）
+@app.get("/records/summary")
+async def get_records_summary(request: Request, userId: str, start_date: datetime.date, end_date: datetime.date, top: int = Query(3, ge=0, le=20), db: DbSession = Depends(get_read_db)):
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="end_date must not be before start_date")
+
+    return await cache.cached_json(
+        request, cache.user_scope(userId),
+        lambda: run_db(db, calendar_summary.day_summary, userId, start_date, end_date, top)
     )
-    db.add(new_record)
-    db.flush()  # RecordインスタンスをフラッシュしてIDを取得
 
-    for detail in record_data.practiceDetails:
-        new_detail = PracticeDetail(
-            content=detail.content,
-            recordId=new_record.id  # ここでRecordのIDを使用
-        )
-        db.add(new_detail)
-        # 各PracticeDetailに対して、タグを処理
-        for tag in detail.tags:
-            # 既存のタグを検索
-            existing_tag = db.query(Tag).filter(Tag.name == tag.name).first()
-            if existing_tag is None:
-                # タグが存在しない場合は新しいタグを作成
-                new_tag = Tag(name=tag.name)
-                db.add(new_tag)
-                db.flush()  # 新しいタグのIDを確実に取得するためにflush
-                new_detail.practiceTags.append(new_tag)
-            else:
-                # タグが既に存在する場合は、そのタグを使用
-                new_detail.practiceTags.append(existing_tag)
-
-    db.commit()  # すべてのデータが追加された後に一度だけcommit
-
-    return {"message": "Record created successfully"}
+@app.get("/records/{year}/summary")
+async def get_year_summary(request: Request, year: int, userId: str, top: int = Query(3, ge=0, le=20), db: DbSession = Depends(get_read_db)):
+    return await cache.cached_json(
+        request, cache.user_scope(userId),
+        lambda: run_db(db, calendar_summary.day_summary, userId, datetime.date(year, 1, 1), datetime.date(year, 12, 31), top)
+    )
 
 @app.get("/records/{year}/{month}", response_model=List[RecordModel])
-def get_records_by_month(year: int, month: int, userId: str, db: Session = Depends(get_db)):
+async def get_records_by_month(request: Request, year: int, month: int, userId: str, db: DbSession = Depends(get_read_db)):
     start_date = datetime.date(year, month, 1)
     # 月の最終日を取得するために、翌月の1日から1日引く
     if month == 12:
@@ -107,231 +114,164 @@ def get_records_by_month(year: int, month: int, userId: str, db: Session = Depen
     else:
         end_date = datetime.date(year, month + 1, 1) - datetime.timedelta(days=1)
 
-    records = db.query(Record).filter(Record.date >= start_date, Record.date <= end_date, Record.userId == userId).all()
-
-    result = []
-    for record in records:
-        practice_details = []
-        for detail in record.practiceDetails:
-            tags = [PracticeTag(name=tag.name) for tag in detail.practiceTags]
-            practice_details.append(PracticeDetailModel(content=detail.content, tags=tags))
-        result.append(RecordModel(
-            id=record.id,
-            description=record.description,
-            date=record.date,
-            startTime=record.startTime,
-            startMinute=record.startMinute,
-            endTime=record.endTime,
-            endMinute=record.endMinute,
-            userId=record.userId,  # userIdをレスポンスモデルに含める
-            practiceDetails=practice_details
-        ))
-
-    return result
+    return await cache.cached_json(
+        request, cache.month_scope(userId, year, month),
+        lambda: run_db(db, crud.get_records_between, userId, start_date, end_date)
+    )
 
+# /records/{record_id} の date（任意）はレコードの日付。指定するとその月のパーティションだけを読む
 @app.get("/records/{record_id}", response_model=RecordModel)
-def get_record_by_id(record_id: int, userId: str, db: Session = Depends(get_db)):
-    record = db.query(Record).filter(Record.id == record_id, Record.userId == userId).first()
-    if record is None:
-        raise HTTPException(status_code=404, detail="Record not found")
-
-    practice_details = []
-    for detail in record.practiceDetails:
-        tags = [PracticeTag(name=tag.name) for tag in detail.practiceTags]
-        practice_details.append(PracticeDetailModel(content=detail.content, tags=tags))
-
-    return RecordModel(
-        id=record.id,
-        description=record.description,
-        date=record.date,
-        startTime=record.startTime,
-        startMinute=record.startMinute,
-        endTime=record.endTime,
-        endMinute=record.endMinute,
-        userId=record.userId,  # userIdをレスポンスモデルに含める
-        practiceDetails=practice_details
-    )
+async def get_record_by_id(request: Request, record_id: int, userId: str, date: Optional[datetime.date] = None, db: DbSession = Depends(get_read_db)):
+    async def build():
+        record = await run_db(db, crud.get_record, record_id, userId, date)
+        if record is None:
+            raise HTTPException(status_code=404, detail="Record not found")
+        return record
+
+    return await cache.cached_json(request, cache.user_scope(userId), build)
+
+@app.delete("/records/")
+async def delete_records_between(userId: str, start_date: datetime.date, end_date: datetime.date, db: DbSession = Depends(get_db)):
+    # 期間内（両端を含む）のユーザーのレコードを詳細ごとまとめて削除する
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="end_date must not be before start_date")
+    deleted_dates = await run_db(db, crud.delete_records_between, userId, start_date, end_date)
+    await note_writes([userId])
+    await cache.invalidate([(userId, deleted_date) for deleted_date in set(deleted_dates)])
+
+    return {"message": "Records deleted successfully", "deleted": len(deleted_dates)}
 
 @app.delete("/records/{record_id}")
-def delete_record_by_id(record_id: int, userId: str, db: Session = Depends(get_db)):
-    # 指定されたIDのRecordを検索し、かつuserIdが一致するものを確認
-    record = db.query(Record).filter(Record.id == record_id, Record.userId == userId).first()
-    if record is None:
+async def delete_record_by_id(record_id: int, userId: str, date: Optional[datetime.date] = None, db: DbSession = Depends(get_db)):
+    deleted_date = await run_db(db, crud.delete_record, record_id, userId, date)
+    if deleted_date is None:
         raise HTTPException(status_code=404, detail="Record not found")
-
-    # Recordに関連するPracticeDetailを検索し、それぞれに関連するTagの関連付けを削除
-    for detail in record.practiceDetails:
-        # SQLAlchemyの多対多の関連を削除するには、関連するオブジェクトを直接削除する
-        detail.practiceTags = []
-        db.delete(detail)
-
-    # 最後にRecord自体を削除
-    db.delete(record)
-    db.commit()
+    await note_writes([userId])
+    await cache.invalidate([(userId, deleted_date)])
 
     return {"message": "Record deleted successfully"}
 
 @app.put("/records/{record_id}")
-def update_record_by_id(record_id: int, record_data: CreateRecordModel, db: Session = Depends(get_db)):
-    # 指定されたIDのRecordを検索し、かつuserIdが一致するものを確認
-    record = db.query(Record).filter(Record.id == record_id, Record.userId == record_data.userId).first()
-    if record is None:
+async def update_record_by_id(record_id: int, record_data: CreateRecordModel, date: Optional[datetime.date] = None, db: DbSession = Depends(get_db)):
+    # date は更新前のレコードの日付
+    previous_date = await run_db(db, crud.update_record, record_id, record_data, date)
+    if previous_date is None:
         raise HTTPException(status_code=404, detail="Record not found")
-
-    # Recordの情報を更新
-    record.description = record_data.description
-    record.date = record_data.date
-    record.startTime = record_data.startTime
-    record.startMinute = record_data.startMinute
-    record.endTime = record_data.endTime
-    record.endMinute = record_data.endMinute
-    # userIdの更新は不要なので、ここでは触らない
-
-    # 既存のPracticeDetailを削除
-    for detail in record.practiceDetails:
-        db.delete(detail)
-    db.commit()  # 変更をコミット
-
-    # 新しいPracticeDetailとTagを追加
-    for detail_data in record_data.practiceDetails:
-        new_detail = PracticeDetail(content=detail_data.content, recordId=record.id)
-        db.add(new_detail)
-        db.flush()  # IDを確実に取得するためにflush
-
-        for tag_data in detail_data.tags:
-            # 既存のタグを検索、なければ新規作成
-            tag = db.query(Tag).filter(Tag.name == tag_data.name).first()
-            if tag is None:
-                tag = Tag(name=tag_data.name)
-                db.add(tag)
-                db.flush()  # 新しいタグのIDを確実に取得するためにflush
-            new_detail.practiceTags.append(tag)
-
-    db.commit()  # 最終的な変更をコミット
+    await note_writes([record_data.userId])
+    await cache.invalidate([(record_data.userId, previous_date), (record_data.userId, record_data.date)])
 
     return {"message": "Record updated successfully"}
 
+@app.get("/export")
+async def export_records(userId: str, format: str = Query("ndjson", pattern="^(csv|ndjson|parquet)$"), layout: str = Query("nested", pattern="^(nested|flat)$")):
+    # ユーザーの全レコードをサーバーサイドカーソルで少しずつ読み出しながら送信する
+    return StreamingResponse(
+        export.export_chunks(userId, format, layout),
+        media_type=export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="records.{format}"'}
+    )
+
 @app.get("/analysis_tag")
-def get_analysis(start_date: Optional[datetime.date] = None, end_date: Optional[datetime.date] = None, contents: List[str] = Query(None), tag_names: List[str] = Query(None), description: Optional[str] = None, db: Session = Depends(get_db)):
-    # 基本となるクエリを構築
-    query = db.query(PracticeDetail.content, Tag.name, func.count(Tag.name).label('count'))\
-              .join(PracticeDetail.practiceTags)\
-              .join(Record, Record.id == PracticeDetail.recordId)\
-              .group_by(PracticeDetail.content, Tag.name)
-
-    # 期間フィルタリング
-    date_filters = []
-    if start_date:
-        date_filters.append(Record.date >= start_date)
-    if end_date:
-        date_filters.append(Record.date <= end_date)
-    if date_filters:
-        query = query.filter(and_(*date_filters))
-
-    # contentフィルタリング
-    if contents:
-        query = query.filter(or_(*[PracticeDetail.content == content for content in contents]))
-
-    # tag_namesフィルタリング
-    if tag_names:
-        query = query.filter(or_(*[Tag.name == tag_name for tag_name in tag_names]))
-
-    # descriptionフィルタリング（部分一致）
-    if description:
-        query = query.filter(Record.description.like(f"%{description}%"))
-
-    # 結果を取得
-    raw_result = query.all()
-
-    # 結果を整理
-    organized_result = {}
-    for content, tag, count in raw_result:
-        if content not in organized_result:
-            organized_result[content] = []
-        organized_result[content].append({tag: count})
-
-    # 最終的な形式に変換
-    final_result = [{content: tags} for content, tags in organized_result.items()]
-
-    return final_result
+async def get_analysis(request: Request, userId: str, start_date: Optional[datetime.date] = None, end_date: Optional[datetime.date] = None, contents: List[str] = Query(None), tag_names: List[str] = Query(None), description: Optional[str] = None, content_query: Optional[str] = None, db: DbSession = Depends(get_read_db)):
+    # ユーザーの練習内容・タグごとの件数
+    return await cache.cached_json(
+        request, cache.user_scope(userId),
+        lambda: run_db(db, analysis.tag_counts, userId, start_date, end_date, contents, tag_names, description, content_query)
+    )
 
 
 @app.get("/analysis_detail")
-def get_detailed_analysis(
+async def get_detailed_analysis(
+    request: Request,
+    userId: str,
     start_date: Optional[datetime.date] = None, 
     end_date: Optional[datetime.date] = None, 
     contents: List[str] = Query(None), 
     tag_names: List[str] = Query(None), 
     description: Optional[str] = None, 
+    content_query: Optional[str] = None,
     condition: Optional[str] = "and",
-    db: Session = Depends(get_db)
+    limit: Optional[int] = Query(None, ge=1, le=10000),
+    after: Optional[int] = None,
+    format: Optional[str] = Query(None, pattern="^ndjson$"),
+    db: DbSession = Depends(get_read_db)
 ):
-    # タグ名に基づくサブクエリを構築
-    if tag_names:
-        if condition == "or":
-            tag_conditions = [Tag.name == tag_name for tag_name in tag_names]
-            tag_subquery = db.query(PracticeDetail.id)\
-                .join(PracticeDetail.practiceTags)\
-                .filter(or_(*tag_conditions))\
-                .subquery()
-        else:  # デフォルトは "and" 条件
-            tag_conditions = [func.sum((Tag.name == tag_name).cast(Integer)) >= 1 for tag_name in tag_names]
-            tag_subquery = db.query(PracticeDetail.id)\
-                .join(PracticeDetail.practiceTags)\
-                .group_by(PracticeDetail.id)\
-                .having(and_(*tag_conditions))\
-                .subquery()
-
-    # タグ名を集約するためのサブクエリ
-    tags_subquery = db.query(
-        PracticeDetail.id.label("pd_id"),
-        func.array_agg(Tag.name).label("tags")
-    ).join(
-        PracticeDetail.practiceTags
-    ).group_by(
-        PracticeDetail.id
-    ).subquery()
-
-    # 基本となるクエリを構築
-    query = db.query(
-        PracticeDetail.id, 
-        PracticeDetail.content, 
-        Record.description, 
-        Record.date,
-        tags_subquery.c.tags
-    ).distinct(PracticeDetail.id).join(
-        Record, Record.id == PracticeDetail.recordId
-    ).outerjoin(
-        tags_subquery, tags_subquery.c.pd_id == PracticeDetail.id
+    # format=ndjson: サーバーサイドカーソルで1行ずつストリーミングする（件数によらずメモリ使用量は一定）
+    if format == "ndjson":
+        tag_ids = await run_db(db, analysis.tag_filter_ids, tag_names, condition)
+        statement = analysis.detail_query(userId, start_date, end_date, contents, tag_ids, description, condition, after, limit, content_query)
+
+        async def lines():
+            async for partition in stream_partitions(statement, user_id=userId):
+                yield b"".join(orjson.dumps(analysis.detail_row_to_dict(row)) + b"\n" for row in partition)
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    # limit を指定した場合は {"items": [...], "next_after": 次ページの after} を返す
+    if limit is not None:
+        return await cache.cached_json(
+            request, cache.user_scope(userId),
+            lambda: run_db(db, analysis.detail_page, userId, start_date, end_date, contents, tag_names, description, condition, after, limit, content_query)
+        )
+
+    return await cache.cached_json(
+        request, cache.user_scope(userId),
+        lambda: run_db(db, analysis.detail_rows, userId, start_date, end_date, contents, tag_names, description, condition, content_query, after)
     )
 
-    if tag_names:
-        query = query.join(tag_subquery, PracticeDetail.id == tag_subquery.c.id)
+@app.get("/analysis_duration")
+async def get_duration_analysis(request: Request, userId: str, group_by: str = Query("tag", pattern="^(tag|content|week)$"), start_date: Optional[datetime.date] = None, end_date: Optional[datetime.date] = None, contents: List[str] = Query(None), tag_names: List[str] = Query(None), description: Optional[str] = None, content_query: Optional[str] = None, db: DbSession = Depends(get_read_db)):
+    # タグ・練習内容・週ごとの練習時間の合計と平均（分）
+    return await cache.cached_json(
+        request, cache.user_scope(userId),
+        lambda: run_db(db, analysis.duration_summary, userId, group_by, start_date, end_date, contents, tag_names, description, content_query)
+    )
 
-    # 期間フィルタリング
-    if start_date:
-        query = query.filter(Record.date >= start_date)
-    if end_date:
-        query = query.filter(Record.date <= end_date)
+@app.get("/analysis_volume")
+async def get_volume_analysis(request: Request, userId: str, period: str = Query("week", pattern="^(week|month)$"), window: int = Query(4, ge=1, le=52), start_date: Optional[datetime.date] = None, end_date: Optional[datetime.date] = None, db: DbSession = Depends(get_read_db)):
+    # 週/月ごとの練習回数・練習日数・練習時間と、その移動平均
+    return await cache.cached_json(
+        request, cache.user_scope(userId),
+        lambda: run_db(db, trends.volume, userId, period, window, start_date, end_date)
+    )
 
-    # contentフィルタリング
-    if contents:
-        query = query.filter(or_(*[PracticeDetail.content == content for content in contents]))
+@app.get("/analysis_streak")
+async def get_streak_analysis(request: Request, userId: str, db: DbSession = Depends(get_read_db)):
+    # 連続して練習した日数（現在の連続記録と最長記録）
+    return await cache.cached_json(
+        request, cache.user_scope(userId),
+        lambda: run_db(db, trends.streaks, userId)
+    )
 
-    # descriptionフィルタリング（部分一致）
-    if description:
-        query = query.filter(Record.description.like(f"%{description}%"))
+@app.get("/analysis_tag_trend")
+async def get_tag_trend_analysis(request: Request, userId: str, top: int = Query(10, ge=1, le=100), start_date: Optional[datetime.date] = None, end_date: Optional[datetime.date] = None, db: DbSession = Depends(get_read_db)):
+    # よく使うタグの月ごとの使用回数と増減の傾き
+    return await cache.cached_json(
+        request, cache.user_scope(userId),
+        lambda: run_db(db, trends.tag_trend, userId, top, start_date, end_date)
+    )
 
-    # 結果を取得
-    result = query.all()
+@app.get("/analysis_content_time")
+async def get_content_time_analysis(request: Request, userId: str, start_date: Optional[datetime.date] = None, end_date: Optional[datetime.date] = None, db: DbSession = Depends(get_read_db)):
+    # 練習内容ごとの練習時間の分布
+    return await cache.cached_json(
+        request, cache.user_scope(userId),
+        lambda: run_db(db, trends.content_time, userId, start_date, end_date)
+    )
+
+@app.get("/search")
+async def search_records(request: Request, q: str = Query(..., min_length=1), userId: str = Query(...), limit: int = Query(20, ge=1, le=100), db: DbSession = Depends(get_read_db)):
+    # 説明・練習内容の部分一致/類似検索（類似度の高い順）
+    return await cache.cached_json(
+        request, cache.user_scope(userId),
+        lambda: run_db(db, search.search_records, q, userId, limit)
+    )
 
-    # 結果を整理
-    final_result = [{
-        "id": id_,
-        "content": content, 
-        "description": record_description, 
-        "date": record_date.strftime("%Y-%m-%d"), 
-        "tags": tags
-    } for id_, content, record_description, record_date, tags in result]
+# 入力補完（ユーザーの使用回数の多い順）。入力のたびに呼ばれるため、suggest.prefix_cache で前方一致ごとの候補をキャッシュする
+@app.get("/tags/suggest")
+async def suggest_tags(userId: str, prefix: str = Query(..., min_length=1, max_length=100), limit: int = Query(10, ge=1, le=suggest.MAX_LIMIT), db: DbSession = Depends(get_read_db)):
+    return await suggest.suggest(db, "tag", userId, prefix, limit)
 
-    return final_result
+@app.get("/contents/suggest")
+async def suggest_contents(userId: str, prefix: str = Query(..., min_length=1, max_length=100), limit: int = Query(10, ge=1, le=suggest.MAX_LIMIT), db: DbSession = Depends(get_read_db)):
+    return await suggest.suggest(db, "content", userId, prefix, limit)
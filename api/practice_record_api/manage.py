@@ -0,0 +1,106 @@
+# 運用コマンド
+# 使い方: cd api/practice_record_api && python manage.py <command>
+import argparse
+import json
+import sys
+
+from models import SessionLocal
+import partitions
+import rollup
+import tag_arrays
+import tag_gc
+import usage
+
+def rebuild_rollup(args):
+    with SessionLocal() as db:
+        count = rollup.rebuild(db)
+    print(f"tag_daily_rollup rebuilt: {count} rows")
+
+def check_rollup(args):
+    with SessionLocal() as db:
+        inconsistencies = rollup.find_inconsistencies(db, args.limit)
+    for row in inconsistencies:
+        print(json.dumps(row, ensure_ascii=False))
+    if inconsistencies:
+        print(f"tag_daily_rollup is inconsistent with the raw data ({len(inconsistencies)} keys shown)")
+        sys.exit(1)
+    print("tag_daily_rollup is consistent")
+
+def rebuild_tag_ids(args):
+    with SessionLocal() as db:
+        count = tag_arrays.rebuild(db)
+    print(f"practice_details.tag_ids rebuilt: {count} rows updated")
+
+def check_tag_ids(args):
+    with SessionLocal() as db:
+        inconsistencies = tag_arrays.find_inconsistencies(db, args.limit)
+    for row in inconsistencies:
+        print(json.dumps(row))
+    if inconsistencies:
+        print(f"practice_details.tag_ids is inconsistent with practice_tag_association ({len(inconsistencies)} details shown)")
+        sys.exit(1)
+    print("practice_details.tag_ids is consistent")
+
+def rebuild_usage(args):
+    with SessionLocal() as db:
+        count = usage.rebuild(db)
+    print(f"user_tag_usage / user_content_usage rebuilt: {count} rows")
+
+def check_usage(args):
+    with SessionLocal() as db:
+        inconsistencies = usage.find_inconsistencies(db, args.limit)
+    for row in inconsistencies:
+        print(json.dumps(row, ensure_ascii=False))
+    if inconsistencies:
+        print(f"user_tag_usage / user_content_usage are inconsistent with the raw data ({len(inconsistencies)} keys shown)")
+        sys.exit(1)
+    print("user_tag_usage / user_content_usage are consistent")
+
+def create_partitions(args):
+    with SessionLocal() as db:
+        created = partitions.ensure_partitions(db, args.months_ahead)
+    for name in created:
+        print(name)
+    print(f"records partitions created: {len(created)}")
+
+def gc_tags(args):
+    with SessionLocal() as db:
+        count = tag_gc.collect(db, args.batch_size, args.pause_ms)
+    print(f"unused tags deleted: {count}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("rebuild-rollup", help="tag_daily_rollup を生データから再計算する").set_defaults(func=rebuild_rollup)
+
+    check = subparsers.add_parser("check-rollup", help="tag_daily_rollup と生データの集計を比較する")
+    check.add_argument("--limit", type=int, default=100)
+    check.set_defaults(func=check_rollup)
+
+    subparsers.add_parser("rebuild-tag-ids", help="practice_details.tag_ids を関連テーブルから再計算する").set_defaults(func=rebuild_tag_ids)
+
+    check_tags = subparsers.add_parser("check-tag-ids", help="practice_details.tag_ids と関連テーブルを比較する")
+    check_tags.add_argument("--limit", type=int, default=100)
+    check_tags.set_defaults(func=check_tag_ids)
+
+    subparsers.add_parser("rebuild-usage", help="サジェスト用の使用回数を生データから再計算する").set_defaults(func=rebuild_usage)
+
+    check_usage_parser = subparsers.add_parser("check-usage", help="サジェスト用の使用回数と生データの集計を比較する")
+    check_usage_parser.add_argument("--limit", type=int, default=100)
+    check_usage_parser.set_defaults(func=check_usage)
+
+    create = subparsers.add_parser("create-partitions", help="records の月ごとのパーティションを先の月の分まで作成する")
+    create.add_argument("--months-ahead", type=int, default=12)
+    create.set_defaults(func=create_partitions)
+
+    gc = subparsers.add_parser("gc-tags", help="どの詳細にも使われていないタグを削除する")
+    gc.add_argument("--batch-size", type=int, default=1000, help="1トランザクションで確認するタグの件数")
+    gc.add_argument("--pause-ms", type=float, default=0, help="トランザクションの間に待つ時間（ミリ秒）")
+    gc.set_defaults(func=gc_tags)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+from contextvars import ContextVar
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import logging
+import os
+import threading
+import time
+
+# リクエスト・SQL・コネクションプールの計測値を集め、/metrics で Prometheus のテキスト形式で公開する
+# 値はプロセスごとに保持する（複数ワーカーの場合は Prometheus 側でワーカーごとに収集・集約する）
+#
+# SLOW_QUERY_MS: この時間(ミリ秒)を超えたSQLを、パラメータ付きで practice_record_api.slow_query に WARNING で出力する（0で無効）
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))
+
+slow_query_logger = logging.getLogger("practice_record_api.slow_query")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # ラベル値 -> ([バケットごとの件数], 合計, 件数)
+        self._series: Dict[Tuple[str, ...], List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(labels, list(counts), total, count) for labels, (counts, total, count) in sorted(self._series.items())]
+        for labels, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, labels, ('le', _format_value(bound)))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, labels, ('le', '+Inf'))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {count}")
+        return lines
+
+class Gauge:
+    # 値は収集時に collect() で求める（プールの使用数など、その時点の状態を表す値）
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str], collect: Callable[[], Dict[Tuple[str, ...], float]], metric_type: str = "gauge"):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.collect = collect
+        self.metric_type = metric_type
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.metric_type}"]
+        for labels, value in sorted(self.collect().items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}")
+        return lines
+
+REQUEST_DURATION = Histogram("http_request_duration_seconds", "HTTP request latency until the response body is sent.", ("method", "route", "status"))
+REQUEST_QUERIES = Histogram("http_request_db_queries", "Number of SQL statements executed per HTTP request.", ("method", "route"), COUNT_BUCKETS)
+REQUEST_DB_TIME = Histogram("http_request_db_seconds", "Total SQL execution time per HTTP request.", ("method", "route"))
+QUERY_DURATION = Histogram("db_query_duration_seconds", "SQL statement execution time.", ("engine",))
+POOL_WAIT = Histogram("db_pool_checkout_wait_seconds", "Time spent waiting for a connection from the pool.", ("engine",))
+
+_registry: List = [REQUEST_DURATION, REQUEST_QUERIES, REQUEST_DB_TIME, QUERY_DURATION, POOL_WAIT]
+_engines: Dict[str, Engine] = {}
+
+def register(metric):
+    # 他のモジュールの計測値（キャッシュのヒット数など）を /metrics に追加する
+    _registry.append(metric)
+    return metric
+
+def render() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# リクエストごとの [SQL件数, SQL実行時間の合計]
+# ミュータブルなリストを入れておくので、スレッドプールや run_sync の中で加算してもリクエスト側から見える
+_request_stats: ContextVar[Optional[List]] = ContextVar("request_stats", default=None)
+
+def instrument_engine(engine: Engine, name: str):
+    # SQLの実行時間・件数とプールの待ち時間を計測する。非同期エンジンは sync_engine を渡す
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started_at"].pop()
+        QUERY_DURATION.observe(elapsed, name)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats[0] += 1
+            stats[1] += elapsed
+        if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+            slow_query_logger.warning("slow query (%.1f ms) on %s: %s parameters=%r", elapsed * 1000, name, " ".join(statement.split()), parameters)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        # 失敗した文の開始時刻を取り除く（次の文の計測がずれないように）
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_started_at"):
+            conn.info["query_started_at"].pop()
+
+    # プールにはチェックアウト待ちのイベントがないため、接続を取り出す _do_get を計測用に包む
+    pool = engine.pool
+    do_get = pool._do_get
+
+    def timed_do_get():
+        started = time.perf_counter()
+        try:
+            return do_get()
+        finally:
+            POOL_WAIT.observe(time.perf_counter() - started, name)
+
+    pool._do_get = timed_do_get
+    _engines[name] = engine
+
+def _pool_connections() -> Dict[Tuple[str, ...], float]:
+    values = {}
+    for name, engine in _engines.items():
+        pool = engine.pool
+        if not hasattr(pool, "checkedout"):
+            continue
+        values[(name, "in_use")] = pool.checkedout()
+        values[(name, "idle")] = pool.checkedin()
+        values[(name, "overflow")] = max(pool.overflow(), 0)
+    return values
+
+register(Gauge("db_pool_connections", "Connections held by the pool, by state.", ("engine", "state"), _pool_connections))
+
+class MetricsMiddleware:
+    # ルートのテンプレート（/records/{record_id} など）とステータスコードごとにレイテンシを記録する
+    # レスポンスボディの送信完了までを計測するので、ストリーミングのレスポンスも含まれる
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        stats = [0, 0.0]
+        token = _request_stats.set(stats)
+        status = "500"
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _request_stats.reset(token)
+            route = scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            REQUEST_DURATION.observe(time.perf_counter() - started, scope["method"], route_path, status)
+            REQUEST_QUERIES.observe(stats[0], scope["method"], route_path)
+            REQUEST_DB_TIME.observe(stats[1], scope["method"], route_path)
@@ -1,6 +1,7 @@
 import os
-from sqlalchemy import Column, ForeignKey, Integer, String, DateTime, Table, create_engine
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy import DDL, Column, Computed, ForeignKey, Index, Integer, String, Date, DateTime, Table, create_engine, event, func, literal_column, text
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import declarative_base, relationship
 from sqlalchemy.orm import sessionmaker
 
@@ -11,11 +12,36 @@ DB_PORT = os.getenv("DB_PORT")
 DB_NAME = os.getenv("DB_NAME")
 print(f"{DB_HOST} {DB_USER_NAME} {DB_USER_PASS} {DB_PORT} {DB_NAME}")
 
+# DBアクセスのバックエンド切り替え: "sync"(psycopg2 + スレッドプール) / "async"(asyncpg)
+DB_BACKEND = os.getenv("DB_BACKEND", "sync")
+
 SQLALCHEMY_DATABASE_URL = f"postgresql://{DB_USER_NAME}:{DB_USER_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+ASYNC_SQLALCHEMY_DATABASE_URL = f"postgresql+asyncpg://{DB_USER_NAME}:{DB_USER_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
 engine = create_engine(SQLALCHEMY_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 非同期エンジンは DB_BACKEND=async のときだけ作成する
+async_engine = create_async_engine(ASYNC_SQLALCHEMY_DATABASE_URL) if DB_BACKEND == "async" else None
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False) if async_engine is not None else None
+
+# 読み取り専用のレプリカ（DB_REPLICA_HOST を指定した場合だけ作成する。他の設定は省略するとプライマリと同じ値になる）
+# GET エンドポイントは database.get_read_db 経由でレプリカに振り分けられる
+DB_REPLICA_HOST = os.getenv("DB_REPLICA_HOST")
+DB_REPLICA_USER_NAME = os.getenv("DB_REPLICA_USER_NAME", DB_USER_NAME)
+DB_REPLICA_USER_PASS = os.getenv("DB_REPLICA_USER_PASS", DB_USER_PASS)
+DB_REPLICA_PORT = os.getenv("DB_REPLICA_PORT", DB_PORT)
+DB_REPLICA_NAME = os.getenv("DB_REPLICA_NAME", DB_NAME)
+
+REPLICA_DATABASE_URL = f"postgresql://{DB_REPLICA_USER_NAME}:{DB_REPLICA_USER_PASS}@{DB_REPLICA_HOST}:{DB_REPLICA_PORT}/{DB_REPLICA_NAME}"
+ASYNC_REPLICA_DATABASE_URL = f"postgresql+asyncpg://{DB_REPLICA_USER_NAME}:{DB_REPLICA_USER_PASS}@{DB_REPLICA_HOST}:{DB_REPLICA_PORT}/{DB_REPLICA_NAME}"
+
+replica_engine = create_engine(REPLICA_DATABASE_URL, pool_pre_ping=True) if DB_REPLICA_HOST else None
+ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine) if replica_engine is not None else None
+
+async_replica_engine = create_async_engine(ASYNC_REPLICA_DATABASE_URL, pool_pre_ping=True) if DB_REPLICA_HOST and DB_BACKEND == "async" else None
+AsyncReplicaSessionLocal = async_sessionmaker(async_replica_engine, autoflush=False, expire_on_commit=False) if async_replica_engine is not None else None
+
 Base = declarative_base()
 
 
@@ -23,32 +49,123 @@ Base = declarative_base()
 practice_tag_association_table = Table(
     'practice_tag_association',
     Base.metadata,
-    Column('practice_detail_id', ForeignKey('practice_details.id'), primary_key=True),
-    Column('tag_id', ForeignKey('tags.id'), primary_key=True)
+    # 詳細を削除すると関連付けも削除される（タグ側は、使われているタグを削除できないように CASCADE にしない）
+    Column('practice_detail_id', ForeignKey('practice_details.id', ondelete='CASCADE'), primary_key=True),
+    Column('tag_id', ForeignKey('tags.id'), primary_key=True),
+    Index('ix_practice_tag_association_tag_id', 'tag_id', 'practice_detail_id')
 )
 
+# 開始・終了の時/分の文字列から練習時間を求めるSQL（数字でない値の場合はNULLになる）
+# 終了が開始より前の場合は日付をまたいだものとみなす
+START_MINUTE_OF_DAY_SQL = """("startTime"::integer * 60 + coalesce(nullif("startMinute", ''), '0')::integer)"""
+END_MINUTE_OF_DAY_SQL = """("endTime"::integer * 60 + coalesce(nullif("endMinute", ''), '0')::integer)"""
+TIME_IS_VALID_SQL = """("startTime" ~ '^[0-9]{1,2}$' AND coalesce("startMinute", '') ~ '^[0-9]{0,2}$' AND "endTime" ~ '^[0-9]{1,2}$' AND coalesce("endMinute", '') ~ '^[0-9]{0,2}$')"""
+DURATION_MINUTES_SQL = f"CASE WHEN {TIME_IS_VALID_SQL} THEN ({END_MINUTE_OF_DAY_SQL} - {START_MINUTE_OF_DAY_SQL} + 1440) % 1440 END"
+START_AT_SQL = f"CASE WHEN {TIME_IS_VALID_SQL} THEN date::date + make_interval(mins => {START_MINUTE_OF_DAY_SQL}) END"
+END_AT_SQL = f"CASE WHEN {TIME_IS_VALID_SQL} THEN date::date + make_interval(mins => {START_MINUTE_OF_DAY_SQL} + ({END_MINUTE_OF_DAY_SQL} - {START_MINUTE_OF_DAY_SQL} + 1440) % 1440) END"
+
+# records は date の月ごとに範囲パーティション化している（子テーブルは records_y2024m01 のような名前。partitions.py で作成する）
+# パーティションキーを含める必要があるため主キーは (id, date)。id はシーケンスで採番されるので、ORM上は id だけで識別する
+# date で絞り込むクエリは該当する月のパーティションだけを読む。どのパーティションにも入らない日付は records_default に入る
 class Record(Base):
     __tablename__ = 'records'
-    id = Column(Integer, primary_key=True, index=True)
+    __table_args__ = (
+        # 月表示と、ユーザーごとの分析（id と description を含めてインデックスだけで読めるようにする）
+        Index('ix_records_userId_date', 'userId', 'date', postgresql_include=['id', 'description']),
+        # 部分一致検索（LIKE '%...%' / 類似度検索）用の pg_trgm インデックス
+        Index('ix_records_description_trgm', 'description', postgresql_using='gin', postgresql_ops={'description': 'gin_trgm_ops'}),
+        {'postgresql_partition_by': 'RANGE (date)'},
+    )
+    id = Column(Integer, primary_key=True, autoincrement=True)  # 複合主キーなので自動採番（SERIAL）を明示する
     description = Column(String, index=True)
-    date = Column(DateTime, index=True)
+    date = Column(DateTime, primary_key=True, index=True)
     startTime = Column(String)
     startMinute = Column(String)
     endTime = Column(String)
     endMinute = Column(String)
     userId = Column(String)
-    practiceDetails = relationship("PracticeDetail", back_populates="record")
+    # 上の文字列の列から生成される列（書き込み処理からは更新しない）
+    start_at = Column(DateTime, Computed(START_AT_SQL, persisted=True))
+    end_at = Column(DateTime, Computed(END_AT_SQL, persisted=True))
+    duration_minutes = Column(Integer, Computed(DURATION_MINUTES_SQL, persisted=True))
+    practiceDetails = relationship("PracticeDetail", back_populates="record", order_by="PracticeDetail.id",
+                                   primaryjoin="Record.id == foreign(PracticeDetail.recordId)")
+    __mapper_args__ = {'primary_key': [id]}
+
+# create_all で作成した場合も書き込めるように、既定のパーティションを作っておく（本番のスキーマはマイグレーションで作る）
+event.listen(Record.__table__, 'after_create', DDL("CREATE TABLE records_default PARTITION OF records DEFAULT"))
+
+def practice_period():
+    # 練習時間帯の範囲（両端を含むので、0分の練習も空の範囲にならない）
+    # インデックスの式と一致させるため、境界の指定はパラメータにせずSQLに直接書く
+    return func.tsrange(Record.start_at, Record.end_at, literal_column("'[]'"))
+
+# 期間の重なり（&&）で絞り込むための GiST インデックス
+Index('ix_records_practice_period', practice_period(), postgresql_using='gist')
 
 class PracticeDetail(Base):
     __tablename__ = 'practice_details'
-    id = Column(Integer, primary_key=True, index=True)
-    recordId = Column(Integer, ForeignKey('records.id'))
+    __table_args__ = (
+        Index('ix_practice_details_content_trgm', 'content', postgresql_using='gin', postgresql_ops={'content': 'gin_trgm_ops'}),
+        # タグでの絞り込み（@> / &&）用
+        Index('ix_practice_details_tag_ids', 'tag_ids', postgresql_using='gin'),
+        # records -> practice_details の結合キー（分析で使う列を含めてインデックスだけで読めるようにする）
+        Index('ix_practice_details_recordId', 'recordId', postgresql_include=['id', 'content', 'tag_ids']),
+    )
+    id = Column(Integer, primary_key=True)
+    # records はパーティション化されていて id だけの一意制約を持てないため、外部キー制約はない
+    # （レコードの削除は crud._delete_records が詳細と同じ1文で削除し、更新とは records の行ロックで排他して整合性を保つ）
+    recordId = Column(Integer)
     content = Column(String, index=True)
-    record = relationship("Record", back_populates="practiceDetails")
+    # practiceTags のタグIDの配列（昇順・重複なし）。書き込み処理が関連付けと一緒に更新する（tag_arrays.py）
+    tag_ids = Column(ARRAY(Integer), nullable=False, server_default=text("'{}'"))
+    record = relationship("Record", back_populates="practiceDetails", primaryjoin="foreign(PracticeDetail.recordId) == Record.id")
     practiceTags = relationship("Tag", secondary=practice_tag_association_table, back_populates="practiceDetails")
 
 class Tag(Base):
     __tablename__ = 'tags'
-    id = Column(Integer, primary_key=True, index=True)
+    __table_args__ = (
+        # タグ名の前方一致（LIKE 'prefix%'）用。name の既定の照合順序のインデックスは前方一致に使えないため
+        Index('ix_tags_name_pattern', 'name', postgresql_ops={'name': 'text_pattern_ops'}),
+    )
+    id = Column(Integer, primary_key=True)
     name = Column(String, unique=True, index=True)
-    practiceDetails = relationship("PracticeDetail", secondary=practice_tag_association_table, back_populates="practiceTags")
\ No newline at end of file
+    practiceDetails = relationship("PracticeDetail", secondary=practice_tag_association_table, back_populates="practiceTags")
+
+# /analysis_tag 用の集計テーブル（ユーザー・日・内容・タグごとの件数）
+# 各書き込み処理が差分を反映し、manage.py rebuild-rollup で全件から再計算できる
+class TagDailyRollup(Base):
+    __tablename__ = 'tag_daily_rollup'
+    __table_args__ = (
+        # ユーザーごとの期間の集計（件数まで含めてインデックスだけで読めるようにする）
+        Index('ix_tag_daily_rollup_userId_day', 'userId', 'day', postgresql_include=['content', 'tag_id', 'count']),
+        # タグの削除（manage.py gc-tags）時の参照の確認用
+        Index('ix_tag_daily_rollup_tag_id', 'tag_id'),
+    )
+    userId = Column(String, primary_key=True)  # userId が NULL の古いレコードは '' として集計する
+    day = Column(Date, primary_key=True)
+    content = Column(String, primary_key=True)
+    tag_id = Column(Integer, ForeignKey('tags.id'), primary_key=True)
+    count = Column(Integer, nullable=False)
+
+# サジェスト（GET /tags/suggest, GET /contents/suggest）用のユーザーごとの使用回数（詳細の件数）
+# 各書き込み処理が差分を反映し、manage.py rebuild-usage で全件から再計算できる（usage.py）
+class UserTagUsage(Base):
+    __tablename__ = 'user_tag_usage'
+    __table_args__ = (
+        # タグの削除（manage.py gc-tags）時の参照の確認用
+        Index('ix_user_tag_usage_tag_id', 'tag_id'),
+    )
+    userId = Column(String, primary_key=True)
+    tag_id = Column(Integer, ForeignKey('tags.id'), primary_key=True)
+    count = Column(Integer, nullable=False)
+
+class UserContentUsage(Base):
+    __tablename__ = 'user_content_usage'
+    __table_args__ = (
+        # ユーザーごとの内容の前方一致（件数まで含めてインデックスだけで読めるようにする）
+        Index('ix_user_content_usage_userId_content_pattern', 'userId', 'content', postgresql_ops={'content': 'text_pattern_ops'}, postgresql_include=['count']),
+    )
+    userId = Column(String, primary_key=True)
+    content = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False)
@@ -0,0 +1,75 @@
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from models import Record
+from typing import Iterable, List, Set
+import datetime
+
+# records の月ごとのパーティションの管理（manage.py create-partitions から使う）
+# パーティション [月初, 翌月初) は records_y2024m01 のような名前で、どの月にも入らない行は records_default に入る
+# 既定のパーティションに行がある月のパーティションは作成できないため、その月の行は作成時に新しいパーティションへ移す
+
+DEFAULT_PARTITION = "records_default"
+
+# 生成列を除いた、行を移すときに書き込む列
+STORED_COLUMNS = ", ".join(f'"{column.name}"' for column in Record.__table__.columns if column.computed is None)
+
+def month_start(day: datetime.date) -> datetime.date:
+    return datetime.date(day.year, day.month, 1)
+
+def add_months(month: datetime.date, months: int) -> datetime.date:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+def partition_name(month: datetime.date) -> str:
+    return f"records_y{month.year:04d}m{month.month:02d}"
+
+def existing_partitions(db: Session) -> Set[str]:
+    return set(db.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = 'records'::regclass"
+    )).scalars())
+
+def months_in_default(db: Session) -> List[datetime.date]:
+    # 既定のパーティションに入っている行の月（日付のない行は除く）
+    return [
+        month.date() for month in db.execute(text(
+            f"SELECT DISTINCT date_trunc('month', date) FROM {DEFAULT_PARTITION} WHERE date IS NOT NULL ORDER BY 1"
+        )).scalars()
+    ]
+
+def create_partitions(db: Session, months: Iterable[datetime.date]) -> List[str]:
+    # まだない月のパーティションを作成し、作成したパーティションの名前を返す（1トランザクションで行う）
+    existing = existing_partitions(db)
+    missing = sorted(month for month in {month_start(month) for month in months} if partition_name(month) not in existing)
+    if not missing:
+        return []
+
+    # 既定のパーティションに行がある月は、既定のパーティションを一旦切り離してから作成し、行を移す
+    # 切り離している間は records 全体がロックされるので、行の移動が必要な場合は利用の少ない時間に実行すること
+    moving = sorted(set(missing) & set(months_in_default(db)))
+    if moving:
+        db.execute(text(f"ALTER TABLE records DETACH PARTITION {DEFAULT_PARTITION}"))
+
+    for month in missing:
+        db.execute(text(
+            f"CREATE TABLE {partition_name(month)} PARTITION OF records "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+        ))
+
+    if moving:
+        for month in moving:
+            bounds = {"start": month, "end": add_months(month, 1)}
+            db.execute(text(
+                f"INSERT INTO records ({STORED_COLUMNS}) SELECT {STORED_COLUMNS} FROM {DEFAULT_PARTITION} WHERE date >= :start AND date < :end"
+            ), bounds)
+            db.execute(text(f"DELETE FROM {DEFAULT_PARTITION} WHERE date >= :start AND date < :end"), bounds)
+        db.execute(text(f"ALTER TABLE records ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+
+    db.commit()
+    return [partition_name(month) for month in missing]
+
+def ensure_partitions(db: Session, months_ahead: int, today: datetime.date = None) -> List[str]:
+    # 今月から months_ahead か月先までと、既定のパーティションに入っている月のパーティションを作成する
+    current = month_start(today or datetime.date.today())
+    months = [add_months(current, offset) for offset in range(months_ahead + 1)]
+    months.extend(months_in_default(db))
+    return create_partitions(db, months)
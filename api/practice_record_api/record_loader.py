@@ -0,0 +1,69 @@
+from sqlalchemy import select
+from sqlalchemy.orm import Session, selectinload
+from models import Record, PracticeDetail, Tag, practice_tag_association_table
+from typing import List, Optional
+
+# Record -> PracticeDetail -> Tag を selectin で一括ロードする
+# records 1回 + practice_details 1回 + tags 1回 の固定3クエリで済み、件数に比例してクエリが増えない
+RECORD_LOAD_OPTIONS = selectinload(Record.practiceDetails).selectinload(PracticeDetail.practiceTags)
+
+def load_records(db: Session, *criteria) -> List[Record]:
+    return db.query(Record)\
+             .options(RECORD_LOAD_OPTIONS)\
+             .filter(*criteria)\
+             .order_by(Record.date, Record.id)\
+             .all()
+
+def load_record_for_update(db: Session, *criteria) -> Optional[Record]:
+    # 更新用: records の行を FOR NO KEY UPDATE でロックしてからロードする
+    # 同時に実行された削除（crud._delete_records）は、この更新がコミットされるまで待つ
+    return db.query(Record)\
+             .options(RECORD_LOAD_OPTIONS)\
+             .filter(*criteria)\
+             .with_for_update(key_share=True)\
+             .first()
+
+def load_record_dicts(db: Session, *criteria) -> List[dict]:
+    # 読み取り専用のエンドポイント用: ORMオブジェクトやPydanticモデルを作らず、行から直接レスポンスのdictを組み立てる
+    # キーの順序・値の形式は RecordModel をJSONにしたものと同じ。クエリは load_records と同じ固定3回
+    records = {}
+    for id_, description, date, start_time, start_minute, end_time, end_minute, user_id, duration_minutes in db.execute(
+        select(Record.id, Record.description, Record.date, Record.startTime, Record.startMinute,
+               Record.endTime, Record.endMinute, Record.userId, Record.duration_minutes)
+        .where(*criteria)
+        .order_by(Record.date, Record.id)
+    ):
+        records[id_] = {
+            "id": id_,
+            "description": description,
+            "date": date.date().isoformat(),
+            "startTime": start_time,
+            "startMinute": start_minute,
+            "endTime": end_time,
+            "endMinute": end_minute,
+            "userId": user_id,
+            "practiceDetails": [],
+            "durationMinutes": duration_minutes,
+        }
+    if not records:
+        return []
+
+    details = {}
+    for detail_id, record_id, content in db.execute(
+        select(PracticeDetail.id, PracticeDetail.recordId, PracticeDetail.content)
+        .where(PracticeDetail.recordId.in_(list(records)))
+        .order_by(PracticeDetail.id)
+    ):
+        details[detail_id] = {"content": content, "tags": []}
+        records[record_id]["practiceDetails"].append(details[detail_id])
+
+    if details:
+        for detail_id, name in db.execute(
+            select(practice_tag_association_table.c.practice_detail_id, Tag.name)
+            .join(Tag, Tag.id == practice_tag_association_table.c.tag_id)
+            .where(practice_tag_association_table.c.practice_detail_id.in_(list(details)))
+            .order_by(practice_tag_association_table.c.practice_detail_id, Tag.id)
+        ):
+            details[detail_id]["tags"].append({"name": name})
+
+    return list(records.values())
@@ -0,0 +1,103 @@
+from sqlalchemy import insert, update, delete, tuple_
+from sqlalchemy.orm import Session
+from models import Record, PracticeDetail, practice_tag_association_table
+from schemas import PracticeDetailModel
+from tag_resolver import resolve_tag_ids
+from tag_arrays import tag_id_array
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+def insert_associations(db: Session, associations: Iterable[Tuple[int, int]]):
+    # (practice_detail_id, tag_id) の組を1文の複数行INSERTで挿入する
+    associations = sorted(set(associations))
+    if associations:
+        db.execute(
+            insert(practice_tag_association_table).values([
+                {"practice_detail_id": detail_id, "tag_id": tag_id}
+                for detail_id, tag_id in associations
+            ])
+        )
+
+def insert_practice_details(db: Session, details: Sequence[Tuple[int, PracticeDetailModel]], tag_ids: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+    # (recordId, 詳細) の組をまとめて挿入し、タグ名 -> タグID の対応を返す
+    # タグ解決・詳細の挿入・関連付けの挿入がそれぞれ1文で済むため、詳細やタグの数に比例して文が増えない
+    if not details:
+        return tag_ids or {}
+
+    if tag_ids is None:
+        tag_ids = resolve_tag_ids(db, (tag.name for _, detail in details for tag in detail.tags))
+
+    # sort_by_parameter_order で、返されるIDの順序を入力の順序と一致させる
+    detail_ids = db.execute(
+        insert(PracticeDetail).returning(PracticeDetail.id, sort_by_parameter_order=True),
+        [
+            {"recordId": record_id, "content": detail.content, "tag_ids": tag_id_array(tag_ids[tag.name] for tag in detail.tags)}
+            for record_id, detail in details
+        ]
+    ).scalars().all()
+
+    # 同じ詳細に同じタグが重複して指定されても主キー違反にならないように重複を除く
+    insert_associations(db, (
+        (detail_id, tag_ids[tag.name])
+        for detail_id, (_, detail) in zip(detail_ids, details)
+        for tag in detail.tags
+    ))
+
+    return tag_ids
+
+def update_practice_details(db: Session, record: Record, incoming: List[PracticeDetailModel]) -> Dict[str, int]:
+    # 保存済みの詳細（id順）と送られてきた詳細を位置ごとに突き合わせ、差分だけを書き込む
+    # 送られてきた詳細に含まれるタグ名 -> タグID の対応を返す
+    # 詳細にはクライアント側のIDがないため、位置で対応付けると並び順とIDを保ったまま最小の変更で済む
+    # record の practiceDetails / practiceTags はロード済みであること（record_loader.load_record_for_update）
+    stored = record.practiceDetails
+    known_tag_ids = {tag.name: tag.id for detail in stored for tag in detail.practiceTags}
+
+    changed_details: List[Tuple[int, PracticeDetailModel]] = []
+    removed_links: Set[Tuple[int, int]] = set()
+    added_links: List[Tuple[int, str]] = []
+    for stored_detail, detail_data in zip(stored, incoming):
+        old_names = {tag.name for tag in stored_detail.practiceTags}
+        new_names = {tag.name for tag in detail_data.tags}
+        if stored_detail.content != detail_data.content or old_names != new_names:
+            changed_details.append((stored_detail.id, detail_data))
+        removed_links.update((stored_detail.id, known_tag_ids[name]) for name in old_names - new_names)
+        added_links.extend((stored_detail.id, name) for name in new_names - old_names)
+
+    deleted_detail_ids = [detail.id for detail in stored[len(incoming):]]
+    new_details = [(record.id, detail) for detail in incoming[len(stored):]]
+
+    if not (changed_details or deleted_detail_ids or new_details):
+        return known_tag_ids
+
+    # 追加が必要なタグのうち、まだIDが分からないものだけをまとめて解決する
+    unknown_names = {name for _, name in added_links}
+    unknown_names.update(tag.name for _, detail in new_details for tag in detail.tags)
+    unknown_names.difference_update(known_tag_ids)
+    tag_ids = dict(known_tag_ids)
+    tag_ids.update(resolve_tag_ids(db, unknown_names))
+
+    # 内容かタグが変わった詳細は、内容と tag_ids をまとめて更新する
+    if changed_details:
+        db.execute(update(PracticeDetail), [
+            {"id": detail_id, "content": detail_data.content, "tag_ids": tag_id_array(tag_ids[tag.name] for tag in detail_data.tags)}
+            for detail_id, detail_data in changed_details
+        ])
+
+    if removed_links:
+        db.execute(
+            delete(practice_tag_association_table).where(
+                tuple_(
+                    practice_tag_association_table.c.practice_detail_id,
+                    practice_tag_association_table.c.tag_id
+                ).in_(sorted(removed_links))
+            )
+        )
+    insert_associations(db, ((detail_id, tag_ids[name]) for detail_id, name in added_links))
+
+    # 削除した詳細の関連付けは外部キーの ON DELETE CASCADE で削除される
+    if deleted_detail_ids:
+        db.execute(delete(PracticeDetail).where(PracticeDetail.id.in_(deleted_detail_ids)))
+
+    insert_practice_details(db, new_details, tag_ids)
+
+    return tag_ids
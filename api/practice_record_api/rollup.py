@@ -0,0 +1,100 @@
+from collections import Counter
+from sqlalchemy import delete, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from models import TagDailyRollup
+from typing import Iterable, Optional, Tuple
+import datetime
+
+# tag_daily_rollup の保守
+# 書き込み処理は変更前後の (userId, day, content, tag_id) ごとの件数を数え、その差分だけを1文で反映する
+
+RollupKey = Tuple[str, datetime.date, str, int]
+
+# 生データ（records / practice_details / practice_tag_association）からの集計
+# records_filter で対象のレコードを絞り込める
+RAW_ROLLUP_SELECT = """
+SELECT coalesce(r."userId", '') AS "userId", r.date::date AS day, pd.content, pta.tag_id, count(*) AS count
+FROM records r
+JOIN practice_details pd ON pd."recordId" = r.id
+JOIN practice_tag_association pta ON pta.practice_detail_id = pd.id
+{records_filter}
+GROUP BY 1, 2, 3, 4
+"""
+
+def rollup_keys(user_id: Optional[str], date, details: Iterable[Tuple[str, Iterable[int]]]) -> Counter:
+    # 1件のレコードが集計に寄与する件数。details は (content, tag_ids) の組
+    day = date.date() if isinstance(date, datetime.datetime) else date
+    keys = Counter()
+    for content, tag_ids in details:
+        for tag_id in set(tag_ids):
+            keys[(user_id or "", day, content, tag_id)] += 1
+    return keys
+
+def apply_rollup_delta(db: Session, before: Counter, after: Counter):
+    delta = Counter(after)
+    delta.subtract(before)
+    rows = [
+        {"userId": user_id, "day": day, "content": content, "tag_id": tag_id, "count": count}
+        for (user_id, day, content, tag_id), count in sorted(delta.items())
+        if count != 0
+    ]
+    if not rows:
+        return
+
+    # キー順に並べて更新し、同時に書き込むリクエスト間のデッドロックを防ぐ
+    statement = pg_insert(TagDailyRollup).values(rows)
+    db.execute(
+        statement.on_conflict_do_update(
+            index_elements=[TagDailyRollup.userId, TagDailyRollup.day, TagDailyRollup.content, TagDailyRollup.tag_id],
+            set_={"count": TagDailyRollup.count + statement.excluded.count}
+        )
+    )
+
+    # 件数が0になった行は削除する
+    if any(row["count"] < 0 for row in rows):
+        db.execute(
+            delete(TagDailyRollup).where(
+                TagDailyRollup.count <= 0,
+                TagDailyRollup.userId.in_({row["userId"] for row in rows})
+            )
+        )
+
+def add_records_sql(db: Session, record_ids_sql: str):
+    # 一括取り込み用: record_ids_sql（レコードIDを返すSQL）のレコードを集計に加える
+    db.execute(text(f"""
+        INSERT INTO tag_daily_rollup ("userId", day, content, tag_id, count)
+        SELECT * FROM ({RAW_ROLLUP_SELECT.format(records_filter=f"WHERE r.id IN ({record_ids_sql})")}) delta
+        ORDER BY 1, 2, 3, 4
+        ON CONFLICT ("userId", day, content, tag_id) DO UPDATE SET count = tag_daily_rollup.count + excluded.count
+    """))
+
+def rebuild(db: Session) -> int:
+    # 集計テーブルを生データから作り直す
+    # EXCLUSIVE ロックで書き込み処理の差分反映を待たせ、作り直し中も読み取りは可能にする
+    db.execute(text("LOCK TABLE tag_daily_rollup IN EXCLUSIVE MODE"))
+    db.execute(text("DELETE FROM tag_daily_rollup"))
+    result = db.execute(text(f"""
+        INSERT INTO tag_daily_rollup ("userId", day, content, tag_id, count)
+        {RAW_ROLLUP_SELECT.format(records_filter="")}
+    """))
+    db.commit()
+    return result.rowcount
+
+def find_inconsistencies(db: Session, limit: int = 100) -> list:
+    # 集計テーブルと生データの集計を突き合わせ、件数が異なるキーを返す
+    rows = db.execute(text(f"""
+        SELECT coalesce(raw."userId", rollup."userId"), coalesce(raw.day, rollup.day),
+               coalesce(raw.content, rollup.content), coalesce(raw.tag_id, rollup.tag_id),
+               coalesce(raw.count, 0), coalesce(rollup.count, 0)
+        FROM ({RAW_ROLLUP_SELECT.format(records_filter="")}) raw
+        FULL OUTER JOIN tag_daily_rollup rollup
+          ON rollup."userId" = raw."userId" AND rollup.day = raw.day
+         AND rollup.content = raw.content AND rollup.tag_id = raw.tag_id
+        WHERE coalesce(raw.count, 0) <> coalesce(rollup.count, 0)
+        LIMIT :limit
+    """), {"limit": limit})
+    return [
+        {"userId": user_id, "day": day.isoformat(), "content": content, "tag_id": tag_id, "raw": raw, "rollup": rollup}
+        for user_id, day, content, tag_id, raw, rollup in rows
+    ]
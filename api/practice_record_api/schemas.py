@@ -0,0 +1,33 @@
+from pydantic import BaseModel
+from typing import List, Optional
+import datetime
+
+class PracticeTag(BaseModel):
+    name: str
+
+class PracticeDetailModel(BaseModel):
+    content: str
+    tags: List[PracticeTag]
+
+class CreateRecordModel(BaseModel):
+    description: str
+    date: datetime.date
+    startTime: str
+    startMinute: str
+    endTime: str
+    endMinute: str
+    userId: str
+    practiceDetails: List[PracticeDetailModel]
+
+class RecordModel(BaseModel):
+    id: int
+    description: str
+    date: datetime.date
+    startTime: str
+    startMinute: str
+    endTime: str
+    endMinute: str
+    userId: str
+    practiceDetails: List[PracticeDetailModel]
+    # 開始・終了時刻から求めた練習時間（分）。時刻を解釈できない場合はNone
+    durationMinutes: Optional[int] = None
@@ -0,0 +1,52 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import func, or_, select, union
+from models import Record, PracticeDetail
+
+# 部分一致検索。ix_records_description_trgm / ix_practice_details_content_trgm（pg_trgm の GIN）が使われる
+# % と _ はエスケープし、入力はそのままの文字列として扱う
+def description_filter(text: str):
+    return Record.description.contains(text, autoescape=True)
+
+def content_filter(text: str):
+    return PracticeDetail.content.contains(text, autoescape=True)
+
+def _fuzzy_match(column, text: str):
+    # word_similarity(text, column) が pg_trgm.word_similarity_threshold 以上（GIN インデックスが使える形）
+    return column.op('%>')(text)
+
+def search_records(db: Session, q: str, user_id: str, limit: int) -> list:
+    # 説明・練習内容のどちらかに部分一致 or 類似するレコードを、類似度の高い順に返す
+    # 表ごとにインデックスを使って候補を絞ってから結合する（OR で結合すると両表の全件走査になる）
+    matched = union(
+        select(Record.id.label('record_id'))
+            .where(Record.userId == user_id)
+            .where(or_(description_filter(q), _fuzzy_match(Record.description, q))),
+        select(PracticeDetail.recordId.label('record_id'))
+            .join(Record, Record.id == PracticeDetail.recordId)
+            .where(Record.userId == user_id)
+            .where(or_(content_filter(q), _fuzzy_match(PracticeDetail.content, q))),
+    ).subquery()
+
+    score = func.greatest(
+        func.coalesce(func.word_similarity(q, Record.description), 0),
+        func.coalesce(func.max(func.word_similarity(q, PracticeDetail.content)), 0),
+    ).label('score')
+
+    # records の主キーは (id, date) なので、description などを選択するために両方でグループ化する
+    query = select(Record.id, Record.date, Record.description, score)\
+        .join(matched, matched.c.record_id == Record.id)\
+        .outerjoin(PracticeDetail, PracticeDetail.recordId == Record.id)\
+        .where(Record.userId == user_id)\
+        .group_by(Record.id, Record.date)\
+        .order_by(score.desc(), Record.date.desc(), Record.id.desc())\
+        .limit(limit)
+
+    return [
+        {
+            "id": id_,
+            "date": record_date.strftime("%Y-%m-%d"),
+            "description": description,
+            "score": round(float(score_), 3),
+        }
+        for id_, record_date, description, score_ in db.execute(query)
+    ]
@@ -0,0 +1,139 @@
+from collections import OrderedDict
+from sqlalchemy import exists, select, text
+from sqlalchemy.orm import Session
+from database import DbSession, run_db
+from models import Tag, UserTagUsage, UserContentUsage
+from typing import Dict, List, Optional, Tuple
+import os
+import time
+import cache
+import metrics
+
+# タグ・内容の入力補完（GET /tags/suggest, GET /contents/suggest）
+# ユーザーの使用回数（user_tag_usage / user_content_usage）の多い順に、前方一致する候補を返す
+# タグはユーザーが使ったことのないタグでも、他のユーザーが作成したものを名前順で後ろに補う（表記ゆれのタグを増やさないため）
+#
+# 入力のたびに呼ばれるので、前方一致ごとの候補をプロセス内にキャッシュする（PrefixCache）
+# 候補が SUGGEST_CANDIDATES 件以下で全件揃っている前方一致は、それより長い前方一致にもキャッシュから絞り込んで答える
+# （"s" の候補が揃っていれば "sc", "sca" ... はDBに問い合わせない）
+# キャッシュはレスポンスキャッシュ（cache.py）のユーザーのスコープのバージョンと一緒に保存し、そのユーザーの書き込みで無効になる
+# 他のユーザーが作成したタグは SUGGEST_CACHE_TTL_SECONDS 経過まで反映されない。CACHE_BACKEND=none の場合はキャッシュしない
+SUGGEST_CACHE_TTL_SECONDS = int(os.getenv("SUGGEST_CACHE_TTL_SECONDS", "300"))
+SUGGEST_CACHE_MAX_ENTRIES = int(os.getenv("SUGGEST_CACHE_MAX_ENTRIES", "10000"))
+SUGGEST_CANDIDATES = int(os.getenv("SUGGEST_CANDIDATES", "200"))
+
+# limit パラメータの上限
+MAX_LIMIT = 50
+
+# (名前または内容, ユーザーの使用回数)
+Candidate = Tuple[str, int]
+
+# text_pattern_ops のインデックス（ix_tags_name_pattern）の順序。前方一致の範囲をインデックス順に読み、LIMIT で打ち切れる
+TAG_NAME_PATTERN_ORDER = text("tags.name USING ~<~")
+
+def tag_candidates(db: Session, user_id: str, prefix: str, limit: int) -> List[Candidate]:
+    used = db.execute(
+        select(Tag.name, UserTagUsage.count)
+        .join(Tag, Tag.id == UserTagUsage.tag_id)
+        .where(UserTagUsage.userId == user_id, Tag.name.startswith(prefix, autoescape=True))
+        .order_by(UserTagUsage.count.desc(), Tag.name)
+        .limit(limit)
+    ).all()
+    candidates = [(name, count) for name, count in used]
+    if len(candidates) >= limit:
+        return candidates
+
+    # ユーザーが使ったことのないタグで補う
+    others = db.execute(
+        select(Tag.name)
+        .where(
+            Tag.name.startswith(prefix, autoescape=True),
+            ~exists().where(UserTagUsage.userId == user_id, UserTagUsage.tag_id == Tag.id)
+        )
+        .order_by(TAG_NAME_PATTERN_ORDER)
+        .limit(limit - len(candidates))
+    ).scalars()
+    return candidates + [(name, 0) for name in others]
+
+def content_candidates(db: Session, user_id: str, prefix: str, limit: int) -> List[Candidate]:
+    # ix_user_content_usage_userId_content_pattern の範囲だけを読む
+    rows = db.execute(
+        select(UserContentUsage.content, UserContentUsage.count)
+        .where(UserContentUsage.userId == user_id, UserContentUsage.content.startswith(prefix, autoescape=True))
+        .order_by(UserContentUsage.count.desc(), UserContentUsage.content)
+        .limit(limit)
+    ).all()
+    return [(content, count) for content, count in rows]
+
+# kind -> (候補の読み込み, レスポンスのキー)
+KINDS = {
+    "tag": (tag_candidates, "name"),
+    "content": (content_candidates, "content"),
+}
+
+class PrefixCache:
+    def __init__(self, max_entries: int = SUGGEST_CACHE_MAX_ENTRIES, ttl_seconds: int = SUGGEST_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        # (kind, userId, 前方一致) -> (期限, スコープのバージョン, 候補が全件揃っているか, 候補)
+        self._entries: "OrderedDict[Tuple[str, str, str], Tuple[float, str, bool, List[Candidate]]]" = OrderedDict()
+
+    def get(self, kind: str, user_id: str, prefix: str, version: str) -> Optional[List[Candidate]]:
+        # prefix 自体か、候補が全件揃っているより短い前方一致のエントリから候補を返す
+        now = time.monotonic()
+        for length in range(len(prefix), 0, -1):
+            key = (kind, user_id, prefix[:length])
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+            expires_at, entry_version, complete, candidates = entry
+            if expires_at < now or entry_version != version:
+                del self._entries[key]
+                continue
+            if length < len(prefix) and not complete:
+                continue
+            self._entries.move_to_end(key)
+            self.hits += 1
+            if length == len(prefix):
+                return candidates
+            # 使用回数順のまま絞り込む
+            return [candidate for candidate in candidates if candidate[0].startswith(prefix)]
+        self.misses += 1
+        return None
+
+    def put(self, kind: str, user_id: str, prefix: str, version: str, complete: bool, candidates: List[Candidate]):
+        key = (kind, user_id, prefix)
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, version, complete, candidates)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+prefix_cache = PrefixCache()
+
+metrics.register(metrics.Gauge(
+    "suggest_cache_lookups_total", "Suggest requests answered from the in-process prefix cache.", ("result",),
+    lambda: {("hit",): prefix_cache.hits, ("miss",): prefix_cache.misses}, "counter"
+))
+metrics.register(metrics.Gauge(
+    "suggest_cache_entries", "Prefixes held in the in-process suggest cache.", (),
+    lambda: {(): prefix_cache.stats()["entries"]}
+))
+
+async def suggest(db: DbSession, kind: str, user_id: str, prefix: str, limit: int) -> List[dict]:
+    load, field = KINDS[kind]
+    version = await cache.cache.version(cache.user_scope(user_id)) if cache.cache is not None else None
+    candidates = prefix_cache.get(kind, user_id, prefix, version) if version is not None else None
+    if candidates is None:
+        # 1件多く読み、SUGGEST_CANDIDATES 件以下なら全件揃っているとみなす
+        candidates = await run_db(db, load, user_id, prefix, SUGGEST_CANDIDATES + 1)
+        complete = len(candidates) <= SUGGEST_CANDIDATES
+        candidates = candidates[:SUGGEST_CANDIDATES]
+        if version is not None:
+            prefix_cache.put(kind, user_id, prefix, version, complete, candidates)
+
+    return [{field: term, "count": count} for term, count in candidates[:limit]]
@@ -0,0 +1,41 @@
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from typing import Iterable, List
+
+# practice_details.tag_ids の保守
+# 詳細に付いたタグIDの配列（昇順・重複なし）。practice_tag_association と同じ内容を詳細の行にも持たせたもの
+# タグでの絞り込み（and: @> / or: &&）を ix_practice_details_tag_ids（GIN）で行い、タグ名も関連テーブルを集約せずに引ける
+# 書き込み処理は関連付けと同じトランザクションで更新し、manage.py rebuild-tag-ids で関連テーブルから再計算できる
+
+# 関連テーブルから求めた詳細のタグIDの配列（pd は practice_details の別名）
+ASSOCIATED_TAG_IDS_SQL = "ARRAY(SELECT pta.tag_id FROM practice_tag_association pta WHERE pta.practice_detail_id = pd.id ORDER BY pta.tag_id)"
+
+def tag_id_array(tag_ids: Iterable[int]) -> List[int]:
+    return sorted(set(tag_ids))
+
+def refresh_details_sql(db: Session, detail_ids_sql: str) -> int:
+    # 一括投入用: detail_ids_sql（詳細IDを返すSQL）の詳細の tag_ids を関連テーブルから更新する
+    return db.execute(text(f"""
+        UPDATE practice_details pd SET tag_ids = {ASSOCIATED_TAG_IDS_SQL}
+        WHERE pd.id IN ({detail_ids_sql}) AND pd.tag_ids IS DISTINCT FROM {ASSOCIATED_TAG_IDS_SQL}
+    """)).rowcount
+
+def rebuild(db: Session) -> int:
+    # 全ての詳細の tag_ids を関連テーブルから作り直し、更新した行数を返す
+    count = refresh_details_sql(db, "SELECT id FROM practice_details")
+    db.commit()
+    return count
+
+def find_inconsistencies(db: Session, limit: int = 100) -> list:
+    # tag_ids と関連テーブルの内容が異なる詳細を返す
+    rows = db.execute(text(f"""
+        SELECT pd.id, pd.tag_ids, {ASSOCIATED_TAG_IDS_SQL}
+        FROM practice_details pd
+        WHERE pd.tag_ids IS DISTINCT FROM {ASSOCIATED_TAG_IDS_SQL}
+        ORDER BY pd.id
+        LIMIT :limit
+    """), {"limit": limit})
+    return [
+        {"practice_detail_id": detail_id, "tag_ids": tag_ids, "associated": associated}
+        for detail_id, tag_ids, associated in rows
+    ]
@@ -0,0 +1,116 @@
+from collections import OrderedDict
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from models import Tag, SessionLocal
+import metrics
+from typing import Dict, Iterable, List, Tuple
+import os
+import threading
+import time
+
+# タグ名 -> タグID のプロセス内キャッシュ（LRU）
+# タグは一度作られると名前もIDも変わらないが、使われなくなったタグは manage.py gc-tags で削除され、
+# 同じ名前のタグが別のIDで作り直されることがある。gc-tags は別のプロセスなので、ワーカーのキャッシュは次のように入れ替える
+#   - 書き込み: 削除済みのIDで書き込むと外部キー違反になるので、キャッシュを捨てて書き込み直す（crud._retry_on_stale_tags）
+#   - 読み取り（lookup_tag_ids）: ミスがあればDBに問い合わせるついでに、キャッシュにあった名前もDBから引き直す
+#   - どちらでもなくヒットし続けるエントリは TAG_CACHE_TTL_SECONDS で期限切れになる
+# 他のワーカーが作成したタグはミスとしてDBから引かれる（resolve_tag_ids の ON CONFLICT DO NOTHING で競合も安全）
+# 同期関数はスレッドプールから同時に呼ばれるため、ロックで保護する
+TAG_CACHE_MAX_ENTRIES = int(os.getenv("TAG_CACHE_MAX_ENTRIES", "50000"))
+TAG_CACHE_TTL_SECONDS = int(os.getenv("TAG_CACHE_TTL_SECONDS", "300"))
+
+class TagCache:
+    def __init__(self, max_entries: int = TAG_CACHE_MAX_ENTRIES, ttl_seconds: int = TAG_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        # 名前 -> (期限, ID)
+        self._entries: "OrderedDict[str, Tuple[float, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, names: Iterable[str]) -> Tuple[Dict[str, int], List[str]]:
+        # (キャッシュにあった 名前 -> ID, キャッシュになかった名前) を返す
+        found = {}
+        missing = []
+        now = time.monotonic()
+        with self._lock:
+            for name in names:
+                entry = self._entries.get(name)
+                if entry is not None and entry[0] < now:
+                    del self._entries[name]
+                    entry = None
+                if entry is None:
+                    missing.append(name)
+                else:
+                    self._entries.move_to_end(name)
+                    found[name] = entry[1]
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, missing
+
+    def put_many(self, tag_ids: Dict[str, int]):
+        expires_at = time.monotonic() + self.ttl_seconds
+        with self._lock:
+            for name, tag_id in tag_ids.items():
+                self._entries[name] = (expires_at, tag_id)
+                self._entries.move_to_end(name)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def forget(self, names: Iterable[str]):
+        with self._lock:
+            for name in names:
+                self._entries.pop(name, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+tag_cache = TagCache()
+
+metrics.register(metrics.Gauge(
+    "tag_cache_lookups_total", "Tag name lookups served from the in-process tag cache.", ("result",),
+    lambda: {("hit",): tag_cache.hits, ("miss",): tag_cache.misses}, "counter"
+))
+metrics.register(metrics.Gauge(
+    "tag_cache_entries", "Tags held in the in-process tag cache.", (),
+    lambda: {(): tag_cache.stats()["entries"]}
+))
+
+def lookup_tag_ids(db: Session, names: Iterable[str]) -> Dict[str, int]:
+    # 既存タグの 名前 -> ID を返す（存在しない名前は含まれない。タグは作成しない）
+    names = sorted(set(names))
+    found, missing = tag_cache.get_many(names)
+    if missing:
+        # 問い合わせの件数は変わらないので、キャッシュにあった名前も引き直して削除・作り直されたタグのIDを入れ替える
+        found = {name: tag_id for tag_id, name in db.execute(select(Tag.id, Tag.name).where(Tag.name.in_(names)))}
+        # 読み取りのみのセッションで見えるタグはコミット済みなのでそのままキャッシュしてよい
+        tag_cache.put_many(found)
+        tag_cache.forget(name for name in names if name not in found)
+    return found
+
+def remember_after_commit(db: Session, tag_ids: Dict[str, int]):
+    # このトランザクションで作成したタグはコミットされるまでキャッシュしない
+    # （ロールバックされたIDをキャッシュすると、以後の書き込みが外部キー違反になる）
+    db.info.setdefault("pending_tag_ids", {}).update(tag_ids)
+
+@event.listens_for(Session, "after_commit")
+def _cache_pending_tags(db: Session):
+    pending = db.info.pop("pending_tag_ids", None)
+    if pending:
+        tag_cache.put_many(pending)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending_tags(db: Session):
+    db.info.pop("pending_tag_ids", None)
+
+def warm():
+    # 起動時にIDの新しい順（よく使われている可能性が高い）に上限まで読み込む
+    with SessionLocal() as db:
+        rows = db.execute(select(Tag.id, Tag.name).order_by(Tag.id.desc()).limit(tag_cache.max_entries)).all()
+    tag_cache.put_many({name: tag_id for tag_id, name in reversed(rows)})
@@ -0,0 +1,68 @@
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from tag_cache import tag_cache
+import logging
+import time
+
+# どの詳細にも使われなくなったタグの削除（manage.py gc-tags）
+# レコード・詳細の削除ではタグは削除しない（同じタグがすぐまた使われることが多く、書き込みのたびに参照を確認したくない）
+# タグをIDの順に batch_size 件ずつ区切り、区間ごとに別のトランザクションで、
+# 関連付け・集計テーブル・使用回数のテーブルのどれからも参照されていないタグを削除する
+# 書き込み中のリクエストが関連付けを挿入したタグは行ロックされているので SKIP LOCKED で飛ばす
+# 確認とDELETEの間に参照されてコミットされた場合は外部キー違反になるので、その区間をやり直す
+# 削除したタグはこのプロセスのタグのキャッシュから除く（APIのワーカーのキャッシュの入れ替えは tag_cache.py を参照）
+
+# 同じ区間で続けて失敗したらあきらめる回数
+MAX_CONSECUTIVE_FAILURES = 3
+
+logger = logging.getLogger("practice_record_api.tag_gc")
+
+# 次の区間の最後のタグID（なければ NULL）
+NEXT_BATCH_END = text("""
+SELECT max(id) FROM (SELECT id FROM tags WHERE id > :after ORDER BY id LIMIT :batch_size) batch
+""")
+
+DELETE_UNUSED_TAGS = text("""
+DELETE FROM tags
+WHERE id IN (
+    SELECT t.id FROM tags t
+    WHERE t.id > :after AND t.id <= :until
+      AND NOT EXISTS (SELECT 1 FROM practice_tag_association pta WHERE pta.tag_id = t.id)
+      AND NOT EXISTS (SELECT 1 FROM tag_daily_rollup r WHERE r.tag_id = t.id)
+      AND NOT EXISTS (SELECT 1 FROM user_tag_usage u WHERE u.tag_id = t.id)
+    FOR UPDATE SKIP LOCKED
+)
+RETURNING name
+""")
+
+def collect(db: Session, batch_size: int = 1000, pause_ms: float = 0) -> int:
+    # 削除したタグの件数を返す
+    # 1回のDELETEで確認するタグを batch_size 件に限り、ロックとWALの量を抑える
+    # pause_ms: 区間の間に待つ時間（ミリ秒）。書き込み処理への影響をさらに抑えたい場合に使う
+    deleted = 0
+    after = 0
+    failures = 0
+    while True:
+        until = db.execute(NEXT_BATCH_END, {"after": after, "batch_size": batch_size}).scalar()
+        if until is None:
+            db.commit()
+            return deleted
+
+        try:
+            names = db.execute(DELETE_UNUSED_TAGS, {"after": after, "until": until}).scalars().all()
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            failures += 1
+            if failures >= MAX_CONSECUTIVE_FAILURES:
+                raise
+            logger.info("tags in (%d, %d] were referenced while collecting, retrying", after, until)
+            continue
+
+        failures = 0
+        tag_cache.forget(names)
+        deleted += len(names)
+        after = until
+        if pause_ms > 0:
+            time.sleep(pause_ms / 1000)
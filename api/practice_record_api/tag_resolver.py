@@ -0,0 +1,45 @@
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from models import Tag
+from tag_cache import tag_cache, remember_after_commit
+from typing import Dict, Iterable
+
+# 挿入とIDの参照の間にタグが削除された場合に、挿入からやり直す回数の上限
+MAX_RESOLVE_ATTEMPTS = 3
+
+def resolve_tag_ids(db: Session, names: Iterable[str]) -> Dict[str, int]:
+    # ペイロード中の全タグ名を集合としてまとめて解決する（タグ数によらず通常は最大2文)
+    # 名前順に並べて挿入することで、同時リクエスト間のロック順序を揃えてデッドロックを防ぐ
+    # キャッシュにあるタグはDBに問い合わせない
+    tag_ids, names = tag_cache.get_many(sorted(set(names)))
+    for _ in range(MAX_RESOLVE_ATTEMPTS):
+        if not names:
+            return tag_ids
+
+        # 未登録のタグだけが挿入される。同時に別リクエストが同じタグを作成しても一意制約違反にはならない
+        inserted = db.execute(
+            pg_insert(Tag)
+            .values([{"name": name} for name in names])
+            .on_conflict_do_nothing(index_elements=[Tag.name])
+            .returning(Tag.id, Tag.name)
+        )
+        created = {name: tag_id for tag_id, name in inserted}
+        remember_after_commit(db, created)
+        tag_ids.update(created)
+
+        # 既に存在していたタグはIDを引く
+        # 同じトランザクション内で先に作成したタグ以外はコミット済みなので、すぐキャッシュしてよい
+        existing_names = [name for name in names if name not in created]
+        if existing_names:
+            existing = {name: tag_id for tag_id, name in db.execute(select(Tag.id, Tag.name).where(Tag.name.in_(existing_names)))}
+            pending = db.info.get("pending_tag_ids", {})
+            tag_cache.put_many({name: tag_id for name, tag_id in existing.items() if name not in pending})
+            tag_ids.update(existing)
+
+        # 挿入が競合した後、IDを引く前に manage.py gc-tags が削除したタグは見つからないので、もう一度挿入する
+        names = [name for name in existing_names if name not in tag_ids]
+
+    if names:
+        raise RuntimeError(f"tags were deleted while resolving: {', '.join(names)}")
+    return tag_ids
@@ -0,0 +1,167 @@
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from models import Record, PracticeDetail, Tag, practice_tag_association_table
+from typing import Optional
+import datetime
+import numpy as np
+import pandas as pd
+
+# ユーザー単位の長期の傾向分析（/analysis_volume, /analysis_streak, /analysis_tag_trend, /analysis_content_time）
+# レコード・詳細・タグを1回のクエリで列指向の DataFrame に読み込み、集計は pandas / numpy のベクトル演算で行う
+# 行ごとの Python ループを使わないので、数年分のレコードでも集計時間がほとんど増えない
+
+FRAME_COLUMNS = ["record_id", "date", "duration_minutes", "content", "tag"]
+
+# 期間の区切り（週は月曜始まり、月は月初）
+PERIOD_RULES = {"week": "W-MON", "month": "MS"}
+
+def load_frame(db: Session, user_id: str, start_date: Optional[datetime.date] = None, end_date: Optional[datetime.date] = None) -> pd.DataFrame:
+    # 1行 = (レコード, 詳細, タグ) の組。詳細やタグのないレコードも content / tag を欠損値として含める
+    query = select(Record.id, Record.date, Record.duration_minutes, PracticeDetail.content, Tag.name)\
+        .outerjoin(PracticeDetail, PracticeDetail.recordId == Record.id)\
+        .outerjoin(practice_tag_association_table, practice_tag_association_table.c.practice_detail_id == PracticeDetail.id)\
+        .outerjoin(Tag, Tag.id == practice_tag_association_table.c.tag_id)\
+        .where(Record.userId == user_id)
+
+    # 期間フィルタリング
+    if start_date:
+        query = query.where(Record.date >= start_date)
+    if end_date:
+        query = query.where(Record.date <= end_date)
+
+    frame = pd.DataFrame.from_records(db.execute(query).all(), columns=FRAME_COLUMNS)
+    frame["date"] = pd.to_datetime(frame["date"]).dt.normalize()
+    frame["duration_minutes"] = pd.to_numeric(frame["duration_minutes"], errors="coerce")
+    return frame
+
+def _records(frame: pd.DataFrame) -> pd.DataFrame:
+    # レコード単位（1レコード1行）にする
+    return frame.drop_duplicates("record_id")[["record_id", "date", "duration_minutes"]]
+
+def _resample(frame: pd.DataFrame, period: str):
+    # 期間の開始日をラベルにして区切る（練習のない期間も含まれる）
+    return frame.set_index("date").resample(PERIOD_RULES[period], label="left", closed="left")
+
+def _day(value) -> str:
+    return pd.Timestamp(value).strftime("%Y-%m-%d")
+
+def volume_from_frame(frame: pd.DataFrame, period: str, window: int) -> list:
+    # 期間ごとの練習回数・練習日数・練習時間と、直近 window 期間の移動平均
+    records = _records(frame)
+    if records.empty:
+        return []
+
+    volumes = pd.DataFrame({
+        "records": _resample(records, period)["record_id"].count(),
+        "practice_days": _resample(records.drop_duplicates("date"), period)["record_id"].count(),
+        "total_minutes": _resample(records, period)["duration_minutes"].sum(),
+    }).fillna(0)
+    rolling = volumes.rolling(window, min_periods=1).mean()
+
+    return [
+        {
+            period: _day(start),
+            "records": int(records_count),
+            "practice_days": int(practice_days),
+            "total_minutes": int(total_minutes),
+            "rolling_records": round(float(rolling_records), 2),
+            "rolling_minutes": round(float(rolling_minutes), 1),
+        }
+        for start, records_count, practice_days, total_minutes, rolling_records, rolling_minutes in zip(
+            volumes.index, volumes["records"], volumes["practice_days"], volumes["total_minutes"],
+            rolling["records"], rolling["total_minutes"]
+        )
+    ]
+
+def streaks_from_frame(frame: pd.DataFrame, today: datetime.date) -> dict:
+    # 連続して練習した日数（現在の連続記録と最長記録）
+    days = np.unique(frame["date"].to_numpy(dtype="datetime64[D]"))
+    if len(days) == 0:
+        return {"practice_days": 0, "current": None, "longest": None}
+
+    # 前日から続いていない日で区切り、区間ごとの日数を数える
+    breaks = np.flatnonzero(np.diff(days) != np.timedelta64(1, "D")) + 1
+    starts = np.concatenate(([0], breaks))
+    lengths = np.diff(np.concatenate((starts, [len(days)])))
+
+    def streak(index: int) -> dict:
+        start = days[starts[index]]
+        return {"days": int(lengths[index]), "start": _day(start), "end": _day(start + np.timedelta64(int(lengths[index]) - 1, "D"))}
+
+    # 最後の練習日が今日か昨日なら、最後の区間が現在の連続記録
+    last_day = days[-1]
+    is_current = last_day >= np.datetime64(today - datetime.timedelta(days=1), "D")
+
+    return {
+        "practice_days": int(len(days)),
+        "current": streak(len(starts) - 1) if is_current else None,
+        "longest": streak(int(lengths.argmax())),
+    }
+
+def tag_trend_from_frame(frame: pd.DataFrame, top: int) -> dict:
+    # よく使うタグ top 件について、月ごとの使用回数（レコード数）と傾き（1か月あたりの増減）
+    tagged = frame.dropna(subset=["tag"]).drop_duplicates(["record_id", "tag"])
+    if tagged.empty:
+        return {"periods": [], "tags": []}
+
+    top_tags = tagged["tag"].value_counts().head(top).index
+    tagged = tagged[tagged["tag"].isin(top_tags)]
+
+    # 月 x タグ の件数表（使われなかった月も0件として含める）
+    months = tagged["date"].dt.to_period("M")
+    counts = pd.crosstab(months, tagged["tag"])
+    counts = counts.reindex(pd.period_range(months.min(), months.max(), freq="M"), fill_value=0)[top_tags]
+
+    # 全タグの傾きを1回の最小二乗法で求める
+    if len(counts) > 1:
+        slopes = np.polyfit(np.arange(len(counts)), counts.to_numpy(dtype=float), 1)[0]
+    else:
+        slopes = np.zeros(len(top_tags))
+
+    return {
+        "periods": [str(month) for month in counts.index],
+        "tags": [
+            {"tag": tag, "total": int(counts[tag].sum()), "counts": counts[tag].astype(int).tolist(), "slope": round(float(slope), 3)}
+            for tag, slope in zip(top_tags, slopes)
+        ],
+    }
+
+def content_time_from_frame(frame: pd.DataFrame) -> list:
+    # 練習内容ごとの練習時間の分布（その内容を含むレコードの練習時間）
+    per_content = frame.dropna(subset=["content", "duration_minutes"]).drop_duplicates(["record_id", "content"])
+    if per_content.empty:
+        return []
+
+    minutes = per_content.groupby("content")["duration_minutes"]
+    stats = pd.DataFrame({
+        "records": minutes.count(),
+        "total_minutes": minutes.sum(),
+        "mean_minutes": minutes.mean(),
+        "p25_minutes": minutes.quantile(0.25),
+        "median_minutes": minutes.median(),
+        "p75_minutes": minutes.quantile(0.75),
+        "p90_minutes": minutes.quantile(0.90),
+        "max_minutes": minutes.max(),
+    }).sort_values(["total_minutes", "records"], ascending=False)
+
+    return [
+        {
+            "content": content,
+            "records": int(row["records"]),
+            "total_minutes": int(row["total_minutes"]),
+            **{column: round(float(row[column]), 1) for column in stats.columns[2:]},
+        }
+        for content, row in stats.iterrows()
+    ]
+
+def volume(db: Session, user_id: str, period: str, window: int, start_date: Optional[datetime.date], end_date: Optional[datetime.date]) -> list:
+    return volume_from_frame(load_frame(db, user_id, start_date, end_date), period, window)
+
+def streaks(db: Session, user_id: str, today: Optional[datetime.date] = None) -> dict:
+    return streaks_from_frame(load_frame(db, user_id), today or datetime.date.today())
+
+def tag_trend(db: Session, user_id: str, top: int, start_date: Optional[datetime.date], end_date: Optional[datetime.date]) -> dict:
+    return tag_trend_from_frame(load_frame(db, user_id, start_date, end_date), top)
+
+def content_time(db: Session, user_id: str, start_date: Optional[datetime.date], end_date: Optional[datetime.date]) -> list:
+    return content_time_from_frame(load_frame(db, user_id, start_date, end_date))
@@ -0,0 +1,121 @@
+from collections import Counter
+from sqlalchemy import delete, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from models import UserTagUsage, UserContentUsage
+from typing import Iterable, Optional, Tuple
+
+# user_tag_usage / user_content_usage の保守
+# rollup.py と同じく、書き込み処理は変更前後の件数を数え、その差分だけを1文ずつで反映する
+# キーは ("tag", userId, tag_id) または ("content", userId, content)
+
+UsageKey = Tuple[str, str, object]
+
+# 生データからの集計。records_filter（AND から始まる条件）で対象のレコードを絞り込める
+RAW_USAGE_SELECT = {
+    "tag": """
+SELECT coalesce(r."userId", '') AS "userId", pta.tag_id AS term, count(*) AS count
+FROM records r
+JOIN practice_details pd ON pd."recordId" = r.id
+JOIN practice_tag_association pta ON pta.practice_detail_id = pd.id
+WHERE true {records_filter}
+GROUP BY 1, 2
+""",
+    "content": """
+SELECT coalesce(r."userId", '') AS "userId", pd.content AS term, count(*) AS count
+FROM records r
+JOIN practice_details pd ON pd."recordId" = r.id
+WHERE pd.content IS NOT NULL {records_filter}
+GROUP BY 1, 2
+""",
+}
+
+TABLES = {"tag": UserTagUsage, "content": UserContentUsage}
+
+def _term_column(kind: str):
+    return UserTagUsage.tag_id if kind == "tag" else UserContentUsage.content
+
+def usage_keys(user_id: Optional[str], details: Iterable[Tuple[str, Iterable[int]]]) -> Counter:
+    # 1件のレコードが使用回数に寄与する件数。details は (content, tag_ids) の組
+    keys = Counter()
+    for content, tag_ids in details:
+        if content is not None:
+            keys[("content", user_id or "", content)] += 1
+        for tag_id in set(tag_ids):
+            keys[("tag", user_id or "", tag_id)] += 1
+    return keys
+
+def apply_usage_delta(db: Session, before: Counter, after: Counter):
+    delta = Counter(after)
+    delta.subtract(before)
+    for kind, table in TABLES.items():
+        term = _term_column(kind)
+        rows = [
+            {"userId": user_id, term.key: value, "count": count}
+            for (key_kind, user_id, value), count in sorted(delta.items())
+            if key_kind == kind and count != 0
+        ]
+        if not rows:
+            continue
+
+        # キー順に並べて更新し、同時に書き込むリクエスト間のデッドロックを防ぐ
+        statement = pg_insert(table).values(rows)
+        db.execute(
+            statement.on_conflict_do_update(
+                index_elements=[table.userId, term],
+                set_={"count": table.count + statement.excluded.count}
+            )
+        )
+
+        # 件数が0になった行は削除する
+        if any(row["count"] < 0 for row in rows):
+            db.execute(
+                delete(table).where(table.count <= 0, table.userId.in_({row["userId"] for row in rows}))
+            )
+
+def add_records_sql(db: Session, record_ids_sql: str):
+    # 一括取り込み用: record_ids_sql（レコードIDを返すSQL）のレコードを使用回数に加える
+    for kind, table in TABLES.items():
+        term = _term_column(kind).key
+        db.execute(text(f"""
+            INSERT INTO {table.__tablename__} ("userId", {term}, count)
+            SELECT * FROM ({RAW_USAGE_SELECT[kind].format(records_filter=f"AND r.id IN ({record_ids_sql})")}) delta
+            ORDER BY 1, 2
+            ON CONFLICT ("userId", {term}) DO UPDATE SET count = {table.__tablename__}.count + excluded.count
+        """))
+
+def rebuild(db: Session) -> int:
+    # 使用回数のテーブルを生データから作り直す（rollup.rebuild と同じく、作り直し中も読み取りは可能）
+    total = 0
+    for kind, table in TABLES.items():
+        db.execute(text(f"LOCK TABLE {table.__tablename__} IN EXCLUSIVE MODE"))
+        db.execute(text(f"DELETE FROM {table.__tablename__}"))
+        result = db.execute(text(f"""
+            INSERT INTO {table.__tablename__} ("userId", {_term_column(kind).key}, count)
+            {RAW_USAGE_SELECT[kind].format(records_filter="")}
+        """))
+        total += result.rowcount
+    db.commit()
+    return total
+
+def find_inconsistencies(db: Session, limit: int = 100) -> list:
+    # 使用回数のテーブルと生データの集計を突き合わせ、件数が異なるキーを返す
+    found = []
+    for kind, table in TABLES.items():
+        term = _term_column(kind).key
+        rows = db.execute(text(f"""
+            SELECT coalesce(raw."userId", stored."userId"), coalesce(raw.term, stored.{term}),
+                   coalesce(raw.count, 0), coalesce(stored.count, 0)
+            FROM ({RAW_USAGE_SELECT[kind].format(records_filter="")}) raw
+            FULL OUTER JOIN {table.__tablename__} stored
+              ON stored."userId" = raw."userId" AND stored.{term} = raw.term
+            WHERE coalesce(raw.count, 0) <> coalesce(stored.count, 0)
+            LIMIT :limit
+        """), {"limit": limit - len(found)})
+        found.extend(
+            {"kind": kind, "userId": user_id, "term": value, "raw": raw, "usage": stored}
+            for user_id, value, raw, stored in rows
+        )
+        if len(found) >= limit:
+            break
+    return found
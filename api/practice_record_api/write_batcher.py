@@ -0,0 +1,140 @@
+from collections import deque
+from database import run_db, write_session
+from schemas import CreateRecordModel
+from typing import Deque, List, Optional, Tuple
+import asyncio
+import logging
+import os
+import crud
+import metrics
+
+# POST /records/ の書き込みをまとめて1トランザクションでコミットする（グループコミット）
+# 届いたペイロードを、最初の1件から WRITE_BATCH_MAX_DELAY_MS ミリ秒経つか WRITE_BATCH_MAX_SIZE 件になるまで溜め、
+# crud.create_records でまとめて書き込んでから、待っている各リクエストに自分のレコードIDを返す
+# まとめた書き込みが失敗した場合は1件ずつ別のトランザクションで書き込み直し、失敗したリクエストだけにエラーを返す
+# 書き込みは1つずつ順に行う。書き込み中に届いたペイロードは次のまとまりになるので、混んでいるほどまとまりが大きくなる
+# 前回のまとまりが1件だけだった（同時に書き込むリクエストがない）場合は待たずに書き込むので、空いているときの遅延は増えない
+#
+# WRITE_BATCHING: 1 で有効（既定は無効。リクエストごとに書き込んでコミットする）
+# WRITE_BATCH_MAX_SIZE: 1回の書き込みにまとめる最大件数
+# WRITE_BATCH_MAX_DELAY_MS: 最初の1件を受け取ってから書き込みを始めるまでの最大の待ち時間（ミリ秒）
+WRITE_BATCHING = os.getenv("WRITE_BATCHING", "0") == "1"
+WRITE_BATCH_MAX_SIZE = int(os.getenv("WRITE_BATCH_MAX_SIZE", "64"))
+WRITE_BATCH_MAX_DELAY_MS = float(os.getenv("WRITE_BATCH_MAX_DELAY_MS", "2"))
+
+logger = logging.getLogger("practice_record_api.write_batcher")
+
+batch_sizes = metrics.register(metrics.Histogram(
+    "write_batch_size", "Records written per group commit.", buckets=metrics.COUNT_BUCKETS
+))
+
+# batches: まとめて書き込んだ回数 / retried: 失敗して1件ずつ書き込み直した回数 / failed: エラーを返したリクエスト
+events = {"batches": 0, "retried": 0, "failed": 0}
+
+metrics.register(metrics.Gauge(
+    "write_batcher_events_total", "Group commit batches written, retried one by one, and requests failed.", ("event",),
+    lambda: {(event,): count for event, count in events.items()}, "counter"
+))
+
+Pending = Tuple[CreateRecordModel, asyncio.Future]
+
+class WriteBatcher:
+    def __init__(self, max_size: int = WRITE_BATCH_MAX_SIZE, max_delay_ms: float = WRITE_BATCH_MAX_DELAY_MS):
+        self.max_size = max_size
+        self.max_delay = max_delay_ms / 1000
+        self._pending: Deque[Pending] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._closing = False
+        self._last_size = 1
+
+    def _ensure_worker(self):
+        # 書き込みタスクは実行中のイベントループで起動する（ループが変わった場合は作り直す）
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._worker.get_loop() is not loop:
+            self._pending = deque()
+            self._wakeup = asyncio.Event()
+            self._closing = False
+            self._worker = loop.create_task(self._run())
+
+    async def submit(self, record_data: CreateRecordModel) -> int:
+        # 書き込まれたレコードのIDを返す（書き込みに失敗した場合はその例外を送出する）
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((record_data, future))
+        self._wakeup.set()
+        return await future
+
+    async def close(self):
+        # 溜まっているペイロードを書き込んでから書き込みタスクを終了する
+        if self._worker is None or self._worker.done() or self._worker.get_loop() is not asyncio.get_running_loop():
+            return
+        self._closing = True
+        self._wakeup.set()
+        await self._worker
+
+    async def _wait(self, timeout: Optional[float]) -> bool:
+        # 新しいペイロードが届くか終了が指示されるまで待つ（timeout 秒経ったら False）
+        # asyncio.wait_for で Queue.get を待つと、タイムアウトと同時に届いた要素を取りこぼすことがあるため Event で待つ
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            while not self._pending:
+                if self._closing:
+                    return
+                await self._wait(None)
+
+            # 最初の1件から max_delay 経つか max_size 件になるまで溜める（前回が1件だけだった場合と終了時は待たない）
+            deadline = loop.time() + self.max_delay
+            while len(self._pending) < self.max_size and self._last_size > 1 and not self._closing:
+                timeout = deadline - loop.time()
+                if timeout <= 0 or not await self._wait(timeout):
+                    break
+
+            batch = [self._pending.popleft() for _ in range(min(self.max_size, len(self._pending)))]
+            self._last_size = len(batch)
+            await self._write(batch)
+
+    async def _write(self, batch: List[Pending]):
+        # 書き込み前に切断されたリクエストのペイロードは書き込まない
+        batch = [(record_data, future) for record_data, future in batch if not future.done()]
+        if not batch:
+            return
+
+        batch_sizes.observe(len(batch))
+        events["batches"] += 1
+        try:
+            async with write_session() as db:
+                record_ids = await run_db(db, crud.create_records, [record_data for record_data, _ in batch])
+        except Exception:
+            logger.warning("group commit of %d record(s) failed, writing them one by one", len(batch), exc_info=True)
+            events["retried"] += 1
+            await self._write_each(batch)
+            return
+
+        for (_, future), record_id in zip(batch, record_ids):
+            if not future.done():
+                future.set_result(record_id)
+
+    async def _write_each(self, batch: List[Pending]):
+        # 1件ずつ別のトランザクションで書き込み、失敗したペイロードのリクエストにだけ例外を返す
+        for record_data, future in batch:
+            try:
+                async with write_session() as db:
+                    record_id = await run_db(db, crud.create_record, record_data)
+            except Exception as e:
+                events["failed"] += 1
+                if not future.done():
+                    future.set_exception(e)
+                continue
+            if not future.done():
+                future.set_result(record_id)
+
+batcher = WriteBatcher() if WRITE_BATCHING else None